@@ -0,0 +1,300 @@
+"""
+Brain Capital - Pre-armed Account Readiness
+
+Keeps a "ready to trade" record per slave account between signals so that at
+signal time each account only has to compute its quantity and send the order.
+
+Each record holds:
+- free margin (USDT)
+- open symbols (Binance format, e.g. BTCUSDT)
+- leverage already applied per symbol
+- whether the exchange markets are loaded
+
+Refresh sources:
+1. Low-frequency polling of every account (READINESS_REFRESH_INTERVAL, default 30s);
+   records older than READINESS_MAX_AGE (default 45s) are not used
+2. Reservation when an order is submitted: the symbol is marked open and its
+   margin taken off free margin in place, so a back-to-back signal already
+   holding the record sizes against what is left (released if the order fails)
+3. Incremental refresh of a single account right after it traded
+   (its record is invalidated, so later signals re-arm from the exchange)
+
+A record only ever says a symbol is open from its last poll, so the trade
+paths confirm "already open" live before skipping (a TP/SL may have closed it).
+
+Accounts whose record says they cannot trade (auth failure, insufficient
+balance) are excluded before fan-out instead of failing during it. Accounts
+without a fresh record are passed through and discover their state live.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("AccountReadiness")
+
+READINESS_REFRESH_INTERVAL = int(os.environ.get('READINESS_REFRESH_INTERVAL', '30'))
+READINESS_MAX_AGE = int(os.environ.get('READINESS_MAX_AGE', '45'))
+READINESS_CONCURRENCY = int(os.environ.get('READINESS_CONCURRENCY', '20'))
+
+REASON_AUTH = 'auth_failed'
+REASON_BALANCE = 'insufficient_balance'
+
+# Binance API key errors: invalid key / permissions / IP restriction
+_BINANCE_AUTH_CODES = (-2008, -2014, -2015)
+
+
+@dataclass
+class AccountReadiness:
+    """Pre-armed trading state of one exchange account"""
+    user_id: object
+    exchange: str
+    ready: bool = False
+    reason: Optional[str] = None
+    free_margin: float = 0.0
+    open_symbols: Set[str] = field(default_factory=set)
+    leverage: Dict[str, int] = field(default_factory=dict)
+    markets_loaded: bool = False
+    updated_at: float = 0.0
+
+    def is_fresh(self, max_age: float = None) -> bool:
+        return time.time() - self.updated_at <= (max_age or READINESS_MAX_AGE)
+
+    def reserve(self, symbol: str, margin: float):
+        """Count an order being submitted against this record."""
+        self.open_symbols.add(symbol)
+        self.free_margin = max(0.0, self.free_margin - margin)
+
+    def release(self, symbol: str, margin: float):
+        """Undo reserve() for an order that was not placed."""
+        self.open_symbols.discard(symbol)
+        self.free_margin += margin
+
+
+@contextmanager
+def reservation(state: Optional[AccountReadiness], symbol: str, margin: float):
+    """Reserve symbol and margin on a pre-armed record around order submission."""
+    if state is None:
+        yield
+        return
+    state.reserve(symbol, margin)
+    try:
+        yield
+    except BaseException:
+        state.release(symbol, margin)
+        raise
+
+
+def global_open_count(client_data: dict) -> Optional[int]:
+    """Open positions across all of the user's accounts, including reserved orders."""
+    peers = client_data.get('readiness_peers')
+    if peers:
+        return sum(len(s.open_symbols) for s in peers)
+    return client_data.get('global_open_count')
+
+
+def account_key(client_data: dict) -> Tuple[object, object]:
+    """Stable key for an exchange account (user id + UserExchange id)."""
+    return (client_data.get('id'), client_data.get('exchange_id') or client_data.get('exchange_type') or 'binance')
+
+
+def _is_auth_error(exc: Exception) -> bool:
+    try:
+        import ccxt
+        if isinstance(exc, (ccxt.AuthenticationError, ccxt.PermissionDenied)):
+            return True
+    except ImportError:
+        pass
+    return getattr(exc, 'code', None) in _BINANCE_AUTH_CODES
+
+
+class AccountReadinessService:
+    """
+    Background pre-arming of slave accounts.
+
+    Usage (worker):
+        engine.readiness = AccountReadinessService(engine)
+        await engine.readiness.start()
+    """
+
+    def __init__(self, engine, interval: int = None, max_age: int = None, concurrency: int = None):
+        self.engine = engine
+        self.interval = interval or READINESS_REFRESH_INTERVAL
+        self.max_age = max_age or READINESS_MAX_AGE
+        self._semaphore = asyncio.Semaphore(concurrency or READINESS_CONCURRENCY)
+        self.states: Dict[Tuple[object, object], AccountReadiness] = {}
+        self._pending_refresh: Set[Tuple[object, object]] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+    # ==================== READ ====================
+
+    def get(self, client_data: dict) -> Optional[AccountReadiness]:
+        """Fresh readiness record for an account, or None."""
+        state = self.states.get(account_key(client_data))
+        if state and state.is_fresh(self.max_age):
+            return state
+        return None
+
+    def partition(self, accounts: List[dict]) -> Tuple[List[dict], List[Tuple[dict, str]]]:
+        """
+        Split accounts into (tradeable, excluded) before fan-out.
+
+        Tradeable accounts get their record attached as 'readiness' and, when
+        every account of the user has a fresh record, 'global_open_count' and
+        'readiness_peers' (the user's records, read again at trade time).
+        """
+        tradeable, excluded = [], []
+        by_user: Dict[object, List[dict]] = {}
+        for account in accounts:
+            state = self.get(account)
+            if state and not state.ready:
+                excluded.append((account, state.reason))
+                continue
+            account['readiness'] = state
+            tradeable.append(account)
+            by_user.setdefault(account['id'], []).append(account)
+
+        for user_accounts in by_user.values():
+            states = [a['readiness'] for a in user_accounts]
+            if all(states):
+                open_count = sum(len(s.open_symbols) for s in states)
+                for account in user_accounts:
+                    account['global_open_count'] = open_count
+                    account['readiness_peers'] = states
+        return tradeable, excluded
+
+    # ==================== INCREMENTAL UPDATES ====================
+
+    def invalidate(self, client_data: dict):
+        """Drop an account's record (it just traded) and re-arm it in the background."""
+        key = account_key(client_data)
+        self.states.pop(key, None)
+        if not self._running or key in self._pending_refresh:
+            return
+        self._pending_refresh.add(key)
+
+        async def _rearm():
+            try:
+                await self.refresh_account(client_data)
+            finally:
+                self._pending_refresh.discard(key)
+
+        asyncio.ensure_future(_rearm())
+
+    # ==================== REFRESH ====================
+
+    async def refresh_account(self, client_data: dict) -> Optional[AccountReadiness]:
+        """Poll one account and store its readiness record."""
+        key = account_key(client_data)
+        state = AccountReadiness(user_id=client_data.get('id'),
+                                 exchange=client_data.get('exchange_type') or 'binance')
+        async with self._semaphore:
+            try:
+                if client_data.get('is_ccxt') and client_data.get('is_async'):
+                    await self._arm_ccxt(client_data, state)
+                elif not client_data.get('is_ccxt'):
+                    await asyncio.to_thread(self._arm_binance, client_data, state)
+                else:
+                    return None  # Legacy sync CCXT - discovered live at signal time
+            except Exception as e:
+                if _is_auth_error(e):
+                    state.ready, state.reason = False, REASON_AUTH
+                    state.updated_at = time.time()
+                    self.states[key] = state
+                    logger.warning(f"🔒 [{client_data.get('fullname', key)}] not ready: {e}")
+                    return state
+                # Transient failure: let the previous record age out, signal path falls back to live checks
+                logger.debug(f"Readiness refresh failed for {key}: {e}")
+                return None
+
+        min_balance = self.engine.get_min_balance_required()
+        if state.free_margin <= 0 or (min_balance > 0 and state.free_margin < min_balance):
+            state.ready, state.reason = False, REASON_BALANCE
+        else:
+            state.ready, state.reason = True, None
+        state.updated_at = time.time()
+        self.states[key] = state
+        return state
+
+    def _arm_binance(self, client_data: dict, state: AccountReadiness):
+        client = client_data['client']
+        for b in client.futures_account_balance():
+            if b['asset'] == 'USDT':
+                state.free_margin = float(b.get('availableBalance', b.get('withdrawAvailable', b['balance'])))
+                break
+        for p in client.futures_position_information():
+            if float(p.get('positionAmt', 0)) != 0:
+                state.open_symbols.add(p['symbol'])
+            if p.get('leverage'):
+                state.leverage[p['symbol']] = int(float(p['leverage']))
+        state.markets_loaded = True
+
+    async def _arm_ccxt(self, client_data: dict, state: AccountReadiness):
+        exchange = client_data['client']
+        exchange_type = client_data.get('exchange_type') or client_data.get('exchange_name', 'Unknown')
+        if not getattr(exchange, 'markets', None):
+            await exchange.load_markets()
+        self.engine.symbols.ensure_ccxt_markets(exchange_type, exchange)
+        state.markets_loaded = True
+
+        balance = await exchange.fetch_balance()
+        for asset in ('USDT', 'USD'):
+            free = (balance.get('free') or {}).get(asset) or (balance.get('total') or {}).get(asset)
+            if free:
+                state.free_margin = float(free)
+                break
+
+        for pos in await self.engine._fetch_ccxt_positions(exchange, exchange_type):
+            if pos.get('contracts') and float(pos['contracts']) != 0:
+                symbol = self.engine.symbols.from_ccxt(exchange_type, pos.get('symbol', ''))
+                state.open_symbols.add(symbol)
+                if pos.get('leverage'):
+                    state.leverage[symbol] = int(float(pos['leverage']))
+
+    async def refresh_all(self):
+        """Re-arm every loaded slave account (drops records of accounts no longer loaded)."""
+        async with self.engine._async_lock:
+            accounts = list(self.engine.slave_clients)
+        live_keys = {account_key(a) for a in accounts}
+        for key in [k for k in self.states if k not in live_keys]:
+            self.states.pop(key, None)
+
+        started = time.time()
+        results = await asyncio.gather(*(self.refresh_account(a) for a in accounts), return_exceptions=True)
+        ready = sum(1 for r in results if isinstance(r, AccountReadiness) and r.ready)
+        not_ready = sum(1 for r in results if isinstance(r, AccountReadiness) and not r.ready)
+        logger.info(f"🎯 Pre-armed {len(accounts)} accounts in {time.time() - started:.1f}s: "
+                    f"{ready} ready, {not_ready} not ready, {len(accounts) - ready - not_ready} unknown")
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _loop(self):
+        while self._running:
+            try:
+                await self.refresh_all()
+                await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(f"Readiness refresh loop error: {e}")
+                await asyncio.sleep(self.interval)
@@ -26,17 +26,28 @@ from webauthn.helpers.structs import (
 from webauthn.helpers.base64url_to_bytes import base64url_to_bytes
 from webauthn.helpers.bytes_to_base64url import bytes_to_base64url
 from config import Config, ARQ_REDIS_SETTINGS
-from models import db, User, TradeHistory, BalanceHistory, Message, PasswordResetToken, UserExchange, ExchangeConfig, Payment, Strategy, StrategySubscription, ChatMessage, ChatBan, SystemStats, UserLevel, UserAchievement, ApiKey, UserConsent, WebAuthnCredential, PushSubscription, ReferralCommission, ReferralClick, PayoutRequest, TaskParticipation
+from models import db, chat_ban_table, User, TradeHistory, DailyTradeRollup, BalanceHistory, BalanceHistoryRollup, Message, PasswordResetToken, UserExchange, ExchangeConfig, Payment, Strategy, StrategySubscription, ChatMessage, ChatBan, SystemStats, UserLevel, UserAchievement, ApiKey, UserConsent, WebAuthnCredential, PushSubscription, ReferralCommission, ReferralClick, PayoutRequest, TaskParticipation
 from sqlalchemy import text, inspect
 from trading_engine import TradingEngine
+from sharding import get_live_shards, get_signal_status, register_signal_broadcast, shard_queue_name
+from signal_dispatch import signal_lane, lane_defer_by, claim_signal, record_claimed_job, release_claim, enqueue_arq_job
+from symbol_registry import get_symbol_registry, normalize_symbol
+from event_bus import SOCKETIO_CHANNEL
+from balance_refresher import ExchangeBalanceRefresher
+from cache_layer import TwoTierCache, CachedPayload
+from chat_store import init_chat_store, mask_username
+from compliance import check_tos_consent, remember_tos_consent, forget_tos_consent
+import fast_json
+from balance_monitor import positions_version
 from telegram_notifier import init_notifier, get_notifier, init_email_sender, get_email_sender
 from telegram_bot import init_telegram_bot, get_telegram_bot
-from metrics import get_metrics, init_flask_metrics, set_app_info
+from metrics import get_metrics, init_flask_metrics, set_app_info, record_signal_coalesced
 from security import (
     login_tracker, login_limiter, api_limiter, webhook_limiter,
     InputValidator, add_security_headers, get_client_ip,
     init_session_security, verify_session, generate_csrf_token,
-    verify_csrf_token, audit, rate_limit, validate_webhook, validate_json_payload, is_safe_redirect_url
+    verify_csrf_token, audit, rate_limit, validate_webhook, validate_json_payload, is_safe_redirect_url,
+    parse_webhook_request
 )
 import asyncio
 import threading
@@ -51,6 +62,7 @@ import os
 import sys
 import json
 import secrets
+import uuid
 from http.client import RemoteDisconnected
 import urllib3.exceptions
 
@@ -267,14 +279,19 @@ SOCKETIO_ALLOWED_ORIGINS = [
     if not (origin in _seen_origins or _seen_origins.add(origin))
 ]
 
+# With Redis, every gunicorn worker subscribes to the Socket.IO message queue, so
+# events emitted by any worker or by the ARQ worker (event_bus) reach all dashboards.
 socketio = SocketIO(
     app, 
     async_mode='eventlet',  # MUST match gunicorn --worker-class eventlet
+    message_queue=app.config.get('REDIS_URL') or None,
+    channel=SOCKETIO_CHANNEL,
     ping_timeout=60,
     ping_interval=25,  # Keep connections alive
     cors_allowed_origins=SOCKETIO_ALLOWED_ORIGINS,
     cookie='io',  # Fixed: must be string cookie name, not boolean
     manage_session=False,
+    json=fast_json.SocketIOJSON,  # orjson-backed packet encoding
     logger=False,  # Reduce logging overhead
     engineio_logger=False
 )
@@ -413,6 +430,8 @@ else:
 
 # Initialize Trading Engine
 # Disable position monitor in web app to avoid duplicate close records across processes.
+# Slave balances are refreshed by the ARQ worker (one lease holder per shard); web workers
+# only read its cached states and publish dashboard activity.
 engine = TradingEngine(app, socketio, telegram, enable_position_monitor=False)
 
 # ==================== TELEGRAM BOT (REMOVED FROM WEB SERVER) ====================
@@ -498,77 +517,126 @@ def safe_emit(event, *args, **kwargs):
 engine.log_error_callback = log_system_event
 
 
-_balance_cache = {}
-_balance_cache_lock = threading.Lock()
-_balance_cache_inflight = set()
 _balance_cache_ttl = int(os.environ.get('BALANCE_CACHE_TTL', '60'))
+_admin_stats_ttl = int(os.environ.get('ADMIN_STATS_CACHE_TTL', '30'))
+_public_stats_ttl = int(os.environ.get('PUBLIC_STATS_CACHE_TTL', '60'))
+
+# Two-tier caches (process LRU over Redis); balances are written by the balance refresher
+balance_cache = TwoTierCache('balances', redis_client, ttl=_balance_cache_ttl)
+# Chat history, batched message inserts and presence live in Redis (chat_store.py)
+chat_store = init_chat_store(redis_client, app.app_context)
+# Ban/mute checks read a cached table; admin changes reach every worker via pub/sub
+chat_ban_table.attach_redis(redis_client)
+
+# Stats caches hold pre-serialized JSON bodies, served as-is by cached_json_response
+admin_stats_cache = TwoTierCache('admin_stats', redis_client, ttl=_admin_stats_ttl,
+                                 context_factory=app.app_context, serialized=True)
+public_stats_cache = TwoTierCache('public_stats', redis_client, ttl=_public_stats_ttl,
+                                  context_factory=app.app_context, serialized=True)
+
+
+# Incrementally maintained balance aggregate for admin pages:
+# user_balance_rank (ZSET user_id -> total) and user_balance_sum (running sum of the ZSET).
+# Only non-admin users are ranked; deleted users are removed with their balance.
+BALANCE_RANK_KEY = 'user_balance_rank'
+BALANCE_SUM_KEY = 'user_balance_sum'
+ADMIN_IDS_TTL = 300
+_UPDATE_BALANCE_AGGREGATE = """
+local old = redis.call('zscore', KEYS[1], ARGV[1])
+redis.call('zadd', KEYS[1], ARGV[2], ARGV[1])
+return redis.call('incrbyfloat', KEYS[2], tonumber(ARGV[2]) - tonumber(old or 0))
+"""
+_REMOVE_BALANCE_AGGREGATE = """
+local old = redis.call('zscore', KEYS[1], ARGV[1])
+if not old then
+    return 0
+end
+redis.call('zrem', KEYS[1], ARGV[1])
+return redis.call('incrbyfloat', KEYS[2], -tonumber(old))
+"""
+_admin_ids = {'ids': frozenset(), 'loaded_at': 0.0}
 
 
-def _get_json_cache_from_redis(cache_key: str):
-    """Fetch JSON cache from Redis if available."""
+def _admin_user_ids() -> frozenset:
+    """Ids of admin users (reloaded every ADMIN_IDS_TTL seconds)."""
+    if time.time() - _admin_ids['loaded_at'] > ADMIN_IDS_TTL:
+        with app.app_context():
+            ids = frozenset(uid for uid, in db.session.query(User.id).filter(User.role == 'admin'))
+        _admin_ids.update(ids=ids, loaded_at=time.time())
+    return _admin_ids['ids']
+
+
+def _update_balance_aggregate(user_id: int, total: float) -> None:
+    """Apply one user's new total to the rank ZSET and running sum (atomic, O(log n))."""
     if not redis_client:
-        return None
+        return
+    if user_id in _admin_user_ids():
+        remove_balance_aggregate(user_id)
+        return
     try:
-        cached = redis_client.get(cache_key)
-        if not cached:
-            return None
-        return json.loads(cached)
+        redis_client.eval(_UPDATE_BALANCE_AGGREGATE, 2, BALANCE_RANK_KEY, BALANCE_SUM_KEY,
+                          user_id, float(total or 0.0))
     except Exception as e:
-        logger.debug(f"Redis cache read failed for {cache_key}: {e}")
-        return None
+        logger.debug(f"Balance aggregate update failed for {user_id}: {e}")
 
 
-def _set_json_cache_to_redis(cache_key: str, data: dict, ttl_seconds: int) -> None:
-    """Store JSON cache in Redis if available."""
+def remove_balance_aggregate(user_id: int) -> None:
+    """Drop a user from the rank ZSET and subtract their total from the running sum."""
     if not redis_client:
         return
     try:
-        redis_client.setex(cache_key, ttl_seconds, json.dumps(data))
+        redis_client.eval(_REMOVE_BALANCE_AGGREGATE, 2, BALANCE_RANK_KEY, BALANCE_SUM_KEY, user_id)
     except Exception as e:
-        logger.debug(f"Redis cache write failed for {cache_key}: {e}")
-
+        logger.debug(f"Balance aggregate removal failed for {user_id}: {e}")
 
-def _get_balance_cache_from_redis(user_id: int):
-    """Fetch balance cache from Redis if available."""
-    key = f"user_balance:{user_id}"
-    return _get_json_cache_from_redis(key)
 
-
-def _set_balance_cache_to_redis(user_id: int, data: dict) -> None:
-    """Store balance cache in Redis if available."""
-    key = f"user_balance:{user_id}"
-    _set_json_cache_to_redis(key, data, _balance_cache_ttl)
+def get_balance_aggregate() -> dict:
+    """Sum of all known user balances and how many users it covers."""
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline()
+            pipe.get(BALANCE_SUM_KEY)
+            pipe.zcard(BALANCE_RANK_KEY)
+            total, count = pipe.execute()
+            return {'total_balance': round(float(total or 0.0), 2), 'users_with_balance': int(count or 0)}
+        except Exception as e:
+            logger.debug(f"Balance aggregate read failed: {e}")
+    admin_ids = _admin_user_ids()
+    totals = [float(data.get('total') or 0.0) for uid, data in balance_cache.local_items()
+              if int(uid) not in admin_ids]
+    return {'total_balance': round(sum(totals), 2), 'users_with_balance': len(totals)}
 
 
-_admin_stats_cache = {}
-_admin_stats_lock = threading.Lock()
-_admin_stats_inflight = set()
-_admin_stats_ttl = int(os.environ.get('ADMIN_STATS_CACHE_TTL', '30'))
-_public_stats_cache = {}
-_public_stats_lock = threading.Lock()
-_public_stats_inflight = set()
-_public_stats_ttl = int(os.environ.get('PUBLIC_STATS_CACHE_TTL', '60'))
+def get_user_ids_by_balance(offset: int, limit: int) -> list:
+    """User ids with a known balance, highest first (one ZREVRANGE)."""
+    if redis_client:
+        try:
+            return [int(uid) for uid in redis_client.zrevrange(BALANCE_RANK_KEY, offset, offset + limit - 1)]
+        except Exception as e:
+            logger.debug(f"Balance rank read failed: {e}")
+    admin_ids = _admin_user_ids()
+    ranked = sorted((item for item in balance_cache.local_items() if int(item[0]) not in admin_ids),
+                    key=lambda item: item[1].get('total') or 0.0, reverse=True)
+    return [int(uid) for uid, _ in ranked[offset:offset + limit]]
 
 
-def _refresh_admin_stats_cache(cache_key: str, compute_fn) -> None:
-    """Refresh cached admin stats asynchronously."""
-    try:
-        with app.app_context():
-            data = compute_fn()
-        with _admin_stats_lock:
-            _admin_stats_cache[cache_key] = {
-                'data': data,
-                'ts': time.time()
-            }
-        _set_json_cache_to_redis(f"admin_stats:{cache_key}", data, _admin_stats_ttl)
-    finally:
-        with _admin_stats_lock:
-            _admin_stats_inflight.discard(cache_key)
+def get_user_exchange_balances_bulk(user_ids: list, refresh_missing: bool = True) -> dict:
+    """
+    Cached balances for many users: the local cache, then one MGET.
+    Never fetches synchronously; users without a cache entry are refreshed in background.
+    """
+    cached = balance_cache.get_many(user_ids)
+    result = {user_id: cached[str(user_id)] for user_id in user_ids if str(user_id) in cached}
+    if refresh_missing:
+        for user_id in user_ids:
+            if user_id not in result:
+                balance_refresher.request_refresh(user_id)
+    return result
 
 
-def get_admin_stats_cached(cache_key: str, compute_fn, allow_stale: bool = True, ttl: int = None) -> dict:
+def get_admin_stats_cached(cache_key: str, compute_fn, allow_stale: bool = True, ttl: int = None) -> CachedPayload:
     """
-    Get cached admin stats with async refresh.
+    Get cached admin stats (serialized JSON) with async refresh.
     
     Args:
         cache_key: Unique cache key
@@ -576,113 +644,129 @@ def get_admin_stats_cached(cache_key: str, compute_fn, allow_stale: bool = True,
         allow_stale: Return stale data while refreshing in background
         ttl: Optional TTL override in seconds
     """
-    now = time.time()
-    ttl = ttl if ttl is not None else _admin_stats_ttl
-
-    redis_cached = _get_json_cache_from_redis(f"admin_stats:{cache_key}")
-    if redis_cached:
-        return redis_cached
-    
-    with _admin_stats_lock:
-        cached = _admin_stats_cache.get(cache_key)
-    
-    if cached:
-        age = now - cached['ts']
-        if age <= ttl:
-            return cached['data']
-        if allow_stale:
-            with _admin_stats_lock:
-                if cache_key not in _admin_stats_inflight:
-                    _admin_stats_inflight.add(cache_key)
-                    threading.Thread(
-                        target=_refresh_admin_stats_cache,
-                        args=(cache_key, compute_fn),
-                        daemon=True
-                    ).start()
-            return cached['data']
-    
-    data = compute_fn()
-    with _admin_stats_lock:
-        _admin_stats_cache[cache_key] = {'data': data, 'ts': now}
-    _set_json_cache_to_redis(f"admin_stats:{cache_key}", data, ttl)
-    return data
-
+    return admin_stats_cache.get(cache_key, compute_fn, allow_stale=allow_stale, ttl=ttl)
 
-def _refresh_public_stats_cache(cache_key: str, compute_fn, ttl: int) -> None:
-    """Refresh cached public stats asynchronously."""
-    try:
-        with app.app_context():
-            data = compute_fn()
-        with _public_stats_lock:
-            _public_stats_cache[cache_key] = {
-                'data': data,
-                'ts': time.time()
-            }
-        _set_json_cache_to_redis(f"public_stats:{cache_key}", data, ttl)
-    finally:
-        with _public_stats_lock:
-            _public_stats_inflight.discard(cache_key)
 
-
-def get_public_stats_cached(cache_key: str, compute_fn, allow_stale: bool = True, ttl: int = None) -> dict:
+def get_public_stats_cached(cache_key: str, compute_fn, allow_stale: bool = True, ttl: int = None) -> CachedPayload:
     """
-    Get cached public stats with async refresh.
+    Get cached public stats (serialized JSON) with async refresh.
     """
-    now = time.time()
-    ttl = ttl if ttl is not None else _public_stats_ttl
-
-    redis_cached = _get_json_cache_from_redis(f"public_stats:{cache_key}")
-    if redis_cached:
-        return redis_cached
-
-    with _public_stats_lock:
-        cached = _public_stats_cache.get(cache_key)
-
-    if cached:
-        age = now - cached['ts']
-        if age <= ttl:
-            return cached['data']
-        if allow_stale:
-            with _public_stats_lock:
-                if cache_key not in _public_stats_inflight:
-                    _public_stats_inflight.add(cache_key)
-                    threading.Thread(
-                        target=_refresh_public_stats_cache,
-                        args=(cache_key, compute_fn, ttl),
-                        daemon=True
-                    ).start()
-            return cached['data']
-
-    data = compute_fn()
-    with _public_stats_lock:
-        _public_stats_cache[cache_key] = {'data': data, 'ts': now}
-    _set_json_cache_to_redis(f"public_stats:{cache_key}", data, ttl)
-    return data
+    return public_stats_cache.get(cache_key, compute_fn, allow_stale=allow_stale, ttl=ttl)
+
+
+def cached_json_response(payload: CachedPayload) -> Response:
+    """Serve a cached JSON body without re-encoding; 304 if the client has this ETag."""
+    if request.if_none_match.contains(payload.etag):
+        response = Response(status=304)
+    else:
+        response = Response(payload.body, mimetype='application/json')
+    response.set_etag(payload.etag)
+    return response
 
 
+# Cache warming runs in one web worker at a time: the holder of a Redis lease.
+# Each interval it refreshes a fixed budget of balances, recently active
+# dashboard users first, then a round-robin cursor over everyone else.
+CACHE_WARMER_INTERVAL = int(os.environ.get('CACHE_WARMER_INTERVAL', '120'))
+BALANCE_WARMER_BATCH = int(os.environ.get('BALANCE_WARMER_BATCH', '50'))
+DASHBOARD_ACTIVITY_WINDOW = int(os.environ.get('DASHBOARD_ACTIVITY_WINDOW', '1800'))
+CACHE_WARMER_LEASE_KEY = 'cache_warmer_leader'
+CACHE_WARMER_CURSOR_KEY = 'cache_warmer_cursor'
+DASHBOARD_ACTIVITY_KEY = 'dashboard_activity'
+_RENEW_WARMER_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
 _cache_warmers_started = False
-_balance_warm_offset = 0
+_cache_warmer_id = uuid.uuid4().hex
+_balance_warm_cursor = 0
 
 
-def _warm_balance_cache_batch():
-    """Warm balance cache for a batch of users."""
-    global _balance_warm_offset
-    batch_size = int(os.environ.get('BALANCE_WARMER_BATCH', '50'))
+def note_dashboard_activity(user_id: int) -> None:
+    """Mark a user as active so the cache warmer keeps their balances fresh."""
+    if not redis_client:
+        return
+    try:
+        redis_client.zadd(DASHBOARD_ACTIVITY_KEY, {str(user_id): time.time()})
+    except Exception as e:
+        logger.debug(f"Dashboard activity update failed for {user_id}: {e}")
+
+
+def _hold_cache_warmer_lease() -> bool:
+    """Acquire or renew the warmer lease; without Redis every process warms its own cache."""
+    if not redis_client:
+        return True
+    lease_ttl = CACHE_WARMER_INTERVAL * 2
+    try:
+        if redis_client.set(CACHE_WARMER_LEASE_KEY, _cache_warmer_id, nx=True, ex=lease_ttl):
+            return True
+        return bool(redis_client.eval(_RENEW_WARMER_LEASE, 1, CACHE_WARMER_LEASE_KEY,
+                                      _cache_warmer_id, lease_ttl))
+    except Exception as e:
+        logger.debug(f"Cache warmer lease unavailable: {e}")
+        return False
+
+
+def _recently_active_user_ids(limit: int) -> list:
+    """Users seen on a dashboard within DASHBOARD_ACTIVITY_WINDOW, most recent first."""
+    if not redis_client or limit <= 0:
+        return []
+    cutoff = time.time() - DASHBOARD_ACTIVITY_WINDOW
+    try:
+        pipe = redis_client.pipeline()
+        pipe.zremrangebyscore(DASHBOARD_ACTIVITY_KEY, '-inf', cutoff)
+        pipe.zrevrangebyscore(DASHBOARD_ACTIVITY_KEY, '+inf', cutoff, start=0, num=limit)
+        _, user_ids = pipe.execute()
+        return [int(uid) for uid in user_ids]
+    except Exception as e:
+        logger.debug(f"Dashboard activity read failed: {e}")
+        return []
+
+
+def _next_warm_cursor_batch(limit: int) -> list:
+    """Next active users after the shared round-robin cursor (wraps around)."""
+    global _balance_warm_cursor
+    if limit <= 0:
+        return []
+    cursor = _balance_warm_cursor
+    if redis_client:
+        try:
+            cursor = int(redis_client.get(CACHE_WARMER_CURSOR_KEY) or 0)
+        except Exception as e:
+            logger.debug(f"Cache warmer cursor read failed: {e}")
     
     with app.app_context():
-        users = User.query.filter(
-            User.role == 'user',
-            User.is_active == True
-        ).order_by(User.id.asc()).offset(_balance_warm_offset).limit(batch_size).all()
-    
-    if not users:
-        _balance_warm_offset = 0
-        return
+        base = db.session.query(User.id).filter(User.role == 'user', User.is_active == True)
+        user_ids = [uid for uid, in base.filter(User.id > cursor).order_by(User.id.asc()).limit(limit)]
     
-    for user in users:
-        _refresh_balance_cache(user.id)
+    _balance_warm_cursor = user_ids[-1] if len(user_ids) == limit else 0
+    if redis_client:
+        try:
+            redis_client.set(CACHE_WARMER_CURSOR_KEY, _balance_warm_cursor)
+        except Exception as e:
+            logger.debug(f"Cache warmer cursor write failed: {e}")
+    return user_ids
+
+
+def _needs_warming(user_id: int) -> bool:
+    age = balance_cache.age(user_id)
+    return age is None or age > balance_cache.ttl
+
+
+def _warm_balance_cache_batch():
+    """Refresh at most BALANCE_WARMER_BATCH balances that are missing or expired."""
+    budget = BALANCE_WARMER_BATCH
+    selected = [uid for uid in _recently_active_user_ids(budget * 2) if _needs_warming(uid)][:budget]
+    if len(selected) < budget:
+        selected += [uid for uid in _next_warm_cursor_batch(budget - len(selected))
+                     if uid not in selected and _needs_warming(uid)]
     
-    _balance_warm_offset += len(users)
+    # Refreshed concurrently on the balance refresher's loop (bounded by its semaphore)
+    for user_id in selected:
+        balance_refresher.request_refresh(user_id)
 
 
 def _warm_public_leaderboards():
@@ -693,15 +777,15 @@ def _warm_public_leaderboards():
 
 
 def _cache_warmer_loop():
-    """Background loop to warm caches periodically."""
-    interval = int(os.environ.get('CACHE_WARMER_INTERVAL', '120'))
+    """Background loop to warm caches periodically (only while holding the lease)."""
     while True:
         try:
-            _warm_balance_cache_batch()
-            _warm_public_leaderboards()
+            if _hold_cache_warmer_lease():
+                _warm_balance_cache_batch()
+                _warm_public_leaderboards()
         except Exception as e:
             logger.warning(f"Cache warmer error: {e}")
-        time.sleep(interval)
+        time.sleep(CACHE_WARMER_INTERVAL)
 
 
 def start_cache_warmers():
@@ -718,149 +802,35 @@ def start_cache_warmers():
     threading.Thread(target=_cache_warmer_loop, daemon=True).start()
 
 
-def _fetch_user_exchange_balances(user_id: int) -> dict:
-    """
-    Fetch balances from all connected exchanges for a user using CCXT
-    
-    Returns:
-        dict: {
-            'total': float or None,  # Total balance across all exchanges
-            'exchanges': [
-                {
-                    'id': int,
-                    'exchange_name': str,
-                    'label': str,
-                    'balance': float or None,
-                    'status': str,
-                    'error': str or None
-                }
-            ]
-        }
-    """
-    import ccxt
+def _load_user_exchange_accounts(user_id: int) -> list:
+    """Approved/pending exchanges of a user as plain dicts for the balance refresher."""
     from models import UserExchange
     
-    result = {
-        'total': 0.0,
-        'exchanges': []
-    }
-    
-    # Get all approved/active exchanges for this user
-    user_exchanges = UserExchange.query.filter(
-        UserExchange.user_id == user_id,
-        UserExchange.status.in_(['APPROVED', 'PENDING'])
-    ).all()
-    
-    if not user_exchanges:
-        return result
-    
-    for ue in user_exchanges:
-        exchange_info = {
+    with app.app_context():
+        user_exchanges = UserExchange.query.filter(
+            UserExchange.user_id == user_id,
+            UserExchange.status.in_(['APPROVED', 'PENDING'])
+        ).all()
+        return [{
             'id': ue.id,
             'exchange_name': ue.exchange_name,
             'label': ue.label or ue.exchange_name,
-            'balance': None,
             'status': ue.status,
             'trading_enabled': ue.trading_enabled,
-            'error': None
-        }
-        
-        # Only fetch balance if exchange is approved and has valid credentials
-        if ue.status == 'APPROVED' and ue.api_key and ue.api_secret:
-            try:
-                # Get the CCXT exchange class
-                exchange_class_name = ue.exchange_name.lower()
-                
-                # Map to CCXT class names (import from service_validator for consistency)
-                from service_validator import SUPPORTED_EXCHANGES
-                ccxt_mapping = SUPPORTED_EXCHANGES
-                
-                ccxt_class = ccxt_mapping.get(exchange_class_name, exchange_class_name)
-                
-                if hasattr(ccxt, ccxt_class):
-                    exchange_class = getattr(ccxt, ccxt_class)
-                    
-                    # Configure exchange
-                    config = {
-                        'apiKey': ue.api_key,
-                        'secret': ue.get_api_secret(),
-                        'enableRateLimit': True,
-                        'options': {
-                            # Align with trading engine defaults for perpetual futures
-                            'defaultType': 'swap',
-                            'forcePublicIPv4': True,
-                        }
-                    }
-                    
-                    # Add passphrase if required
-                    passphrase = ue.get_passphrase()
-                    if passphrase:
-                        config['password'] = passphrase
-                    
-                    exchange = exchange_class(config)
-                    
-                    # Fetch balance
-                    balance = exchange.fetch_balance()
-                    
-                    # Try to get USDT balance (most common for futures)
-                    usdt_balance = None
-                    if 'USDT' in balance and isinstance(balance['USDT'], dict):
-                        usdt_balance = balance['USDT'].get('total') or balance['USDT'].get('free', 0)
-                    elif 'total' in balance and 'USDT' in balance['total']:
-                        usdt_balance = balance['total']['USDT']
-                    elif 'free' in balance and 'USDT' in balance['free']:
-                        usdt_balance = balance['free']['USDT']
-                    
-                    if usdt_balance is not None:
-                        exchange_info['balance'] = float(usdt_balance)
-                        result['total'] += float(usdt_balance)
-                    else:
-                        # Try to find any stablecoin balance
-                        for coin in ['USDT', 'USDC', 'BUSD', 'USD']:
-                            if coin in balance:
-                                if isinstance(balance[coin], dict):
-                                    val = balance[coin].get('total') or balance[coin].get('free', 0)
-                                else:
-                                    val = balance[coin]
-                                try:
-                                    val_num = float(val)
-                                except (TypeError, ValueError):
-                                    continue
-                                exchange_info['balance'] = val_num
-                                result['total'] += val_num
-                                break
-                else:
-                    exchange_info['error'] = f"Exchange {ccxt_class} not supported"
-                    
-            except ccxt.AuthenticationError as e:
-                exchange_info['error'] = "Authentication failed"
-                logger.warning(f"Auth error fetching balance for user {user_id} on {ue.exchange_name}: {e}")
-            except ccxt.NetworkError as e:
-                exchange_info['error'] = "Network error"
-                logger.warning(f"Network error fetching balance for user {user_id} on {ue.exchange_name}: {e}")
-            except Exception as e:
-                exchange_info['error'] = str(e)[:50]
-                logger.warning(f"Error fetching balance for user {user_id} on {ue.exchange_name}: {e}")
-        
-        result['exchanges'].append(exchange_info)
-    
-    return result
+            'api_key': ue.api_key,
+            'secret': ue.get_api_secret() if ue.status == 'APPROVED' and ue.api_secret else None,
+            'password': ue.get_passphrase() if ue.status == 'APPROVED' else None,
+        } for ue in user_exchanges]
 
 
-def _refresh_balance_cache(user_id: int) -> None:
-    """Refresh cached balances asynchronously."""
-    try:
-        with app.app_context():
-            data = _fetch_user_exchange_balances(user_id)
-        with _balance_cache_lock:
-            _balance_cache[user_id] = {
-                'data': data,
-                'ts': time.time()
-            }
-        _set_balance_cache_to_redis(user_id, data)
-    finally:
-        with _balance_cache_lock:
-            _balance_cache_inflight.discard(user_id)
+def _store_balance_cache(user_id: int, data: dict) -> None:
+    """Store refreshed balances in the local and Redis caches."""
+    balance_cache.set(user_id, data)
+    _update_balance_aggregate(user_id, data.get('total'))
+
+
+# Pooled async CCXT clients; refreshes are single-flight per user across workers
+balance_refresher = ExchangeBalanceRefresher(_load_user_exchange_accounts, _store_balance_cache, redis_client)
 
 
 def get_user_exchange_balances(
@@ -878,51 +848,32 @@ def get_user_exchange_balances(
         allow_sync_fetch: Allow synchronous fetch when cache missing
         refresh_in_background: Allow background refresh when stale/missing
     """
-    # Prefer Redis cache if available (persists across restarts)
-    redis_cached = _get_balance_cache_from_redis(user_id)
-    if redis_cached:
-        return redis_cached
-    
-    now = time.time()
-    with _balance_cache_lock:
-        cached = _balance_cache.get(user_id)
-    
-    if cached:
-        age = now - cached['ts']
-        if age <= _balance_cache_ttl:
-            return cached['data']
-        if allow_stale:
-            with _balance_cache_lock:
-                if refresh_in_background and user_id not in _balance_cache_inflight:
-                    _balance_cache_inflight.add(user_id)
-                    threading.Thread(
-                        target=_refresh_balance_cache,
-                        args=(user_id,),
-                        daemon=True
-                    ).start()
-            return cached['data']
+    # Fresh (or, when allowed, stale) entry from the process LRU or Redis
+    cached = balance_cache.get(user_id, allow_stale=allow_stale)
+    if cached is not None:
+        if refresh_in_background and (balance_cache.age(user_id) or 0) > balance_cache.ttl:
+            balance_refresher.request_refresh(user_id)
+        return cached
 
     if not allow_sync_fetch:
         # Avoid blocking requests - return empty and optionally refresh in background
         if refresh_in_background:
-            with _balance_cache_lock:
-                if user_id not in _balance_cache_inflight:
-                    _balance_cache_inflight.add(user_id)
-                    threading.Thread(
-                        target=_refresh_balance_cache,
-                        args=(user_id,),
-                        daemon=True
-                    ).start()
+            balance_refresher.request_refresh(user_id)
         return {'total': 0.0, 'exchanges': []}
     
-    # No cache or stale not allowed: refresh synchronously
-    data = _fetch_user_exchange_balances(user_id)
-    with _balance_cache_lock:
-        _balance_cache[user_id] = {'data': data, 'ts': now}
-    _set_balance_cache_to_redis(user_id, data)
+    # No cache or stale not allowed: refresh and wait (for another worker's refresh too)
+    data = balance_refresher.refresh_now(user_id, _published_balances)
+    if data is None:
+        data = balance_cache.peek(user_id) or {'total': 0.0, 'exchanges': []}
     return data
 
 
+def _published_balances(user_id: int):
+    """Balances within the cache TTL, e.g. just stored by the worker holding the refresh lock."""
+    age = balance_cache.age(user_id)
+    return balance_cache.peek(user_id) if age is not None and age <= balance_cache.ttl else None
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
@@ -1013,6 +964,10 @@ def security_checks():
             abort(403)
     
     if request.method in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        # Authenticated TradingView webhooks are validated against their own schema
+        # (parsed once in parse_webhook_request) - skip the generic scanner
+        if request.endpoint == 'webhook' and parse_webhook_request().authenticated:
+            return
         if request.is_json:
             payload = request.get_json(silent=True)
             raw_body = request.get_data(cache=True)
@@ -1141,41 +1096,65 @@ def handle_connect(auth=None):
                 logger.debug("Client disconnected before joining room")
                 return
             logger.info(f"🔌 Client connected: {current_user.username}")
+            chat_store.mark_online(current_user)
+            # Open dashboard: refresh this user's accounts on the fast cadence
+            engine.balance_monitor.mark_active(current_user.id)
             
+            # Initial state comes from cached snapshots only - no exchange I/O in socket handlers.
+            # Fresh deltas follow from master_state and balance_monitor pushes.
             if current_user.role == 'admin':
                 try:
                     join_room("admin_room", namespace=namespace)
                 except ValueError:
                     logger.debug("Admin client disconnected before joining admin room")
                     return
-                if engine.master_client:
-                    engine.push_update('master', engine.master_client, is_master=True)
-                for slave in engine.slave_clients:
-                    engine.push_update(slave['id'], slave['client'])
+                snapshot = engine.master_state.get_snapshot()
+                if snapshot:
+                    emit('master_data', {
+                        'balance': f"{snapshot['total_balance']:,.2f}",
+                        'positions': snapshot['positions'],
+                        'exchange_balances': snapshot['balances']
+                    })
+                slave_ids = {slave['id'] for slave in engine.slave_clients}
+                for user_id, state in engine.balance_monitor.cached_states(slave_ids).items():
+                    emit('agent_update', {
+                        'user_id': user_id,
+                        'balance': state['balance'],
+                        'pos_count': len(state['positions'])
+                    })
             else:
-                slave = next((s for s in engine.slave_clients if s['id'] == current_user.id), None)
-                if slave:
-                    engine.push_update(slave['id'], slave['client'])
-                else:
-                    try:
-                        socketio.emit('update_data', {'balance': "0.00", 'positions': []}, room=room, namespace=namespace)
-                    except (RemoteDisconnected, ConnectionAbortedError, ConnectionResetError, 
-                            urllib3.exceptions.ProtocolError):
-                        # Client disconnected - expected behavior, silently ignore
-                        pass
+                state = engine.balance_monitor.cached_state(current_user.id)
+                try:
+                    if state:
+                        emit('update_data', {'balance': state['balance'], 'positions': state['positions']})
+                    elif not any(s['id'] == current_user.id for s in engine.slave_clients):
+                        emit('update_data', {'balance': "0.00", 'positions': []})
+                except (RemoteDisconnected, ConnectionAbortedError, ConnectionResetError, 
+                        urllib3.exceptions.ProtocolError):
+                    # Client disconnected - expected behavior, silently ignore
+                    pass
     except KeyError as e:
         # Race condition: client disconnected before join_room completed
         # This is expected when clients rapidly connect/disconnect
         logger.debug(f"Client disconnected during connect handler: {e}")
 
 
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    try:
+        if current_user.is_authenticated:
+            engine.balance_monitor.mark_inactive(current_user.id)
+    except Exception as e:
+        logger.debug(f"Disconnect handler error: {e}")
+
+
 # ==================== LIVE CHAT SOCKET EVENTS ====================
 
 @socketio.on('join_chat')
 def handle_join_chat(data):
     """Handle user joining a chat room"""
     from flask_socketio import join_room as socket_join_room
-    from models import ChatBan, ChatMessage
+    from models import ChatBan
     
     if not current_user.is_authenticated:
         safe_emit('chat_error', {'message': 'Увійдіть, щоб отримати доступ до чату'})
@@ -1203,9 +1182,10 @@ def handle_join_chat(data):
         socket_join_room(f'chat_{room}')
         logger.info(f"💬 {current_user.username} joined chat room: {room}")
         
-        # Get recent messages
-        messages = ChatMessage.get_recent_messages(room, limit=50)
-        messages_data = [msg.to_dict() for msg in reversed(messages)]  # Oldest first
+        chat_store.mark_online(current_user)
+        
+        # Recent messages from the room's Redis list (oldest first)
+        messages_data = chat_store.recent_messages(room, 50)
         
         safe_emit('chat_joined', {
             'room': room,
@@ -1250,10 +1230,17 @@ def handle_leave_chat(data):
     }, room=f'chat_{room}', include_self=False)
 
 
+@socketio.on('chat_heartbeat')
+def handle_chat_heartbeat(data=None):
+    """Keep the user in the online list while the chat is open"""
+    if current_user.is_authenticated:
+        chat_store.mark_online(current_user)
+
+
 @socketio.on('send_message')
 def handle_send_message(data):
     """Handle sending a chat message"""
-    from models import ChatBan, ChatMessage
+    from models import ChatBan
     
     if not current_user.is_authenticated:
         safe_emit('chat_error', {'message': 'Увійдіть, щоб надсилати повідомлення'})
@@ -1285,18 +1272,10 @@ def handle_send_message(data):
     # Sanitize message (basic XSS prevention)
     message_text = message_text.replace('<', '&lt;').replace('>', '&gt;')
     
-    # Save message to database
-    chat_msg = ChatMessage(
-        user_id=current_user.id,
-        room=room,
-        message=message_text,
-        message_type='admin' if current_user.role == 'admin' else 'user'
-    )
-    db.session.add(chat_msg)
-    db.session.commit()
-    
-    # Broadcast message to room
-    emit('new_message', chat_msg.to_dict(), room=f'chat_{room}')
+    # Broadcast first; the row is inserted by the chat store's batch flusher
+    entry = chat_store.post(current_user, room, message_text,
+                            'admin' if current_user.role == 'admin' else 'user')
+    emit('new_message', entry, room=f'chat_{room}')
 
 
 @socketio.on('delete_message')
@@ -1318,10 +1297,14 @@ def handle_delete_message(data):
         return
     
     message = ChatMessage.query.get(message_id)
+    if message is None and chat_store.flush():
+        # Possibly still queued for insert
+        message = ChatMessage.query.get(message_id)
     if message:
         message.is_deleted = True
         message.deleted_by_id = current_user.id
         db.session.commit()
+        chat_store.remove(message.room, message.id)
         
         emit('message_deleted', {'message_id': message_id}, room=f'chat_{room}')
 
@@ -1331,13 +1314,10 @@ def broadcast_whale_alert(user_id: int, username: str, symbol: str, pnl: float,
     Broadcast a whale alert to the chat when a user makes a large profit.
     Called from the trading engine when a trade closes.
     """
-    from models import ChatMessage, User
+    from models import User
     
     # Mask username for privacy
-    if len(username) > 3:
-        masked_name = username[0] + '*' * (len(username) - 2) + username[-1]
-    else:
-        masked_name = username
+    masked_name = mask_username(username)
     
     # Format the whale alert message
     alert_message = f"🐋 {masked_name} just made +${abs(pnl):.2f} on {symbol}!"
@@ -1348,25 +1328,17 @@ def broadcast_whale_alert(user_id: int, username: str, symbol: str, pnl: float,
         admin_user = User.query.first()
     
     if admin_user:
-        chat_msg = ChatMessage(
-            user_id=admin_user.id,
-            room=room,
-            message=alert_message,
-            message_type='whale_alert',
-            extra_data={
-                'type': 'whale_alert',
-                'trader_id': user_id,
-                'masked_username': masked_name,
-                'symbol': symbol,
-                'pnl': pnl
-            }
-        )
-        db.session.add(chat_msg)
-        db.session.commit()
+        entry = chat_store.post(admin_user, room, alert_message, 'whale_alert', extra_data={
+            'type': 'whale_alert',
+            'trader_id': user_id,
+            'masked_username': masked_name,
+            'symbol': symbol,
+            'pnl': pnl
+        })
         
         # Broadcast to chat room
         try:
-            socketio.emit('new_message', chat_msg.to_dict(), room=f'chat_{room}')
+            socketio.emit('new_message', entry, room=f'chat_{room}')
             socketio.emit('whale_alert', {
                 'masked_username': masked_name,
                 'symbol': symbol,
@@ -1569,6 +1541,15 @@ Crawl-delay: 1
 
 # ==================== PUBLIC LEADERBOARD ====================
 
+LEADERBOARD_CHART_POINTS = 30  # one per day
+
+
+def _mask_leaderboard_name(username: str) -> str:
+    if len(username) > 2:
+        return f"User {username[0]}***{username[-1]}"
+    return f"User {username[0]}***"
+
+
 def _compute_leaderboard_stats() -> dict:
     """Compute leaderboard stats payload."""
     # Calculate time periods
@@ -1577,107 +1558,49 @@ def _compute_leaderboard_stats() -> dict:
     last_30_days = datetime.now(timezone.utc) - timedelta(days=30)
     
     # ===== GLOBAL STATS =====
-    total_users = User.query.filter(User.role == 'user').count()
-    active_users = User.query.filter(User.role == 'user', User.is_active == True).count()
-    
-    total_profit = db.session.query(db.func.sum(TradeHistory.pnl)).filter(
-        TradeHistory.pnl > 0
-    ).scalar() or 0
-    
-    total_volume = db.session.query(db.func.sum(db.func.abs(TradeHistory.pnl))).scalar() or 0
-    total_volume = total_volume * 15  # Assume average 15x leverage
-    
-    total_trades = TradeHistory.query.count()
-    
-    # ===== TOP COPIERS TODAY (by ROE%) =====
-    top_copiers_query = db.session.query(
-        TradeHistory.user_id,
-        db.func.sum(TradeHistory.pnl).label('total_pnl'),
-        db.func.avg(TradeHistory.roi).label('avg_roe'),
-        db.func.count(TradeHistory.id).label('trade_count')
-    ).filter(
-        TradeHistory.user_id.isnot(None),
-        TradeHistory.close_time >= today
-    ).group_by(
-        TradeHistory.user_id
-    ).order_by(
-        db.func.sum(TradeHistory.pnl).desc()
-    ).limit(10).all()
-    
-    top_copiers = []
-    for row in top_copiers_query:
-        user = db.session.get(User, row.user_id)
-        if user:
-            username = user.username
-            if len(username) > 2:
-                masked = f"User {username[0]}***{username[-1]}"
-            else:
-                masked = f"User {username[0]}***"
-            
-            top_copiers.append({
-                'masked_name': masked,
-                'roe': round(float(row.avg_roe or 0), 2),
-                'pnl': round(float(row.total_pnl or 0), 2),
-                'trades': int(row.trade_count)
-            })
-    
-    if not top_copiers:
-        top_copiers_query = db.session.query(
-            TradeHistory.user_id,
-            db.func.sum(TradeHistory.pnl).label('total_pnl'),
-            db.func.avg(TradeHistory.roi).label('avg_roe'),
-            db.func.count(TradeHistory.id).label('trade_count')
-        ).filter(
-            TradeHistory.user_id.isnot(None),
-            TradeHistory.close_time >= last_7_days
-        ).group_by(
-            TradeHistory.user_id
-        ).order_by(
-            db.func.sum(TradeHistory.pnl).desc()
-        ).limit(10).all()
-        
-        for row in top_copiers_query:
-            user = db.session.get(User, row.user_id)
-            if user:
-                username = user.username
-                if len(username) > 2:
-                    masked = f"User {username[0]}***{username[-1]}"
-                else:
-                    masked = f"User {username[0]}***"
-                
-                top_copiers.append({
-                    'masked_name': masked,
-                    'roe': round(float(row.avg_roe or 0), 2),
-                    'pnl': round(float(row.total_pnl or 0), 2),
-                    'trades': int(row.trade_count)
-                })
+    total_users, active_users = db.session.query(
+        db.func.count(User.id),
+        db.func.sum(db.case((User.is_active.is_(True), 1), else_=0))
+    ).filter(User.role == 'user').one()
+    total_users, active_users = int(total_users or 0), int(active_users or 0)
+    
+    # Trade aggregates come from the daily rollup (O(days), not O(trades))
+    all_trades = DailyTradeRollup.totals(all_users=True)
+    total_profit = all_trades['profit']
+    total_volume = all_trades['abs_pnl'] * 15  # Assume average 15x leverage
+    total_trades = all_trades['trades']
+    
+    # ===== TOP COPIERS TODAY (by PnL), falling back to the last 7 days =====
+    top_rows = DailyTradeRollup.top_users(today.date(), limit=10)
+    if not top_rows:
+        top_rows = DailyTradeRollup.top_users(last_7_days.date(), limit=10)
+    
+    top_copiers = [{
+        'masked_name': _mask_leaderboard_name(username),
+        'roe': round(float(avg_roe or 0), 2),
+        'pnl': round(float(pnl or 0), 2),
+        'trades': int(trade_count)
+    } for _, username, pnl, avg_roe, trade_count in top_rows if username]
     
     # ===== MASTER TRADER STATS =====
-    master_trades_30d = TradeHistory.query.filter(
-        TradeHistory.user_id == None,
-        TradeHistory.close_time >= last_30_days
-    ).all()
-    
-    master_pnl = sum(t.pnl for t in master_trades_30d) if master_trades_30d else 0
-    master_trades_count = len(master_trades_30d)
-    master_winning = len([t for t in master_trades_30d if t.pnl > 0])
-    master_winrate = (master_winning / master_trades_count * 100) if master_trades_count > 0 else 0
-    master_avg_roi = sum(t.roi for t in master_trades_30d) / len(master_trades_30d) if master_trades_30d else 0
+    master_30d = DailyTradeRollup.totals(None, since=last_30_days)
+    master_pnl = master_30d['pnl']
+    master_trades_count = master_30d['trades']
+    master_winrate = (master_30d['wins'] / master_trades_count * 100) if master_trades_count > 0 else 0
+    master_avg_roi = master_30d['avg_roi']
     
-    master_balance_history = BalanceHistory.query.filter(
-        BalanceHistory.user_id == None,
-        BalanceHistory.timestamp >= last_30_days
-    ).order_by(BalanceHistory.timestamp.asc()).all()
+    # One chart point per day (last snapshot), bucketed in SQL
+    master_balance_history = BalanceHistory.series(None, last_30_days, LEADERBOARD_CHART_POINTS)
     
     balance_chart_data = [{
-        'time': h.timestamp.strftime('%d/%m'),
-        'balance': round(h.balance, 2)
-    } for h in master_balance_history]
+        'time': timestamp.strftime('%d/%m'),
+        'balance': round(balance, 2)
+    } for timestamp, balance in master_balance_history]
     
     master_roe = 0
-    if master_balance_history and len(master_balance_history) >= 2:
-        start_balance = master_balance_history[0].balance
-        end_balance = master_balance_history[-1].balance
+    balance_change = BalanceHistory.period_change(None, last_30_days)
+    if balance_change:
+        start_balance, end_balance = balance_change
         if start_balance > 0:
             master_roe = ((end_balance - start_balance) / start_balance) * 100
     
@@ -1704,11 +1627,18 @@ def _compute_leaderboard_stats() -> dict:
 
 
 def _compute_gamification_leaderboard(limit: int) -> dict:
-    """Compute gamification leaderboard payload."""
-    top_users = User.query.filter(
-        User.role == 'user',
-        User.xp > 0
-    ).order_by(User.xp.desc()).limit(limit).all()
+    """Compute gamification leaderboard payload (three queries regardless of limit)."""
+    participants = User.query.filter(User.role == 'user', User.xp > 0)
+    top_users = participants.options(db.joinedload(User.current_level)).order_by(User.xp.desc()).limit(limit).all()
+    
+    # Badge counts for every listed user in one grouped query
+    badge_counts = {}
+    if top_users:
+        badge_counts = dict(db.session.query(
+            UserAchievement.user_id, db.func.count(UserAchievement.id)
+        ).filter(
+            UserAchievement.user_id.in_([user.id for user in top_users])
+        ).group_by(UserAchievement.user_id).all())
     
     leaderboard = []
     for i, user in enumerate(top_users, 1):
@@ -1721,13 +1651,13 @@ def _compute_gamification_leaderboard(limit: int) -> dict:
             'level_name': user.current_level.name if user.current_level else 'Novice',
             'level_icon': user.current_level.icon if user.current_level else 'fa-seedling',
             'level_color': user.current_level.color if user.current_level else '#888888',
-            'badge_count': user.achievements.count()
+            'badge_count': badge_counts.get(user.id, 0)
         })
     
     return {
         'success': True,
         'leaderboard': leaderboard,
-        'total_participants': User.query.filter(User.role == 'user', User.xp > 0).count()
+        'total_participants': participants.count()
     }
 
 
@@ -1741,8 +1671,7 @@ def leaderboard():
 def get_leaderboard_stats():
     """Public API endpoint for leaderboard statistics - no auth required"""
     try:
-        data = get_public_stats_cached('leaderboard_stats', _compute_leaderboard_stats)
-        return jsonify(data)
+        return cached_json_response(get_public_stats_cached('leaderboard_stats', _compute_leaderboard_stats))
         
     except Exception as e:
         logger.error(f"Error getting leaderboard stats: {e}")
@@ -2637,8 +2566,7 @@ def get_insurance_fund():
     This endpoint is public to promote transparency and build trust.
     """
     try:
-        data = get_public_stats_cached('insurance_fund', _compute_public_insurance_fund)
-        return jsonify(data)
+        return cached_json_response(get_public_stats_cached('insurance_fund', _compute_public_insurance_fund))
         
     except Exception as e:
         logger.error(f"Error getting Insurance Fund info: {e}")
@@ -3412,7 +3340,7 @@ def legal_accept():
     ip = get_client_ip()
     
     # Check if user has already accepted this version
-    if UserConsent.has_user_accepted_tos(current_user.id, tos_version):
+    if check_tos_consent(current_user.id, tos_version):
         return redirect(url_for('dashboard'))
     
     if request.method == 'POST':
@@ -3442,6 +3370,7 @@ def legal_accept():
                 user_agent=user_agent,
                 consent_type='tos_and_risk_disclaimer'
             )
+            remember_tos_consent(current_user.id, tos_version)
             
             audit.log_security_event(
                 "TOS_ACCEPTED",
@@ -3702,6 +3631,7 @@ def dashboard():
             except Exception:
                 u_bal = None
 
+        note_dashboard_activity(current_user.id)
         if u_bal is None:
             try:
                 balance_data = get_user_exchange_balances(
@@ -4062,11 +3992,12 @@ def get_user_details(user_id):
         return jsonify({'success': False, 'error': 'Користувача не знайдено'}), 404
     
     # Get trade statistics
-    total_trades = TradeHistory.query.filter_by(user_id=user_id).count()
-    winning_trades = TradeHistory.query.filter(TradeHistory.user_id == user_id, TradeHistory.pnl > 0).count()
-    losing_trades = TradeHistory.query.filter(TradeHistory.user_id == user_id, TradeHistory.pnl < 0).count()
-    total_pnl = db.session.query(db.func.sum(TradeHistory.pnl)).filter(TradeHistory.user_id == user_id).scalar() or 0
-    avg_roi = db.session.query(db.func.avg(TradeHistory.roi)).filter(TradeHistory.user_id == user_id).scalar() or 0
+    trade_stats = DailyTradeRollup.totals(user_id)
+    total_trades = trade_stats['trades']
+    winning_trades = trade_stats['wins']
+    losing_trades = trade_stats['losses']
+    total_pnl = trade_stats['pnl']
+    avg_roi = trade_stats['avg_roi']
     
     # Get last trade
     last_trade = TradeHistory.query.filter_by(user_id=user_id).order_by(TradeHistory.close_time.desc()).first()
@@ -4078,14 +4009,11 @@ def get_user_details(user_id):
     # Get balance from 30 days ago to calculate growth
     from datetime import datetime, timedelta, timezone
     thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-    old_balance = BalanceHistory.query.filter(
-        BalanceHistory.user_id == user_id,
-        BalanceHistory.timestamp <= thirty_days_ago
-    ).order_by(BalanceHistory.timestamp.desc()).first()
+    old_balance = BalanceHistory.balance_at(user_id, thirty_days_ago)
     
     balance_growth = 0
-    if old_balance and old_balance.balance > 0:
-        balance_growth = ((current_balance - old_balance.balance) / old_balance.balance) * 100
+    if old_balance and old_balance > 0:
+        balance_growth = ((current_balance - old_balance) / old_balance) * 100
     
     # Days since registration
     days_registered = 0
@@ -4199,15 +4127,19 @@ def admin_delete_user(user_id):
         
         # Delete trade history
         TradeHistory.query.filter_by(user_id=user_id).delete()
+        DailyTradeRollup.query.filter_by(user_id=user_id).delete()
         
         # Delete balance history
         BalanceHistory.query.filter_by(user_id=user_id).delete()
+        BalanceHistoryRollup.query.filter_by(user_id=user_id).delete()
         
         # Delete messages (sent and received)
         Message.query.filter((Message.sender_id == user_id) | (Message.recipient_id == user_id)).delete()
 
-        # Delete live chat messages to avoid FK null updates
+        # Delete live chat messages to avoid FK null updates (queued ones first)
+        chat_store.flush()
         ChatMessage.query.filter_by(user_id=user_id).delete()
+        chat_store.drop_user(user_id)
 
         # Delete payments and subscriptions
         Payment.query.filter_by(user_id=user_id).delete()
@@ -4245,6 +4177,10 @@ def admin_delete_user(user_id):
         # Finally delete the user
         db.session.delete(user)
         db.session.commit()
+        chat_ban_table.changed()
+        forget_tos_consent(user_id)
+        balance_cache.invalidate(user_id)
+        remove_balance_aggregate(user_id)
         
         logger.info(f"🗑️ Admin {current_user.username} deleted user {username} (ID: {user_id})")
         
@@ -4307,6 +4243,9 @@ def api_admin_panic():
 
 # ==================== API ROUTES ====================
 
+BALANCE_HISTORY_MAX_POINTS = int(os.environ.get('BALANCE_HISTORY_MAX_POINTS', '500'))
+
+
 @app.route('/api/balance_history', methods=['GET'])
 @login_required
 def get_balance_history():
@@ -4335,14 +4274,8 @@ def get_balance_history():
     delta = period_map.get(period, timedelta(hours=24))
     
     since = datetime.now(timezone.utc) - delta
-    query = BalanceHistory.query.filter(BalanceHistory.timestamp >= since)
-    
-    if target_user_id is None:
-        query = query.filter(BalanceHistory.user_id == None)
-    else:
-        query = query.filter(BalanceHistory.user_id == target_user_id)
-    
-    history = query.order_by(BalanceHistory.timestamp.asc()).all()
+    # Downsampled server-side: at most BALANCE_HISTORY_MAX_POINTS per request
+    history = BalanceHistory.series(target_user_id, since, BALANCE_HISTORY_MAX_POINTS)
     
     # Time format based on period
     if period == '24h':
@@ -4353,9 +4286,9 @@ def get_balance_history():
         time_fmt = '%d/%m'
     
     data = [{
-        'time': h.timestamp.strftime(time_fmt),
-        'balance': h.balance
-    } for h in history]
+        'time': timestamp.strftime(time_fmt),
+        'balance': balance
+    } for timestamp, balance in history]
     
     return jsonify(data)
 
@@ -4379,30 +4312,18 @@ def get_master_stats():
     delta = period_map.get(period, timedelta(hours=24))
     since = datetime.now(timezone.utc) - delta
     
-    # Get trades for period (master trades have user_id = None)
-    trades = TradeHistory.query.filter(
-        TradeHistory.close_time >= since,
-        TradeHistory.user_id == None
-    ).all()
-    
-    total_pnl = sum(t.pnl for t in trades) if trades else 0
-    total_trades = len(trades)
-    winning_trades = len([t for t in trades if t.pnl > 0])
-    
-    # Calculate average ROI
-    avg_roi = sum(t.roi for t in trades) / len(trades) if trades else 0
+    # Master trade totals for the period from the daily rollup
+    stats = DailyTradeRollup.totals(None, since=since)
+    total_pnl = stats['pnl']
+    total_trades = stats['trades']
+    winning_trades = stats['wins']
+    avg_roi = stats['avg_roi']
     
-    # Get balance history for ROI calculation
-    balance_history = BalanceHistory.query.filter(
-        BalanceHistory.timestamp >= since,
-        BalanceHistory.user_id == None
-    ).order_by(BalanceHistory.timestamp.asc()).all()
-    
-    # Calculate ROI based on starting balance
+    # Calculate ROI from the first and last balance of the period
     period_roi = 0
-    if balance_history and len(balance_history) >= 2:
-        start_balance = balance_history[0].balance
-        end_balance = balance_history[-1].balance
+    balance_change = BalanceHistory.period_change(None, since)
+    if balance_change:
+        start_balance, end_balance = balance_change
         if start_balance > 0:
             period_roi = ((end_balance - start_balance) / start_balance) * 100
     
@@ -4437,7 +4358,9 @@ def get_master_exchange_balances():
                 except Exception as e:
                     logger.warning(f"Failed to init master exchanges in balances API: {e}")
 
-        balances = engine.get_all_master_balances()
+        # Last snapshot only; 'stale' tells the dashboard the refresher is behind
+        snapshot = engine.master_state.last_snapshot()
+        balances = [dict(b) for b in snapshot['balances']] if snapshot else []
         total_balance = sum(b['balance'] for b in balances if b.get('balance') is not None)
 
         # Add placeholders for enabled configs not loaded into master_clients
@@ -4475,7 +4398,8 @@ def get_master_exchange_balances():
         return jsonify({
             'success': True,
             'exchanges': balances,
-            'total_balance': round(total_balance, 2)
+            'total_balance': round(total_balance, 2),
+            'stale': snapshot is None or snapshot['stale']
         })
     except Exception as e:
         logger.error(f"Error fetching master exchange balances: {e}")
@@ -4501,11 +4425,13 @@ def get_master_positions():
                     engine.init_master()
                 except Exception as e:
                     logger.warning(f"Failed to init master exchanges in positions API: {e}")
-        positions = engine.get_all_master_positions()
+        snapshot = engine.master_state.last_snapshot()
+        positions = [dict(p) for p in snapshot['positions']] if snapshot else []
         return jsonify({
             'success': True,
             'positions': positions,
-            'count': len(positions)
+            'count': len(positions),
+            'stale': snapshot is None or snapshot['stale']
         })
     except Exception as e:
         logger.error(f"Error fetching master positions: {e}")
@@ -4524,10 +4450,7 @@ def admin_close_position():
     close_all_users = scope == 'all' or bool(data.get('close_all_users'))
 
     raw_symbol_input = str(data.get('symbol', '') or '').strip()
-    if ':' in raw_symbol_input:
-        raw_symbol_input = raw_symbol_input.split(':')[-1]
-    raw_symbol = re.sub(r'\.P|\.p|\.S|\.s$', '', raw_symbol_input)
-    raw_symbol = raw_symbol.replace('/', '').replace('-', '').replace('_', '').upper()
+    raw_symbol = normalize_symbol(raw_symbol_input)
     valid, symbol = InputValidator.validate_symbol(raw_symbol)
     if not valid:
         return jsonify({'success': False, 'error': f'Невірний символ: {symbol}'}), 400
@@ -4581,84 +4504,41 @@ def get_user_positions():
     """
     Get open positions for the current user.
     Returns HTML partial for HTMX or JSON based on Accept header.
-    This endpoint is polled by HTMX every 2 seconds for real-time updates.
+    
+    Served from the cached position snapshots (master state for admins, the
+    balance monitor's per-user state otherwise) - no exchange calls. The
+    snapshot version is sent as ETag; an unchanged snapshot answers 304, or
+    204 for HTMX so the container is not swapped. Without a current master
+    snapshot (startup, refresher failure) admins get an "unavailable" state,
+    not an empty list.
     """
     try:
-        positions_data = []
+        is_htmx = bool(request.headers.get('HX-Request'))
         
         if current_user.role == 'admin':
             # Admin sees master positions
-            positions_data = engine.get_all_master_positions()
+            snapshot = engine.master_state.get_snapshot()
+            if snapshot is None:
+                return _positions_unavailable(is_htmx)
+            positions_data = snapshot['positions']
+            version = positions_version(positions_data)
         else:
-            # Regular user - find their slave clients and get positions
-            for slave in engine.slave_clients:
-                if slave['id'] == current_user.id:
-                    try:
-                        client = slave['client']
-                        positions_info = client.futures_position_information()
-                        
-                        for p in positions_info:
-                            amt = float(p['positionAmt'])
-                            if amt != 0:
-                                positions_data.append({
-                                    'symbol': p['symbol'],
-                                    'amount': amt,
-                                    'entry_price': float(p['entryPrice']),
-                                    'unrealized_pnl': float(p['unRealizedProfit']),
-                                    'side': 'LONG' if amt > 0 else 'SHORT',
-                                    'leverage': int(p.get('leverage', 1)),
-                                    'exchange': slave.get('exchange_name', 'binance').upper()
-                                })
-                    except Exception as e:
-                        logger.warning(f"Error fetching positions for user {current_user.id}: {e}")
-                    break
-        
-        # Check if HTMX request (return HTML partial)
-        if request.headers.get('HX-Request'):
-            if not positions_data:
-                return '''
-                <div class="empty-positions">
-                    <div class="icon"><i class="fas fa-inbox"></i></div>
-                    <div class="text">No open positions</div>
-                </div>
-                '''
-            
-            html_parts = []
-            for p in positions_data:
-                pnl_class = 'positive' if p['unrealized_pnl'] >= 0 else 'negative'
-                pnl_sign = '+' if p['unrealized_pnl'] >= 0 else ''
-                side_class = 'long' if p['side'] == 'LONG' else 'short'
-                arrow = 'arrow-trend-up' if p['side'] == 'LONG' else 'arrow-trend-down'
-                symbol = html.escape(p.get('symbol', ''))
-                side_label = html.escape(p.get('side', ''))
-                exchange_label = html.escape(p.get('exchange', '')) if p.get('exchange') else ''
-                
-                html_parts.append(f'''
-                <div class="position-card">
-                    <div class="position-info">
-                        <div class="side-badge {side_class}">
-                            <i class="fas fa-{arrow}"></i>
-                        </div>
-                        <div>
-                            <div class="symbol">{symbol}</div>
-                            <div class="details">{side_label} · x{p['leverage']}{' · ' + exchange_label if exchange_label else ''}</div>
-                        </div>
-                    </div>
-                    <div class="pnl">
-                        <div class="pnl-value {pnl_class}">{pnl_sign}{p['unrealized_pnl']:.2f}$</div>
-                        <div class="entry-price">${p['entry_price']:.4f}</div>
-                    </div>
-                </div>
-                ''')
-            
-            return ''.join(html_parts)
-        
-        # Return JSON for non-HTMX requests
-        return jsonify({
-            'success': True,
-            'positions': positions_data,
-            'count': len(positions_data)
-        })
+            state = engine.balance_monitor.cached_state(current_user.id)
+            positions_data = state['positions'] if state else []
+            version = state.get('version') if state else None
+            version = version or positions_version(positions_data)
+        
+        etag = f"{version}-{'h' if is_htmx else 'j'}"
+        if request.if_none_match.contains(etag):
+            not_modified = Response(status=204 if is_htmx else 304)
+            not_modified.set_etag(etag)
+            return not_modified
+        
+        response = app.make_response(_render_positions(positions_data, is_htmx))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['Vary'] = 'HX-Request'
+        return response
         
     except Exception as e:
         logger.error(f"Error fetching user positions: {e}")
@@ -4672,6 +4552,72 @@ def get_user_positions():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _positions_unavailable(is_htmx: bool):
+    """Positions are not known right now (no current snapshot) - not the same as none open."""
+    if is_htmx:
+        response = app.make_response('''
+            <div class="empty-positions">
+                <div class="icon"><i class="fas fa-hourglass-half"></i></div>
+                <div class="text">Positions temporarily unavailable</div>
+            </div>
+            ''')
+    else:
+        response = jsonify({'success': False, 'error': 'Positions temporarily unavailable', 'unavailable': True})
+        response.status_code = 503
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+def _render_positions(positions_data: list, is_htmx: bool):
+    """Positions as an HTML partial (HTMX) or JSON."""
+    if is_htmx:
+        if not positions_data:
+            return '''
+            <div class="empty-positions">
+                <div class="icon"><i class="fas fa-inbox"></i></div>
+                <div class="text">No open positions</div>
+            </div>
+            '''
+        
+        html_parts = []
+        for p in positions_data:
+            pnl_class = 'positive' if p['unrealized_pnl'] >= 0 else 'negative'
+            pnl_sign = '+' if p['unrealized_pnl'] >= 0 else ''
+            side_class = 'long' if p['side'] == 'LONG' else 'short'
+            arrow = 'arrow-trend-up' if p['side'] == 'LONG' else 'arrow-trend-down'
+            symbol = html.escape(p.get('symbol', ''))
+            side_label = html.escape(p.get('side', ''))
+            exchange_label = html.escape(p.get('exchange', '')) if p.get('exchange') else ''
+            
+            html_parts.append(f'''
+            <div class="position-card">
+                <div class="position-info">
+                    <div class="side-badge {side_class}">
+                        <i class="fas fa-{arrow}"></i>
+                    </div>
+                    <div>
+                        <div class="symbol">{symbol}</div>
+                        <div class="details">{side_label} · x{p['leverage']}{' · ' + exchange_label if exchange_label else ''}</div>
+                    </div>
+                </div>
+                <div class="pnl">
+                    <div class="pnl-value {pnl_class}">{pnl_sign}{p['unrealized_pnl']:.2f}$</div>
+                    <div class="entry-price">${p['entry_price']:.4f}</div>
+                </div>
+            </div>
+            ''')
+        
+        return ''.join(html_parts)
+    
+    # Return JSON for non-HTMX requests
+    return jsonify({
+        'success': True,
+        'positions': positions_data,
+        'count': len(positions_data)
+    })
+
+
 @app.route('/api/user_stats', methods=['GET'])
 @login_required
 def get_user_stats():
@@ -4688,30 +4634,18 @@ def get_user_stats():
     delta = period_map.get(period, timedelta(hours=24))
     since = datetime.now(timezone.utc) - delta
     
-    # Get trades for period for current user
-    trades = TradeHistory.query.filter(
-        TradeHistory.close_time >= since,
-        TradeHistory.user_id == current_user.id
-    ).all()
-    
-    total_pnl = sum(t.pnl for t in trades) if trades else 0
-    total_trades = len(trades)
-    winning_trades = len([t for t in trades if t.pnl > 0])
-    
-    # Calculate average ROI
-    avg_roi = sum(t.roi for t in trades) / len(trades) if trades else 0
+    # Current user's trade totals for the period from the daily rollup
+    stats = DailyTradeRollup.totals(current_user.id, since=since)
+    total_pnl = stats['pnl']
+    total_trades = stats['trades']
+    winning_trades = stats['wins']
+    avg_roi = stats['avg_roi']
     
-    # Get balance history for ROI calculation
-    balance_history = BalanceHistory.query.filter(
-        BalanceHistory.timestamp >= since,
-        BalanceHistory.user_id == current_user.id
-    ).order_by(BalanceHistory.timestamp.asc()).all()
-    
-    # Calculate ROI based on starting balance
+    # Calculate ROI from the first and last balance of the period
     period_roi = 0
-    if balance_history and len(balance_history) >= 2:
-        start_balance = balance_history[0].balance
-        end_balance = balance_history[-1].balance
+    balance_change = BalanceHistory.period_change(current_user.id, since)
+    if balance_change:
+        start_balance, end_balance = balance_change
         if start_balance > 0:
             period_roi = ((end_balance - start_balance) / start_balance) * 100
     
@@ -5238,8 +5172,7 @@ def get_gamification_leaderboard():
         limit = min(int(request.args.get('limit', 10)), 50)
 
         cache_key = f"gamification_leaderboard:{limit}"
-        data = get_public_stats_cached(cache_key, lambda: _compute_gamification_leaderboard(limit))
-        return jsonify(data)
+        return cached_json_response(get_public_stats_cached(cache_key, lambda: _compute_gamification_leaderboard(limit)))
     except Exception as e:
         logger.error(f"Error getting gamification leaderboard: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -5322,8 +5255,7 @@ def admin_gamification_stats():
                 'total_achievements_unlocked': UserAchievement.query.count()
             }
         
-        data = get_admin_stats_cached('gamification_stats', _compute_stats)
-        return jsonify(data)
+        return cached_json_response(get_admin_stats_cached('gamification_stats', _compute_stats))
     except Exception as e:
         logger.error(f"Error getting admin gamification stats: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -5415,8 +5347,7 @@ def admin_referral_stats():
                 'pending_requests': pending_requests
             }
         
-        data = get_admin_stats_cached('referral_stats', _compute_stats)
-        return jsonify(data)
+        return cached_json_response(get_admin_stats_cached('referral_stats', _compute_stats))
     except Exception as e:
         logger.error(f"Error getting admin referral stats: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -5484,8 +5415,7 @@ def admin_subscription_stats():
                 'total_users': total_users
             }
         
-        data = get_admin_stats_cached('subscription_stats', _compute_stats)
-        return jsonify(data)
+        return cached_json_response(get_admin_stats_cached('subscription_stats', _compute_stats))
     except Exception as e:
         logger.error(f"Error getting admin subscription stats: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -6296,61 +6226,46 @@ def get_available_payment_networks():
 # ==================== WEBHOOK ====================
 
 # ARQ task queueing helper
-async def enqueue_signal_task(signal: dict) -> str:
+def enqueue_signal_job(signal: dict) -> str:
     """
-    Queue a trading signal to the ARQ worker.
-    Returns job_id on success.
+    Queue a trading signal to the ARQ worker over the shared Redis client.
+    Returns job_id (signal_id when broadcast to shards) on success.
     """
-    try:
-        if not ARQ_REDIS_SETTINGS:
-            logger.warning("ARQ enqueue skipped: ARQ_REDIS_SETTINGS not configured")
-            return None
-        from arq import create_pool
-        pool = await create_pool(ARQ_REDIS_SETTINGS)
-        job = await pool.enqueue_job('execute_signal_task', signal)
-        await pool.close()
-        return job.job_id if job else None
-    except Exception as e:
-        logger.error(f"ARQ enqueue error: {e}")
-        return None
+    # Priority lane: negative defer puts closes ahead of opens ahead of DCA/background
+    defer_by = lane_defer_by(signal.get('lane') or signal_lane(signal))
+    # Sharded workers: broadcast one job per live shard, tied together by signal_id
+    shards = get_live_shards(redis_client)
+    if shards:
+        signal = dict(signal, signal_id=uuid.uuid4().hex)
+        register_signal_broadcast(redis_client, signal['signal_id'], shards)
+        enqueue_arq_job(redis_client, 'execute_signal_task', signal,
+                        queue_names=[shard_queue_name(shard_id) for shard_id in shards], defer_by=defer_by)
+        logger.info(f"🧩 Signal {signal['signal_id']} broadcast to {len(shards)} shards: {shards}")
+        return signal['signal_id']
+    return enqueue_arq_job(redis_client, 'execute_signal_task', signal, defer_by=defer_by)[0]
 
 
 def queue_signal_to_arq(signal: dict) -> tuple:
     """
-    Synchronous wrapper to queue signal via ARQ.
+    Queue signal via ARQ (one pipelined write on the long-lived Redis client,
+    no event loop or ARQ pool per call).
     Returns (success: bool, job_id_or_error: str)
     """
+    if not ARQ_REDIS_SETTINGS:
+        return False, "ARQ_REDIS_SETTINGS not configured"
+    if not redis_client:
+        return False, "Redis not connected"
     try:
-        if not ARQ_REDIS_SETTINGS:
-            return False, "ARQ_REDIS_SETTINGS not configured"
-        import asyncio
-        import concurrent.futures
-
-        def run_in_thread():
-            # Use a separate thread with its own event loop to avoid loop conflicts
-            def run_in_new_loop():
-                new_loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(new_loop)
-                try:
-                    return new_loop.run_until_complete(enqueue_signal_task(signal))
-                finally:
-                    new_loop.close()
-                    asyncio.set_event_loop(None)
-
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(run_in_new_loop)
-                return future.result(timeout=5)
-        
-        # Always execute in a dedicated thread to avoid loop conflicts
-        job_id = run_in_thread()
-        
-        if job_id:
-            return True, job_id
-        return False, "Failed to enqueue job"
+        return True, enqueue_signal_job(signal)
     except Exception as e:
+        logger.error(f"ARQ enqueue error: {e}")
         return False, str(e)
 
 
+# Share of webhooks whose verbose lines (payload, repaired JSON, signal details) are logged
+WEBHOOK_LOG_SAMPLE_RATE = float(os.environ.get('WEBHOOK_LOG_SAMPLE_RATE', '0.05'))
+
+
 @app.route('/webhook', methods=['POST'])
 @validate_webhook
 def webhook():
@@ -6372,63 +6287,56 @@ def webhook():
     ip = get_client_ip()
     
     try:
-        # SECURITY: Don't log raw webhook data in production - may contain passphrase
-        raw_data = request.get_data(as_text=True)
-        if IS_PRODUCTION:
-            logger.info(f"📨 Webhook received from {ip} ({len(raw_data) if raw_data else 0} bytes)")
-        else:
-            # Development only - truncate sensitive data
-            safe_data = raw_data[:100].replace(Config.WEBHOOK_PASSPHRASE, '***') if raw_data else '(empty)'
-            logger.info(f"📨 Webhook from {ip}: {safe_data}...")
-        
-        data = request.get_json(silent=True)
-        
-        if not data:
-            # Try to fix common TradingView JSON issues (trailing commas)
-            if raw_data:
-                try:
-                    # Remove trailing commas before closing brackets/braces
-                    cleaned_data = re.sub(r',(\s*[}\]])', r'\1', raw_data)
-                    data = json.loads(cleaned_data)
-                    logger.info(f"✅ Webhook: Fixed malformed JSON (trailing commas)")
-                except (json.JSONDecodeError, ValueError) as e:
-                    logger.warning(f"Webhook: Data received but not valid JSON: {raw_data[:200]}")
-                    logger.warning(f"JSON parse error: {str(e)}")
-                    return jsonify({'error': 'Невірний формат JSON'}), 400
-            
-            if not data:
-                # Empty request - health check
-                logger.debug("Webhook: Health check ping")
-                return jsonify({'status': 'ok', 'message': 'Webhook active'}), 200
-        
-        logger.info(f"📦 Webhook parsed: {data}")
-        
-        # Verify passphrase (timing-safe comparison)
-        received_pass = data.get('passphrase', '')
-        if not received_pass:
-            received_pass = data.get('secret_key', '') or data.get('secret', '')
-        expected_pass = Config.WEBHOOK_PASSPHRASE
-        if not secrets.compare_digest(str(received_pass), str(expected_pass)):
+        # Body was parsed, authenticated and schema-validated once (validate_webhook)
+        payload = parse_webhook_request()
+        # Verbose logging is sampled so TradingView bursts don't flood the logs
+        verbose = random.random() < WEBHOOK_LOG_SAMPLE_RATE
+        if verbose:
+            # SECURITY: Don't log raw webhook data in production - may contain passphrase
+            raw_data = request.get_data(as_text=True)
+            if IS_PRODUCTION:
+                logger.info(f"📨 Webhook received from {ip} ({len(raw_data) if raw_data else 0} bytes)")
+            else:
+                # Development only - truncate sensitive data
+                safe_data = raw_data[:100].replace(Config.WEBHOOK_PASSPHRASE, '***') if raw_data else '(empty)'
+                logger.info(f"📨 Webhook from {ip}: {safe_data}...")
+        
+        if payload.error == 'invalid_json':
+            logger.warning(f"Webhook: Data received but not valid JSON from {ip}: {payload.detail}")
+            return jsonify({'error': 'Невірний формат JSON'}), 400
+        if payload.repaired and verbose:
+            logger.info(f"✅ Webhook: Fixed malformed JSON (trailing commas)")
+        
+        if not payload.data:
+            # Empty request - health check
+            logger.debug("Webhook: Health check ping")
+            return jsonify({'status': 'ok', 'message': 'Webhook active'}), 200
+        
+        # Passphrase was verified once (timing-safe) while parsing
+        if not payload.authenticated:
             audit.log_security_event("WEBHOOK_AUTH_FAIL", f"IP: {ip}", "WARNING")
             logger.warning(f"Webhook: Invalid passphrase from {ip}")
             return jsonify({'error': 'Неавторизовано'}), 401
         
+        if payload.error == 'invalid_payload':
+            logger.warning(f"Webhook: Invalid payload from {ip}: {payload.detail[:200]}")
+            return jsonify({'error': 'Invalid input'}), 400
+        data = payload.signal
+        
         # Parse and validate signal
-        symbol_value = data.get('symbol')
-        if not symbol_value:
-            symbol_value = data.get('ticker')
+        symbol_value = data.symbol or data.ticker
         raw_symbol_input = str(symbol_value or '').strip()
         # Normalize TradingView symbols like "BINANCE:BTCUSDT.P" -> "BTCUSDT"
-        if ':' in raw_symbol_input:
-            raw_symbol_input = raw_symbol_input.split(':')[-1]
-        raw_symbol = re.sub(r'\.P|\.p|\.S|\.s$', '', raw_symbol_input)
-        raw_symbol = raw_symbol.replace('/', '').replace('-', '').replace('_', '').upper()
+        raw_symbol = normalize_symbol(raw_symbol_input)
         valid, symbol = InputValidator.validate_symbol(raw_symbol)
         if not valid:
             logger.warning(f"Webhook: Invalid symbol '{raw_symbol_input}' from {ip}")
             return jsonify({'error': f'Невірний символ: {symbol}'}), 400
+        if get_symbol_registry().is_listed(symbol) is False:
+            logger.warning(f"Webhook: Symbol '{symbol}' is not listed on Binance Futures (from {ip})")
+            return jsonify({'error': f'Символ не торгується: {symbol}'}), 400
         
-        action = str(data.get('action', 'close')).lower()
+        action = data.action.lower()
         if action in ['buy', 'long']:
             action = 'long'
         elif action in ['sell', 'short']:
@@ -6438,30 +6346,30 @@ def webhook():
             return jsonify({'error': 'Невірна дія'}), 400
         
         # Get TP/SL with proper defaults from global settings
-        tp_val = data.get('tp_perc')
-        sl_val = data.get('sl_perc')
+        tp_val = data.tp_perc
+        sl_val = data.sl_perc
         
         # Use webhook value if provided and > 0, otherwise use global settings
-        if tp_val is not None and float(tp_val) > 0:
-            tp_perc = float(tp_val)
+        if tp_val is not None and tp_val > 0:
+            tp_perc = tp_val
         else:
             tp_perc = float(GLOBAL_TRADE_SETTINGS.get('tp_perc', 5.0))
             
-        if sl_val is not None and float(sl_val) > 0:
-            sl_perc = float(sl_val)
+        if sl_val is not None and sl_val > 0:
+            sl_perc = sl_val
         else:
             sl_perc = float(GLOBAL_TRADE_SETTINGS.get('sl_perc', 2.0))
         
         # Get risk and leverage: use webhook value only if > 0, otherwise use global settings
-        webhook_risk = float(data.get('risk_perc', 0))
-        webhook_leverage = int(data.get('leverage', 0))
+        webhook_risk = data.risk_perc or 0.0
+        webhook_leverage = int(data.leverage or 0)
         
         # For leverage, only use webhook value if it's > 1 (1x leverage is rarely intentional for futures)
         task_leverage = webhook_leverage if webhook_leverage > 1 else GLOBAL_TRADE_SETTINGS['leverage']
         task_risk = webhook_risk if webhook_risk > 0 else GLOBAL_TRADE_SETTINGS['risk_perc']
         
         # Get strategy_id from webhook (optional - defaults to 1 for backward compatibility)
-        strategy_id = data.get('strategy_id')
+        strategy_id = data.strategy_id
         if strategy_id:
             try:
                 strategy_id = int(strategy_id)
@@ -6479,42 +6387,67 @@ def webhook():
             'tp_perc': tp_perc,
             'sl_perc': sl_perc
         }
+        signal['lane'] = signal_lane(signal)
+        
+        # Coalesce duplicate TradingView alerts (same symbol/action/strategy within the window)
+        claim_owner = uuid.uuid4().hex
+        claimed, existing_job_id = claim_signal(redis_client, signal, owner=claim_owner)
+        if not claimed:
+            record_signal_coalesced(signal['lane'])
+            logger.info(f"🔁 Duplicate signal coalesced: {action.upper()} {symbol} (strategy_id={strategy_id}, job_id={existing_job_id})")
+            response = {
+                'status': 'coalesced',
+                'symbol': symbol,
+                'action': action,
+                'strategy_id': strategy_id
+            }
+            if existing_job_id:
+                response['job_id'] = existing_job_id
+            return jsonify(response), 200
         
         logger.info(f"📥 Webhook received: {action.upper()} {symbol} (strategy_id={strategy_id})")
-        logger.info(f"📊 Signal created: Risk={signal['risk']}%, Leverage={signal['lev']}x, TP={signal['tp_perc']}%, SL={signal['sl_perc']}%, Strategy={strategy_id}")
-        logger.info(f"📊 (Webhook values: risk={webhook_risk}%, lev={webhook_leverage}x, using global: {webhook_leverage <= 1})")
+        if verbose:
+            logger.info(f"📊 Signal created: Risk={signal['risk']}%, Leverage={signal['lev']}x, TP={signal['tp_perc']}%, SL={signal['sl_perc']}%, Strategy={strategy_id}")
+            logger.info(f"📊 (Webhook values: risk={webhook_risk}%, lev={webhook_leverage}x, using global: {webhook_leverage <= 1})")
         log_system_event(None, symbol, f"SIGNAL: {action.upper()} (Strategy: {strategy_id}, Risk: {signal['risk']}%, Lev: {signal['lev']}x)")
         
         # Queue the task via ARQ (preferred) or legacy Redis/memory queue
-        queue_mode = 'memory'
-        job_id = None
-        
-        # Use ARQ_REDIS_SETTINGS directly (it's defined at module level)
-        # Check if ARQ is configured
-        if ARQ_REDIS_SETTINGS:
-            # Use ARQ async task queue (preferred)
-            success, result = queue_signal_to_arq(signal)
-            if success:
-                queue_mode = 'arq'
-                job_id = result
-                logger.info(f"✅ Signal queued to ARQ worker: job_id={job_id}")
-            else:
-                # Fallback to legacy Redis queue
-                logger.warning(f"⚠️ ARQ queue failed ({result}), using legacy Redis queue")
-                if redis_client:
-                    redis_client.rpush('trade_signals', json.dumps(signal))
-                    queue_mode = 'redis-legacy'
-                else:
-                    signal_queue.put(signal)
-                    queue_mode = 'memory'
-        elif redis_client:
-            # Legacy Redis queue (for backwards compatibility)
-            redis_client.rpush('trade_signals', json.dumps(signal))
-            queue_mode = 'redis-legacy'
-        else:
-            # In-memory queue (development only)
-            signal_queue.put(signal)
+        try:
             queue_mode = 'memory'
+            job_id = None
+            
+            # Use ARQ_REDIS_SETTINGS directly (it's defined at module level)
+            # Check if ARQ is configured
+            if ARQ_REDIS_SETTINGS:
+                # Use ARQ async task queue (preferred)
+                success, result = queue_signal_to_arq(signal)
+                if success:
+                    queue_mode = 'arq'
+                    job_id = result
+                    logger.info(f"✅ Signal queued to ARQ worker: job_id={job_id}")
+                else:
+                    # Fallback to legacy Redis queue
+                    logger.warning(f"⚠️ ARQ queue failed ({result}), using legacy Redis queue")
+                    if redis_client:
+                        redis_client.rpush('trade_signals', json.dumps(signal))
+                        queue_mode = 'redis-legacy'
+                    else:
+                        signal_queue.put(signal)
+                        queue_mode = 'memory'
+            elif redis_client:
+                # Legacy Redis queue (for backwards compatibility)
+                redis_client.rpush('trade_signals', json.dumps(signal))
+                queue_mode = 'redis-legacy'
+            else:
+                # In-memory queue (development only)
+                signal_queue.put(signal)
+                queue_mode = 'memory'
+        except Exception:
+            # Nothing was queued: free the key so the alert's retry is not coalesced away
+            release_claim(redis_client, signal, claim_owner)
+            raise
+        
+        record_claimed_job(redis_client, signal, job_id)
         
         # Return OK immediately - trading happens in background worker
         response = {
@@ -6534,6 +6467,28 @@ def webhook():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/admin/signals/<signal_id>/status', methods=['GET'])
+@login_required
+def get_signal_broadcast_status(signal_id):
+    """Per-shard completion of a broadcast signal (sharded workers only, admin only)."""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Доступ заборонено'}), 403
+    
+    status = get_signal_status(redis_client, signal_id)
+    if not status['expected'] and not status['reports']:
+        return jsonify({'success': False, 'error': 'Signal not found or expired'}), 404
+    
+    pending = [shard_id for shard_id in status['expected'] if shard_id not in status['reports']]
+    return jsonify({
+        'success': True,
+        'signal_id': signal_id,
+        'complete': status['complete'],
+        'expected_shards': status['expected'],
+        'pending_shards': pending,
+        'reports': status['reports']
+    })
+
+
 # ==================== ADMIN ROUTES ====================
 
 @app.route('/admin/global_settings/update', methods=['POST'])
@@ -6806,6 +6761,8 @@ def delete_user(user_id):
         audit.log_admin_action(current_user.username, "DELETE_USER", username)
         db.session.delete(user)
         db.session.commit()
+        balance_cache.invalidate(user_id)
+        remove_balance_aggregate(user_id)
         engine.load_slaves()
         flash(f'Вузол {username} видалено', 'success')
     
@@ -6934,6 +6891,55 @@ def admin_tasks():
     return render_template('admin_tasks.html')
 
 
+ADMIN_BALANCES_PER_PAGE = 100
+ADMIN_BALANCES_MAX_PER_PAGE = 500
+
+
+def _admin_page_args():
+    """(page, per_page, sort) from the query string, clamped."""
+    page = max(1, request.args.get('page', 1, type=int) or 1)
+    per_page = request.args.get('per_page', ADMIN_BALANCES_PER_PAGE, type=int) or ADMIN_BALANCES_PER_PAGE
+    per_page = min(max(per_page, 1), ADMIN_BALANCES_MAX_PER_PAGE)
+    sort = request.args.get('sort', 'id')
+    return page, per_page, sort if sort in ('id', 'balance') else 'id'
+
+
+def get_admin_user_page(page: int, per_page: int, sort: str = 'id'):
+    """
+    One page of non-admin users and the number of users being paged.
+
+    sort='id' pages in SQL over all non-admin users. sort='balance' pages
+    through the balance rank ZSET and counts its members (users without a
+    known balance are not ranked yet and only appear under sort='id').
+    """
+    base = User.query.filter(User.role != 'admin')
+    offset = (page - 1) * per_page
+    if sort != 'balance':
+        return base.order_by(User.id).offset(offset).limit(per_page).all(), base.count()
+    ranked_ids = get_user_ids_by_balance(offset, per_page)
+    by_id = {user.id: user for user in base.filter(User.id.in_(ranked_ids)).all()} if ranked_ids else {}
+    for uid in ranked_ids:
+        if uid not in by_id:
+            remove_balance_aggregate(uid)  # Deleted or admin: drop the leftover rank entry
+    return [by_id[uid] for uid in ranked_ids if uid in by_id], get_balance_aggregate()['users_with_balance']
+
+
+def get_admin_user_counts() -> dict:
+    """Non-admin user counts by status in one aggregate query."""
+    paused = db.case((User.is_paused.is_(True), 1), else_=0)
+    active = db.case(((User.is_active.is_(True)) & (User.is_paused.isnot(True)), 1), else_=0)
+    inactive = db.case(((User.is_active.isnot(True)) & (User.is_paused.isnot(True)), 1), else_=0)
+    total, paused_count, active_count, inactive_count = db.session.query(
+        db.func.count(User.id), db.func.sum(paused), db.func.sum(active), db.func.sum(inactive)
+    ).filter(User.role != 'admin').one()
+    return {
+        'total': int(total or 0),
+        'paused': int(paused_count or 0),
+        'active': int(active_count or 0),
+        'inactive': int(inactive_count or 0),
+    }
+
+
 @app.route('/admin/overview')
 @login_required
 def admin_overview():
@@ -6941,22 +6947,16 @@ def admin_overview():
     if current_user.role != 'admin':
         abort(403)
 
-    users = User.query.all()
+    page, per_page, sort = _admin_page_args()
+    users, total_users = get_admin_user_page(page, per_page, sort)
+    user_counts = get_admin_user_counts()
+    balances = get_user_exchange_balances_bulk([user.id for user in users], refresh_missing=False)
 
     user_balances = {}
     user_exchange_details = {}
 
     for user in users:
-        if user.role == 'admin':
-            continue
-        
-        exchange_balances = get_user_exchange_balances(
-            user.id,
-            allow_stale=True,
-            allow_sync_fetch=False,
-            refresh_in_background=False
-        )
-        
+        exchange_balances = balances.get(user.id) or {}
         exchanges = exchange_balances.get('exchanges') or []
         if exchanges:
             user_exchange_details[user.id] = exchanges
@@ -7007,6 +7007,12 @@ def admin_overview():
 
     return render_template('admin_overview.html',
                            users=users,
+                           user_counts=user_counts,
+                           balance_aggregate=get_balance_aggregate(),
+                           page=page,
+                           per_page=per_page,
+                           sort=sort,
+                           total_pages=max(1, -(-total_users // per_page)),
                            user_balances=user_balances,
                            user_exchange_details=user_exchange_details,
                            master_balance=m_bal,
@@ -7728,6 +7734,15 @@ def get_chat_history():
             'expires_at': expires_at.isoformat() if expires_at else None
         }), 403
     
+    if not before_id:
+        # Latest page straight from the room's list of serialized entries
+        entries = chat_store.recent(room, limit)
+        if entries is not None:
+            body = b''.join((b'{"success":true,"messages":[', b','.join(entries),
+                             b'],"room":', fast_json.dumps(room),
+                             b',"has_more":', b'true' if len(entries) == limit else b'false', b'}'))
+            return Response(body, mimetype='application/json')
+    
     messages = ChatMessage.get_recent_messages(room, limit, before_id)
     
     return jsonify({
@@ -7777,13 +7792,21 @@ def get_chat_status():
 @app.route('/api/chat/online_users')
 @login_required
 def get_online_users():
-    """Get list of users currently in chat (approximation based on recent activity)"""
+    """Get list of users currently online (socket connect / chat heartbeat presence)"""
     from models import ChatMessage
     from datetime import datetime, timezone, timedelta
     
     # Chat is available to all logged-in users (no subscription required)
     
-    # Get users who sent messages in the last 5 minutes
+    users_list = chat_store.online_users(50)
+    if users_list is not None:
+        return jsonify({
+            'success': True,
+            'online_users': users_list,
+            'count': len(users_list)
+        })
+    
+    # No Redis: approximate with users who sent messages in the last 5 minutes
     recent_threshold = datetime.now(timezone.utc) - timedelta(minutes=5)
     
     recent_users = db.session.query(
@@ -7988,6 +8011,9 @@ def admin_delete_message():
         return jsonify({'error': 'Потрібен ID повідомлення'}), 400
     
     message = ChatMessage.query.get(message_id)
+    if message is None and chat_store.flush():
+        # Possibly still queued for insert
+        message = ChatMessage.query.get(message_id)
     if not message:
         return jsonify({'error': 'Повідомлення не знайдено'}), 404
     
@@ -7995,6 +8021,7 @@ def admin_delete_message():
     message.is_deleted = True
     message.deleted_by_id = current_user.id
     db.session.commit()
+    chat_store.remove(room, message.id)
     
     # Notify chat room
     try:
@@ -8112,6 +8139,7 @@ def list_user_exchanges():
 def get_user_exchange_balances_api():
     """Get balances for all user's connected exchanges"""
     try:
+        note_dashboard_activity(current_user.id)
         balance_data = get_user_exchange_balances(current_user.id)
         return jsonify({
             'success': True,
@@ -8331,6 +8359,7 @@ def delete_user_exchange(exchange_id):
         
         db.session.delete(exchange)
         db.session.commit()
+        balance_cache.invalidate(current_user.id)
         
         logger.info(f"User {current_user.id} deleted exchange {exchange_id}")
         
@@ -9001,6 +9030,7 @@ def admin_delete_user_exchange(exchange_id):
         
         db.session.delete(exchange)
         db.session.commit()
+        balance_cache.invalidate(user_id)
         
         logger.info(f"Admin {current_user.id} deleted exchange {exchange_id} for user {user_id}")
         audit.log_admin_action(current_user.username, "DELETE_USER_EXCHANGE", f"Exchange ID: {exchange_id}, User: {user.username if user else 'Unknown'}")
@@ -9429,24 +9459,39 @@ def admin_get_all_user_balances():
         return jsonify({'error': 'Неавторизовано'}), 403
     
     try:
-        users = User.query.filter(User.role != 'admin').all()
-        
+        user_ids = [int(uid) for uid in request.args.get('user_ids', '').split(',') if uid.strip().isdigit()]
+        if user_ids:
+            # Explicit id list (rows currently on screen): one page, no pagination
+            user_ids = user_ids[:ADMIN_BALANCES_MAX_PER_PAGE]
+            users = User.query.filter(User.id.in_(user_ids), User.role != 'admin').all()
+            page, per_page, total_users = 1, len(user_ids), len(users)
+        else:
+            page, per_page, sort = _admin_page_args()
+            users, total_users = get_admin_user_page(page, per_page, sort)
+
+        balances = get_user_exchange_balances_bulk([user.id for user in users])
         result = []
         for user in users:
-            balance_data = get_user_exchange_balances(user.id)
+            balance_data = balances.get(user.id) or {'total': 0.0, 'exchanges': []}
             result.append({
                 'user_id': user.id,
                 'username': user.username,
                 'first_name': user.first_name,
                 'is_active': user.is_active,
                 'is_paused': user.is_paused,
-                'total_balance': balance_data['total'],
-                'exchanges': balance_data['exchanges']
+                'total_balance': balance_data.get('total') or 0.0,
+                'exchanges': balance_data.get('exchanges') or [],
+                'pending': user.id not in balances
             })
         
         return jsonify({
             'success': True,
-            'users': result
+            'users': result,
+            'page': page,
+            'per_page': per_page,
+            'total_users': total_users,
+            'has_more': page * per_page < total_users,
+            **get_balance_aggregate()
         })
         
     except Exception as e:
@@ -0,0 +1,485 @@
+"""
+Brain Capital - Adaptive Balance Monitor
+
+Async replacement for the per-slave part of TradingEngine.monitor_balances.
+
+Instead of submitting every slave to a thread pool once a minute, each
+account gets its own due time:
+- Accounts are spread evenly across the interval (hash offset + jitter), so
+  2,000 accounts at 60s means ~33 refreshes per second, not a burst.
+- Each exchange has a request budget (token bucket, BALANCE_MONITOR_RATES),
+  so one venue's accounts cannot exhaust its API limits.
+- Accounts whose balance/positions were pushed recently by another path
+  (trade execution, reconnect push) are skipped for that cycle.
+- Users with an open dashboard are refreshed every BALANCE_MONITOR_ACTIVE_INTERVAL
+  seconds; everyone else every BALANCE_MONITOR_INTERVAL seconds.
+- When refreshes fall behind (due times overdue), the cadence stretches
+  up to 4x and relaxes back once the backlog clears.
+
+Works for python-binance and async CCXT accounts. Balance history snapshots
+are written at most once per BALANCE_MONITOR_INTERVAL per account.
+
+The refresh loop runs as a task on the ARQ worker's event loop (started from
+worker startup), the loop that owns the async CCXT clients: ccxt binds a
+client's aiohttp session to the first loop that uses it, so the clients must
+not be driven from a second loop. Only one worker refreshes a given set of
+accounts: the holder of a Redis lease per shard ('all' when unsharded). Web
+workers and the bot never start it; they publish dashboard activity to Redis,
+which the lease holder reads every few seconds.
+
+The last state pushed for each user (all of their accounts merged) is kept in
+memory and in Redis, so Socket.IO connect handlers and /api/positions serve it
+without exchange I/O. Its version is a hash of the positions, usable as an ETag.
+
+Redis Keys Structure:
+- account_state:{user_id} -> JSON {balance, positions, version, updated_at} (TTL = ACCOUNT_STATE_TTL)
+- balance_monitor_leader:{shard_id|all} -> owner id of the process refreshing those accounts (TTL 30s)
+- balance_monitor_active -> ZSET user_id -> dashboard activity expiry (unix)
+
+Configuration (environment):
+- BALANCE_MONITOR_INTERVAL: Base refresh interval in seconds (default 60)
+- BALANCE_MONITOR_ACTIVE_INTERVAL: Interval for users with open dashboards (default 10)
+- BALANCE_MONITOR_RATES: Requests/sec per exchange, e.g. "binance:20,okx:5" (default binance:20, others 5)
+- BALANCE_MONITOR_CONCURRENCY: Max in-flight refreshes (default 20)
+"""
+
+import asyncio
+import hashlib
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("BalanceMonitor")
+
+BALANCE_MONITOR_INTERVAL = float(os.environ.get('BALANCE_MONITOR_INTERVAL', '60'))
+BALANCE_MONITOR_ACTIVE_INTERVAL = float(os.environ.get('BALANCE_MONITOR_ACTIVE_INTERVAL', '10'))
+BALANCE_MONITOR_CONCURRENCY = int(os.environ.get('BALANCE_MONITOR_CONCURRENCY', '20'))
+DEFAULT_RATE = 5.0
+ACTIVE_TTL = 300  # Dashboard activity expires if no disconnect was seen
+MAX_LOAD_FACTOR = 4.0
+REQUESTS_PER_REFRESH = 2  # balance + positions
+ACCOUNT_STATE_PREFIX = 'account_state:'
+ACCOUNT_STATE_TTL = 600
+LOCAL_STATE_MAX_AGE = 5  # In-process copies older than this are checked against Redis
+MONITOR_LEASE_PREFIX = 'balance_monitor_leader:'
+MONITOR_LEASE_TTL = 30
+ACTIVE_USERS_KEY = 'balance_monitor_active'
+SYNC_INTERVAL = 5  # Seconds between account list / lease / activity syncs
+
+# Renew the lease only if this process still owns it
+_RENEW_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _parse_rates(raw: str) -> Dict[str, float]:
+    rates = {'binance': 20.0}
+    for part in (raw or '').split(','):
+        if ':' not in part:
+            continue
+        name, value = part.split(':', 1)
+        try:
+            rates[name.strip().lower()] = float(value)
+        except ValueError:
+            continue
+    return rates
+
+
+BALANCE_MONITOR_RATES = _parse_rates(os.environ.get('BALANCE_MONITOR_RATES', ''))
+
+
+class RateBudget:
+    """Async token bucket: `rate` requests per second, bursts up to one second's worth."""
+
+    def __init__(self, rate: float):
+        self.rate = max(rate, 0.1)
+        self.capacity = max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, cost: float = 1.0):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return
+            await asyncio.sleep((cost - self.tokens) / self.rate)
+
+
+def _account_key(account: dict) -> Tuple[object, int]:
+    return (account['id'], id(account['client']))
+
+
+def _spread_offset(key, interval: float) -> float:
+    digest = hashlib.md5(repr(key).encode('utf-8')).digest()
+    return (int.from_bytes(digest[:4], 'big') / 2 ** 32) * interval
+
+
+def positions_version(positions: list) -> str:
+    """Content hash of a positions list (same value in every process)."""
+    payload = json.dumps(positions, sort_keys=True, default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _parse_balance(balance) -> float:
+    try:
+        return float(str(balance).replace(',', ''))
+    except ValueError:
+        return 0.0
+
+
+class BalanceMonitor:
+    """Spread, rate-budgeted, adaptive refresh of slave balances and positions."""
+
+    def __init__(self, engine, interval: float = None, active_interval: float = None,
+                 concurrency: int = None, rates: Dict[str, float] = None):
+        self.engine = engine
+        self.interval = interval or BALANCE_MONITOR_INTERVAL
+        self.active_interval = active_interval or BALANCE_MONITOR_ACTIVE_INTERVAL
+        self.concurrency = concurrency or BALANCE_MONITOR_CONCURRENCY
+        self.rates = rates or BALANCE_MONITOR_RATES
+        self.load_factor = 1.0
+        self._budgets: Dict[str, RateBudget] = {}
+        self._schedule: List[Tuple[float, Tuple[object, int]]] = []
+        self._accounts: Dict[Tuple[object, int], dict] = {}
+        self._last_refresh: Dict[Tuple[object, int], float] = {}
+        self._last_snapshot: Dict[Tuple[object, int], float] = {}
+        self._active_until: Dict[object, float] = {}
+        self._wake_users = set()
+        self._latest: Dict[object, dict] = {}
+        self._user_accounts: Dict[object, Dict[int, Tuple[str, list]]] = {}
+        self._lock = threading.Lock()
+        self._owner = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+    def _redis(self):
+        return self.engine._get_sync_redis() if self.engine else None
+
+    # ==================== HINTS FROM OTHER PATHS ====================
+
+    def mark_active(self, user_id):
+        """A dashboard for this user is open - refresh on the fast cadence."""
+        until = time.time() + ACTIVE_TTL
+        with self._lock:
+            if user_id not in self._active_until:
+                self._wake_users.add(user_id)  # Refresh now rather than at the slow due time
+            self._active_until[user_id] = until
+        redis_client = self._redis()
+        if redis_client:
+            try:
+                redis_client.zadd(ACTIVE_USERS_KEY, {str(user_id): until})
+            except Exception as e:
+                logger.debug(f"Could not publish dashboard activity for {user_id}: {e}")
+
+    def mark_inactive(self, user_id):
+        with self._lock:
+            self._active_until.pop(user_id, None)
+        redis_client = self._redis()
+        if redis_client:
+            try:
+                redis_client.zrem(ACTIVE_USERS_KEY, str(user_id))
+            except Exception as e:
+                logger.debug(f"Could not clear dashboard activity for {user_id}: {e}")
+
+    def is_active(self, user_id) -> bool:
+        with self._lock:
+            until = self._active_until.get(user_id)
+        return bool(until and until > time.time())
+
+    def mark_fresh(self, user_id, client):
+        """Balance/positions for this account were just pushed by another path."""
+        self._last_refresh[(user_id, id(client))] = time.time()
+
+    # ==================== CACHED STATE ====================
+
+    def remember(self, user_id, balance: str, positions: list, client=None):
+        """Record one account's pushed state and publish the user's merged state (memory + Redis)."""
+        with self._lock:
+            accounts = self._user_accounts.setdefault(user_id, {})
+            accounts[id(client)] = (balance, positions)
+            if len(accounts) == 1:
+                merged = list(positions)
+            else:
+                balance = f"{sum(_parse_balance(b) for b, _ in accounts.values()):,.2f}"
+                merged = [p for _, account_positions in accounts.values() for p in account_positions]
+            state = {'balance': balance, 'positions': merged,
+                     'version': positions_version(merged), 'updated_at': time.time()}
+            self._latest[user_id] = state
+        redis_client = self.engine._get_sync_redis()
+        if redis_client:
+            try:
+                redis_client.set(f"{ACCOUNT_STATE_PREFIX}{user_id}", json.dumps(state, default=str),
+                                 ex=ACCOUNT_STATE_TTL)
+            except Exception as e:
+                logger.debug(f"Could not cache account state for {user_id}: {e}")
+
+    def cached_states(self, user_ids) -> Dict[object, dict]:
+        """
+        Last pushed state per user: recent in-process copies first, one MGET for
+        the rest. An older in-process copy is only served while Redis has
+        nothing newer (another process may have pushed since).
+        """
+        user_ids = list(user_ids)
+        now = time.time()
+        with self._lock:
+            local = {uid: self._latest[uid] for uid in user_ids if uid in self._latest}
+        states = {uid: state for uid, state in local.items() if now - state['updated_at'] <= LOCAL_STATE_MAX_AGE}
+        missing = [uid for uid in user_ids if uid not in states]
+        redis_client = self.engine._get_sync_redis() if missing else None
+        if redis_client:
+            try:
+                raw = redis_client.mget([f"{ACCOUNT_STATE_PREFIX}{uid}" for uid in missing])
+                for uid, payload in zip(missing, raw):
+                    if payload:
+                        shared = json.loads(payload)
+                        if uid not in local or shared.get('updated_at', 0) >= local[uid]['updated_at']:
+                            states[uid] = shared
+            except Exception as e:
+                logger.debug(f"Could not read cached account states: {e}")
+        for uid in missing:
+            if uid not in states and uid in local:
+                states[uid] = local[uid]
+        return states
+
+    def cached_state(self, user_id) -> Optional[dict]:
+        return self.cached_states([user_id]).get(user_id)
+
+    # ==================== SCHEDULING ====================
+
+    def _interval_for(self, account: dict) -> float:
+        base = self.active_interval if self.is_active(account['id']) else self.interval
+        return base * self.load_factor
+
+    def _sync_accounts(self, now: float):
+        """Pick up newly loaded slaves and forget removed ones."""
+        with self.engine.lock:
+            slaves = list(self.engine.slave_clients)
+        current = {_account_key(s): s for s in slaves}
+        for key, account in current.items():
+            if key not in self._accounts:
+                first_due = now + _spread_offset(key, min(self._interval_for(account), self.interval))
+                heapq.heappush(self._schedule, (first_due, key))
+        with self._lock:
+            for user_id, client_id in [k for k in self._accounts if k not in current]:
+                self._user_accounts.get(user_id, {}).pop(client_id, None)
+        self._accounts = current
+
+    def _hold_lease(self) -> bool:
+        """Acquire or renew this shard's monitor lease; without Redis the process runs alone."""
+        redis_client = self._redis()
+        if not redis_client:
+            return True
+        shard = getattr(self.engine, 'shard_membership', None)
+        key = f"{MONITOR_LEASE_PREFIX}{shard.shard_id if shard else 'all'}"
+        try:
+            if redis_client.set(key, self._owner, nx=True, ex=MONITOR_LEASE_TTL):
+                return True
+            return bool(redis_client.eval(_RENEW_LEASE, 1, key, self._owner, MONITOR_LEASE_TTL))
+        except Exception as e:
+            logger.debug(f"Balance monitor lease unavailable: {e}")
+            return False
+
+    def _sync_active_users(self, now: float):
+        """Pick up dashboard activity published by the web workers."""
+        redis_client = self._redis()
+        if not redis_client:
+            return
+        pipe = redis_client.pipeline()
+        pipe.zremrangebyscore(ACTIVE_USERS_KEY, '-inf', now)
+        pipe.zrangebyscore(ACTIVE_USERS_KEY, now, '+inf', withscores=True)
+        _, rows = pipe.execute()
+        active = {}
+        for user_id, until in rows:
+            user_id = user_id.decode('utf-8') if isinstance(user_id, bytes) else str(user_id)
+            active[int(user_id) if user_id.isdigit() else user_id] = until
+        with self._lock:
+            self._wake_users.update(uid for uid in active if uid not in self._active_until)
+            self._active_until = active
+
+    def _budget(self, exchange: str) -> RateBudget:
+        exchange = (exchange or 'binance').lower()
+        budget = self._budgets.get(exchange)
+        if budget is None:
+            budget = RateBudget(self.rates.get(exchange, DEFAULT_RATE))
+            self._budgets[exchange] = budget
+        return budget
+
+    def _adapt(self, lag: float):
+        """Stretch the cadence when refreshes run late, relax it when caught up."""
+        if lag > self.interval * 0.25:
+            self.load_factor = min(MAX_LOAD_FACTOR, self.load_factor * 1.25)
+        elif lag < 1.0 and self.load_factor > 1.0:
+            self.load_factor = max(1.0, self.load_factor * 0.95)
+
+    # ==================== REFRESH ====================
+
+    async def _refresh(self, account: dict, due: float, semaphore: asyncio.Semaphore):
+        key = _account_key(account)
+        async with semaphore:
+            await self._budget(account.get('exchange_type')).acquire(REQUESTS_PER_REFRESH)
+            # Time spent waiting for a slot/budget is the backlog signal
+            self._adapt(time.time() - due)
+            try:
+                balance, positions = await self._fetch(account)
+            except Exception as e:
+                logger.debug(f"Balance refresh failed for {account.get('fullname', key)}: {e}")
+                return
+        self._last_refresh[key] = time.time()
+        self._emit(account, balance, positions)
+        await asyncio.to_thread(self.remember, account['id'], f"{balance:,.2f}", positions, account['client'])
+        if time.time() - self._last_snapshot.get(key, 0) >= self.interval:
+            self._last_snapshot[key] = time.time()
+            await asyncio.to_thread(self._snapshot, account['id'], balance)
+
+    async def _fetch(self, account: dict):
+        client = account['client']
+        exchange_name = account.get('exchange_name')
+        if account.get('is_ccxt') and account.get('is_async'):
+            balance = await client.fetch_balance()
+            total = 0.0
+            for asset in ('USDT', 'USD'):
+                value = (balance.get('total') or {}).get(asset)
+                if value:
+                    total = float(value)
+                    break
+            raw_positions = await self.engine._fetch_ccxt_positions(
+                client, account.get('exchange_type') or exchange_name or 'Unknown'
+            )
+            positions = [p for p in (self.engine._normalize_ccxt_position(pos, exchange_name)
+                                     for pos in raw_positions) if p]
+            return total, positions
+        if account.get('is_ccxt'):
+            raise ValueError("legacy sync CCXT accounts are not monitored")
+
+        def fetch_binance():
+            total = 0.0
+            for b in client.futures_account_balance():
+                if b['asset'] == 'USDT':
+                    total = float(b.get('balance', 0))
+                    break
+            positions = [p for p in (self.engine._normalize_binance_position(pos, exchange_name)
+                                     for pos in client.futures_position_information()) if p]
+            return total, positions
+
+        return await asyncio.to_thread(fetch_binance)
+
+    def _emit(self, account: dict, balance: float, positions: list):
+        socketio = self.engine.socketio
+        if not socketio:
+            return
+        user_id = account['id']
+        try:
+            socketio.emit('update_data', {
+                'balance': f"{balance:,.2f}",
+                'positions': positions
+            }, room=f"user_{user_id}")
+            socketio.emit('agent_update', {
+                'user_id': user_id,
+                'balance': f"{balance:,.2f}",
+                'pos_count': len(positions)
+            }, room="admin_room")
+        except Exception as e:
+            logger.debug(f"Balance push failed for user {user_id}: {e}")
+
+    def _snapshot(self, user_id, balance: float):
+        if balance <= 0:
+            return
+        from models import BalanceHistory, db
+        try:
+            with self.engine.app.app_context():
+                db.session.add(BalanceHistory(user_id=user_id if isinstance(user_id, int) else None,
+                                              balance=balance))
+                db.session.commit()
+        except Exception as e:
+            logger.warning(f"Snapshot error for {user_id}: {e}")
+
+    # ==================== LOOP ====================
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        in_flight = set()
+        last_sync = 0.0
+        leader = False
+        while self._running:
+            now = time.time()
+            if now - last_sync >= SYNC_INTERVAL:
+                last_sync = now
+                was_leader, leader = leader, await asyncio.to_thread(self._hold_lease)
+                if leader != was_leader:
+                    logger.info(f"📈 Balance monitor {'acquired' if leader else 'lost'} its lease")
+                if leader:
+                    try:
+                        self._sync_accounts(now)
+                    except Exception as e:
+                        logger.warning(f"Balance monitor could not read slave accounts: {e}")
+                    try:
+                        await asyncio.to_thread(self._sync_active_users, now)
+                    except Exception as e:
+                        logger.debug(f"Dashboard activity sync failed: {e}")
+                else:
+                    # Another process refreshes these accounts; start from a fresh spread if we take over
+                    self._schedule, self._accounts = [], {}
+            if not leader:
+                await asyncio.sleep(0.2)
+                continue
+            with self._lock:
+                wake, self._wake_users = self._wake_users, set()
+            for key in [k for k in self._accounts if k[0] in wake]:
+                heapq.heappush(self._schedule, (now, key))
+
+            while self._schedule and self._schedule[0][0] <= now:
+                due, key = heapq.heappop(self._schedule)
+                account = self._accounts.get(key)
+                if account is None:
+                    continue  # Account removed
+                interval = self._interval_for(account)
+                heapq.heappush(self._schedule, (now + interval * random.uniform(0.9, 1.1), key))
+                if account.get('is_paused'):
+                    continue
+                if now - self._last_refresh.get(key, 0) < interval / 2:
+                    continue  # Pushed recently by another path
+                task = asyncio.create_task(self._refresh(account, due, semaphore))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+            await asyncio.sleep(0.2)
+
+        for task in list(in_flight):
+            task.cancel()
+
+    async def _main(self):
+        try:
+            await self._run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Balance monitor stopped: {e}")
+
+    async def start(self):
+        """Run the refresh loop on the running loop (the one that owns the async CCXT clients)."""
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._main())
+        logger.info(f"📈 Balance monitor started (interval {self.interval:.0f}s, active {self.active_interval:.0f}s)")
+
+    async def stop(self):
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
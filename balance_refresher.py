@@ -0,0 +1,290 @@
+"""
+Brain Capital - Exchange Balance Refresher
+
+Fetches the per-exchange balances shown on user dashboards and admin pages
+(get_user_exchange_balances) without building a new sync CCXT client per
+fetch.
+
+- One asyncio loop in a background thread owns long-lived async CCXT clients,
+  one per UserExchange, so markets and TLS connections are reused. Clients
+  are rebuilt when credentials change and closed after CLIENT_IDLE_TTL.
+- A user's exchanges are fetched in parallel; at most
+  BALANCE_REFRESH_CONCURRENCY exchange calls run at once across all users.
+- Refreshes are single-flight: in-process by user id, and across gunicorn
+  workers through a Redis lock. A worker that loses the lock skips the fetch;
+  refresh_now() then polls the shared cache for the winner's result until the
+  lock TTL or refresh timeout runs out.
+
+Redis Keys Structure:
+- balance_refresh_lock:{user_id} -> owner id (TTL = BALANCE_REFRESH_LOCK_TTL)
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("BalanceRefresher")
+
+BALANCE_REFRESH_CONCURRENCY = int(os.environ.get('BALANCE_REFRESH_CONCURRENCY', '20'))
+BALANCE_REFRESH_LOCK_TTL = int(os.environ.get('BALANCE_REFRESH_LOCK_TTL', '30'))
+BALANCE_REFRESH_TIMEOUT = float(os.environ.get('BALANCE_REFRESH_TIMEOUT', '20'))
+CLIENT_IDLE_TTL = 900
+PEER_POLL_INTERVAL = 0.1
+LOCK_PREFIX = 'balance_refresh_lock:'
+STABLECOINS = ('USDT', 'USDC', 'BUSD', 'USD')
+
+# Release the lock only if we still own it
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def extract_stable_balance(balance: dict) -> Optional[float]:
+    """USDT balance from a CCXT fetch_balance() result, else the first other stablecoin."""
+    for coin in STABLECOINS:
+        entry = balance.get(coin)
+        if isinstance(entry, dict):
+            value = entry.get('total') or entry.get('free', 0)
+        elif entry is not None:
+            value = entry
+        else:
+            value = (balance.get('total') or {}).get(coin)
+            if value is None:
+                value = (balance.get('free') or {}).get(coin)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _fingerprint(account: dict) -> str:
+    raw = '|'.join(str(account.get(k) or '') for k in ('exchange_name', 'api_key', 'secret', 'password'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ExchangeBalanceRefresher:
+    """
+    Pooled async CCXT balance fetching for user exchanges.
+
+    Usage (web process):
+        refresher = ExchangeBalanceRefresher(load_accounts, on_refresh, redis_client)
+        refresher.request_refresh(user_id)          # fire and forget
+        data = refresher.refresh_now(user_id, read_published)  # wait (for a peer's result too)
+
+    load_accounts(user_id) runs in a worker thread and returns plain dicts:
+    {id, exchange_name, label, status, trading_enabled, api_key, secret, password}.
+    on_refresh(user_id, data) stores the result.
+    """
+
+    def __init__(self, load_accounts: Callable[[int], List[dict]],
+                 on_refresh: Callable[[int, dict], None], redis_client=None,
+                 concurrency: int = None):
+        self.load_accounts = load_accounts
+        self.on_refresh = on_refresh
+        self.redis = redis_client
+        self.concurrency = concurrency or BALANCE_REFRESH_CONCURRENCY
+        self._owner_id = uuid.uuid4().hex
+        self._clients: Dict[object, Tuple[str, object]] = {}
+        self._last_used: Dict[object, float] = {}
+        self._inflight: Dict[int, Future] = {}
+        self._lock = threading.RLock()  # done-callbacks may fire while held
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._started = threading.Event()
+
+    # ==================== PUBLIC API (any thread) ====================
+
+    def request_refresh(self, user_id: int) -> Future:
+        """Schedule a refresh (deduplicated per user); returns a future of the data or None."""
+        self.start()
+        with self._lock:
+            future = self._inflight.get(user_id)
+            if future is None:
+                future = asyncio.run_coroutine_threadsafe(self._refresh_user(user_id), self._loop)
+                self._inflight[user_id] = future
+                future.add_done_callback(lambda _: self._forget(user_id, future))
+            return future
+
+    def refresh_now(self, user_id: int, read_published: Callable[[int], Optional[dict]] = None,
+                    timeout: float = None) -> Optional[dict]:
+        """
+        Refresh and wait; None on timeout. When another worker holds the lock,
+        poll read_published(user_id) for the data it stores, up to the lock TTL
+        or timeout (None if nothing shows up or no read_published is given).
+        """
+        timeout = timeout or BALANCE_REFRESH_TIMEOUT
+        deadline = time.time() + min(timeout, BALANCE_REFRESH_LOCK_TTL)
+        try:
+            data = self.request_refresh(user_id).result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Balance refresh for user {user_id} did not complete: {e}")
+            return None
+        if data is not None or read_published is None:
+            return data
+        while time.time() < deadline:
+            data = read_published(user_id)
+            if data is not None:
+                return data
+            time.sleep(PEER_POLL_INTERVAL)
+        logger.warning(f"Balance refresh for user {user_id} by another worker did not publish in time")
+        return None
+
+    def _forget(self, user_id: int, future: Future):
+        with self._lock:
+            if self._inflight.get(user_id) is future:
+                self._inflight.pop(user_id, None)
+
+    # ==================== CROSS-WORKER SINGLE FLIGHT ====================
+
+    def _acquire(self, user_id: int) -> bool:
+        if not self.redis:
+            return True
+        try:
+            return bool(self.redis.set(f"{LOCK_PREFIX}{user_id}", self._owner_id,
+                                       nx=True, ex=BALANCE_REFRESH_LOCK_TTL))
+        except Exception as e:
+            logger.debug(f"Balance refresh lock unavailable, refreshing locally: {e}")
+            return True
+
+    def _release(self, user_id: int):
+        if not self.redis:
+            return
+        try:
+            self.redis.eval(_RELEASE_LOCK, 1, f"{LOCK_PREFIX}{user_id}", self._owner_id)
+        except Exception as e:
+            logger.debug(f"Could not release balance refresh lock for {user_id}: {e}")
+
+    # ==================== REFRESH ====================
+
+    async def _refresh_user(self, user_id: int) -> Optional[dict]:
+        if not await asyncio.to_thread(self._acquire, user_id):
+            return None
+        try:
+            accounts = await asyncio.to_thread(self.load_accounts, user_id)
+            exchanges = await asyncio.gather(*(self._fetch_account(user_id, a) for a in accounts))
+            data = {
+                'total': float(sum(e['balance'] for e in exchanges if e['balance'] is not None)),
+                'exchanges': list(exchanges),
+            }
+            await asyncio.to_thread(self.on_refresh, user_id, data)
+            return data
+        finally:
+            await asyncio.to_thread(self._release, user_id)
+
+    async def _fetch_account(self, user_id: int, account: dict) -> dict:
+        import ccxt.async_support as ccxt_async
+
+        info = {
+            'id': account['id'],
+            'exchange_name': account['exchange_name'],
+            'label': account.get('label') or account['exchange_name'],
+            'balance': None,
+            'status': account.get('status'),
+            'trading_enabled': account.get('trading_enabled'),
+            'error': None
+        }
+        # Only fetch balance if exchange is approved and has valid credentials
+        if account.get('status') != 'APPROVED' or not account.get('api_key') or not account.get('secret'):
+            return info
+        try:
+            client = self._client_for(account)
+            if client is None:
+                info['error'] = f"Exchange {account['exchange_name']} not supported"
+                return info
+            async with self._semaphore:
+                balance = await client.fetch_balance()
+            info['balance'] = extract_stable_balance(balance)
+        except ccxt_async.AuthenticationError as e:
+            info['error'] = "Authentication failed"
+            logger.warning(f"Auth error fetching balance for user {user_id} on {account['exchange_name']}: {e}")
+        except ccxt_async.NetworkError as e:
+            info['error'] = "Network error"
+            logger.warning(f"Network error fetching balance for user {user_id} on {account['exchange_name']}: {e}")
+        except Exception as e:
+            info['error'] = str(e)[:50]
+            logger.warning(f"Error fetching balance for user {user_id} on {account['exchange_name']}: {e}")
+        return info
+
+    # ==================== CLIENT POOL ====================
+
+    def _client_for(self, account: dict):
+        """Long-lived async client for a UserExchange (rebuilt if credentials changed)."""
+        import ccxt.async_support as ccxt_async
+        from service_validator import SUPPORTED_EXCHANGES
+
+        key = account['id']
+        fingerprint = _fingerprint(account)
+        self._last_used[key] = time.time()
+        pooled = self._clients.get(key)
+        if pooled and pooled[0] == fingerprint:
+            return pooled[1]
+        if pooled:
+            asyncio.ensure_future(self._close(pooled[1]))
+
+        name = account['exchange_name'].lower()
+        exchange_class = getattr(ccxt_async, SUPPORTED_EXCHANGES.get(name, name), None)
+        if exchange_class is None:
+            return None
+        config = {
+            'apiKey': account['api_key'],
+            'secret': account['secret'],
+            'enableRateLimit': True,
+            'options': {
+                # Align with trading engine defaults for perpetual futures
+                'defaultType': 'swap',
+                'forcePublicIPv4': True,
+            }
+        }
+        if account.get('password'):
+            config['password'] = account['password']
+        client = exchange_class(config)
+        self._clients[key] = (fingerprint, client)
+        return client
+
+    @staticmethod
+    async def _close(client):
+        try:
+            await client.close()
+        except Exception as e:
+            logger.debug(f"Error closing exchange client: {e}")
+
+    async def _evict_idle(self):
+        while True:
+            await asyncio.sleep(60)
+            cutoff = time.time() - CLIENT_IDLE_TTL
+            for key in [k for k, used in self._last_used.items() if used < cutoff]:
+                self._last_used.pop(key, None)
+                pooled = self._clients.pop(key, None)
+                if pooled:
+                    await self._close(pooled[1])
+
+    # ==================== LIFECYCLE ====================
+
+    def start(self):
+        if self._started.is_set():
+            return
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._thread_main, daemon=True, name="BalanceRefresher").start()
+        self._started.wait()
+
+    def _thread_main(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._loop.create_task(self._evict_idle())
+        self._started.set()
+        logger.info(f"💰 Balance refresher started (concurrency {self.concurrency})")
+        self._loop.run_forever()
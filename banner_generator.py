@@ -607,22 +607,16 @@ def get_platform_top_apy() -> float:
 def get_user_trading_stats(user_id: int) -> dict:
     """Get user's trading statistics for banner generation"""
     try:
-        from models import db, TradeHistory, User
-        from sqlalchemy import func
+        from models import DailyTradeRollup, User
         
         user = User.query.get(user_id)
         if not user:
             return {'total_pnl': 0, 'total_roi': 0}
         
-        # Get total PnL
-        total_pnl = db.session.query(
-            func.coalesce(func.sum(TradeHistory.pnl), 0.0)
-        ).filter(TradeHistory.user_id == user_id).scalar() or 0
-        
-        # Get average ROI
-        avg_roi = db.session.query(
-            func.coalesce(func.avg(TradeHistory.roi), 0.0)
-        ).filter(TradeHistory.user_id == user_id).scalar() or 0
+        # Total PnL and average ROI from the daily rollup
+        stats = DailyTradeRollup.totals(user_id)
+        total_pnl = stats['pnl']
+        avg_roi = stats['avg_roi']
         
         return {
             'total_pnl': float(total_pnl),
@@ -0,0 +1,462 @@
+"""
+Brain Capital - Two-Tier Cache
+
+One cache component for the web process, replacing the hand-rolled balance,
+admin-stats and public-stats caches.
+
+- L1: in-process LRU (bounded by max_entries). An L1 entry is trusted for at
+  most l1_ttl seconds before L2 is consulted again, so values written by other
+  gunicorn workers become visible quickly while hot keys skip Redis.
+- L2: Redis, shared by every worker. Values are stored with their write time
+  and kept until stale_ttl so a stale value can still be served.
+- Serialized caches (serialized=True) hold CachedPayload objects: the JSON
+  body encoded once by fast_json plus its ETag. Hits are served without
+  decoding or re-encoding.
+- Single flight: one in-process future per key plus a Redis lock per key, so
+  only one worker in the cluster recomputes an expired value. Losers wait
+  briefly for the winner's result and fall back to computing it themselves.
+- Stale-while-revalidate: a stale value is returned immediately and refreshed
+  on a bounded thread pool shared by all caches.
+- Tags: set(..., tags=[...]) indexes a key under tags; invalidate_tag() drops
+  every key with that tag from L2 and the local L1. Other workers drop their
+  L1 copy at its next L2 recheck (within l1_ttl) when the key is gone from L2.
+- Metrics: per-cache hit/miss/stale counters and refresh latency, in
+  cache.stats and in Prometheus (cache_requests_total,
+  cache_refresh_seconds) when prometheus_client is available.
+
+Usage:
+    cache = TwoTierCache('public_stats', redis_client, ttl=60,
+                         context_factory=app.app_context)
+    data = cache.get('leaderboard', compute_leaderboard)
+
+Redis Keys Structure:
+- cache:{name}:{key} -> b"{written_at} [{etag}]\n" + JSON body (TTL = stale_ttl)
+- cache_lock:{name}:{key} -> owner id (TTL = lock_ttl)
+- cache_tag:{name}:{tag} -> SET of keys
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, List, Optional
+
+import fast_json
+
+logger = logging.getLogger("Cache")
+
+CACHE_L1_MAX_ENTRIES = int(os.environ.get('CACHE_L1_MAX_ENTRIES', '2000'))
+CACHE_L1_TTL = float(os.environ.get('CACHE_L1_TTL', '5'))
+CACHE_REFRESH_WORKERS = int(os.environ.get('CACHE_REFRESH_WORKERS', '4'))
+CACHE_LOCK_TTL = 30
+CACHE_LOCK_WAIT = 5.0
+
+# Release the lock only if we still own it
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_refresh_pool: Optional[ThreadPoolExecutor] = None
+_refresh_pool_lock = threading.Lock()
+
+
+def _get_refresh_pool() -> ThreadPoolExecutor:
+    """Bounded pool shared by every cache for background revalidation."""
+    global _refresh_pool
+    if _refresh_pool is None:
+        with _refresh_pool_lock:
+            if _refresh_pool is None:
+                _refresh_pool = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS,
+                                                   thread_name_prefix="CacheRefresh")
+    return _refresh_pool
+
+
+_metrics = None
+
+
+def _observe(cache: str, result: str = None, refresh_seconds: float = None):
+    """Forward to Prometheus; resolved once, a no-op when metrics are unavailable."""
+    global _metrics
+    if _metrics is None:
+        try:
+            from metrics import record_cache_request, record_cache_refresh
+            _metrics = (record_cache_request, record_cache_refresh)
+        except ImportError:
+            _metrics = ()
+    if not _metrics:
+        return
+    if result:
+        _metrics[0](cache, result)
+    if refresh_seconds is not None:
+        _metrics[1](cache, refresh_seconds)
+
+
+class CachedPayload:
+    """A JSON body serialized once, with its ETag."""
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, body: bytes, etag: str = None):
+        self.body = body
+        self.etag = etag or hashlib.blake2b(body, digest_size=12).hexdigest()
+
+    @classmethod
+    def of(cls, value) -> "CachedPayload":
+        return value if isinstance(value, cls) else cls(fast_json.dumps(value))
+
+    def value(self):
+        """Decoded body (for callers that need the data, not the bytes)."""
+        return fast_json.loads(self.body)
+
+
+class _Entry:
+    __slots__ = ('value', 'written_at', 'checked_at')
+
+    def __init__(self, value, written_at: float, checked_at: float):
+        self.value = value
+        self.written_at = written_at
+        self.checked_at = checked_at
+
+
+class TwoTierCache:
+    """In-process LRU over Redis with single-flight and stale-while-revalidate."""
+
+    def __init__(self, name: str, redis_client=None, ttl: float = 60, stale_ttl: float = None,
+                 max_entries: int = None, l1_ttl: float = None,
+                 context_factory: Callable = None, lock_ttl: int = None, serialized: bool = False):
+        self.name = name
+        self.serialized = serialized
+        self.redis = redis_client
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl if stale_ttl is not None else ttl * 10
+        self.max_entries = max_entries or CACHE_L1_MAX_ENTRIES
+        self.l1_ttl = l1_ttl if l1_ttl is not None else CACHE_L1_TTL
+        self.context_factory = context_factory
+        self.lock_ttl = lock_ttl or CACHE_LOCK_TTL
+        self._owner_id = uuid.uuid4().hex
+        self._l1: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.RLock()
+        self.stats = {'hit_l1': 0, 'hit_l2': 0, 'stale': 0, 'miss': 0, 'refreshes': 0,
+                      'refresh_errors': 0, 'refresh_seconds': 0.0, 'evictions': 0}
+
+    # ==================== READ ====================
+
+    def get(self, key, compute_fn: Callable = None, allow_stale: bool = True, ttl: float = None,
+            tags: Iterable[str] = (), background_only: bool = False):
+        """
+        Cached value for key.
+
+        Fresh values are returned as is. Stale values (older than ttl, within
+        stale_ttl) are returned when allow_stale, with a background refresh.
+        On a miss compute_fn runs (single-flight) unless background_only, in
+        which case a refresh is scheduled and None is returned.
+        """
+        key = str(key)
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        entry = self._read(key, now)
+
+        if entry is not None:
+            age = now - entry.written_at
+            if age <= ttl:
+                return entry.value
+            if allow_stale and age <= self.stale_ttl:
+                self._count('stale')
+                if compute_fn is not None:
+                    self.refresh_async(key, compute_fn, ttl, tags)
+                return entry.value
+
+        self._count('miss')
+        if compute_fn is None:
+            return None
+        if background_only:
+            self.refresh_async(key, compute_fn, ttl, tags)
+            return None
+
+        # Compute in the caller's thread (and request context); concurrent callers share it
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            return future.result(timeout=self.lock_ttl)
+        try:
+            value = self._refresh(key, compute_fn, ttl, tags, wait_for_peer=True, in_context=True)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._forget(key, future)
+
+    def get_many(self, keys: Iterable) -> dict:
+        """{key: value} for keys cached and not past stale_ttl: L1 first, then one MGET."""
+        keys = [str(k) for k in keys]
+        now = time.time()
+        result, missing = {}, []
+        with self._lock:
+            for key in keys:
+                entry = self._l1.get(key)
+                if entry is not None and now - entry.checked_at <= self.l1_ttl:
+                    self._l1.move_to_end(key)
+                    result[key] = entry.value
+                    self._count('hit_l1')
+                else:
+                    missing.append(key)
+        if missing and self.redis:
+            try:
+                raw_values = self.redis.mget([self._redis_key(k) for k in missing])
+            except Exception as e:
+                logger.debug(f"[{self.name}] L2 read failed: {e}")
+                raw_values = [None] * len(missing)
+            for key, raw in zip(missing, raw_values):
+                entry = self._decode(raw, now)
+                if entry is not None:
+                    self._store_l1(key, entry)
+                    result[key] = entry.value
+                    self._count('hit_l2')
+        elif missing:
+            with self._lock:
+                for key in missing:
+                    entry = self._l1.get(key)
+                    if entry is not None:
+                        result[key] = entry.value
+                        self._count('hit_l1')
+        for key in keys:
+            if key not in result:
+                self._count('miss')
+        return {key: result[key] for key in keys if key in result}
+
+    def peek(self, key):
+        """Cached value regardless of age, without computing or counting."""
+        entry = self._read(str(key), time.time(), count=False)
+        return entry.value if entry is not None else None
+
+    def age(self, key) -> Optional[float]:
+        """Seconds since the cached value was written, or None if not cached."""
+        entry = self._read(str(key), time.time(), count=False)
+        return time.time() - entry.written_at if entry is not None else None
+
+    def local_items(self) -> List[tuple]:
+        """(key, value) pairs currently in this process's L1."""
+        with self._lock:
+            return [(key, entry.value) for key, entry in self._l1.items()]
+
+    def _read(self, key: str, now: float, count: bool = True) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is not None:
+                self._l1.move_to_end(key)
+                if now - entry.checked_at <= self.l1_ttl or not self.redis:
+                    if count:
+                        self._count('hit_l1')
+                    return entry
+
+        # L1 missing or due for a recheck: another worker may hold a newer value
+        remote = self._read_l2(key, now, default=entry)
+        if remote is None:
+            # Gone from L2 (invalidated or expired elsewhere): the L1 copy is a miss too
+            if entry is not None:
+                with self._lock:
+                    if self._l1.get(key) is entry:
+                        del self._l1[key]
+            return None
+        if remote is not entry and (entry is None or remote.written_at >= entry.written_at):
+            self._store_l1(key, remote)
+            if count:
+                self._count('hit_l2')
+            return remote
+        if entry is not None:
+            entry.checked_at = now
+            if count:
+                self._count('hit_l1')
+        return entry
+
+    def _read_l2(self, key: str, now: float, default: Optional[_Entry] = None) -> Optional[_Entry]:
+        """L2 entry for key, None if absent, default if Redis is unavailable."""
+        if not self.redis:
+            return default
+        try:
+            return self._decode(self.redis.get(self._redis_key(key)), now)
+        except Exception as e:
+            logger.debug(f"[{self.name}] L2 read failed for {key}: {e}")
+            return default
+
+    def _encode(self, value, written_at: float) -> bytes:
+        if isinstance(value, CachedPayload):
+            return f"{written_at!r} {value.etag}\n".encode() + value.body
+        return f"{written_at!r}\n".encode() + fast_json.dumps(value)
+
+    def _decode(self, raw, now: float) -> Optional[_Entry]:
+        if not raw:
+            return None
+        try:
+            if isinstance(raw, str):
+                raw = raw.encode('utf-8')
+            header, body = raw.split(b'\n', 1)
+            fields = header.split()
+            if self.serialized:
+                value = CachedPayload(body, fields[1].decode() if len(fields) > 1 else None)
+            else:
+                value = fast_json.loads(body)
+            return _Entry(value, float(fields[0]), now)
+        except (ValueError, IndexError, TypeError):
+            return None
+
+    # ==================== WRITE ====================
+
+    def set(self, key, value, tags: Iterable[str] = ()):
+        """Store a value in L1 and L2 (written now); returns the stored value (a CachedPayload if serialized)."""
+        key = str(key)
+        now = time.time()
+        if self.serialized:
+            value = CachedPayload.of(value)
+        self._store_l1(key, _Entry(value, now, now))
+        tags = list(tags or ())
+        with self._lock:
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+        if not self.redis:
+            return value
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(self._redis_key(key), self._encode(value, now), ex=max(1, int(self.stale_ttl)))
+            for tag in tags:
+                pipe.sadd(self._tag_key(tag), key)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"[{self.name}] L2 write failed for {key}: {e}")
+        return value
+
+    def _store_l1(self, key: str, entry: _Entry):
+        with self._lock:
+            self._l1[key] = entry
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.max_entries:
+                evicted, _ = self._l1.popitem(last=False)
+                for keys in self._tags.values():
+                    keys.discard(evicted)
+                self.stats['evictions'] += 1
+
+    # ==================== INVALIDATION ====================
+
+    def invalidate(self, key):
+        key = str(key)
+        with self._lock:
+            self._l1.pop(key, None)
+        if self.redis:
+            try:
+                self.redis.delete(self._redis_key(key))
+            except Exception as e:
+                logger.debug(f"[{self.name}] L2 delete failed for {key}: {e}")
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Drop every key stored under tag; returns the number of keys dropped."""
+        with self._lock:
+            keys = set(self._tags.pop(tag, set()))
+        if self.redis:
+            try:
+                keys |= {k.decode() if isinstance(k, bytes) else k
+                         for k in self.redis.smembers(self._tag_key(tag))}
+                pipe = self.redis.pipeline(transaction=False)
+                for key in keys:
+                    pipe.delete(self._redis_key(key))
+                pipe.delete(self._tag_key(tag))
+                pipe.execute()
+            except Exception as e:
+                logger.debug(f"[{self.name}] Tag invalidation failed for {tag}: {e}")
+        with self._lock:
+            for key in keys:
+                self._l1.pop(key, None)
+        return len(keys)
+
+    # ==================== REFRESH ====================
+
+    def refresh_async(self, key, compute_fn: Callable, ttl: float = None, tags: Iterable[str] = ()) -> Future:
+        """Schedule a refresh on the shared pool (deduplicated per key)."""
+        key = str(key)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = _get_refresh_pool().submit(self._refresh, key, compute_fn, ttl, tags, False)
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _forget(self, key: str, future: Future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                self._inflight.pop(key, None)
+
+    def _refresh(self, key: str, compute_fn: Callable, ttl: float, tags, wait_for_peer: bool,
+                 in_context: bool = False):
+        if not self._acquire(key):
+            # Another worker is computing this key
+            if not wait_for_peer:
+                return None
+            deadline = time.time() + CACHE_LOCK_WAIT
+            while time.time() < deadline:
+                time.sleep(0.05)
+                entry = self._read_l2(key, time.time())
+                if entry is not None and time.time() - entry.written_at <= (self.ttl if ttl is None else ttl):
+                    self._store_l1(key, entry)
+                    return entry.value
+        started = time.time()
+        try:
+            with (self.context_factory() if self.context_factory and not in_context else nullcontext()):
+                value = compute_fn()
+            return self.set(key, value, tags)
+        except Exception:
+            self.stats['refresh_errors'] += 1
+            raise
+        finally:
+            elapsed = time.time() - started
+            self.stats['refreshes'] += 1
+            self.stats['refresh_seconds'] += elapsed
+            _observe(self.name, refresh_seconds=elapsed)
+            self._release(key)
+
+    def _acquire(self, key: str) -> bool:
+        if not self.redis:
+            return True
+        try:
+            return bool(self.redis.set(self._lock_key(key), self._owner_id, nx=True, ex=self.lock_ttl))
+        except Exception as e:
+            logger.debug(f"[{self.name}] Lock unavailable for {key}, computing locally: {e}")
+            return True
+
+    def _release(self, key: str):
+        if not self.redis:
+            return
+        try:
+            self.redis.eval(_RELEASE_LOCK, 1, self._lock_key(key), self._owner_id)
+        except Exception as e:
+            logger.debug(f"[{self.name}] Could not release lock for {key}: {e}")
+
+    # ==================== HELPERS ====================
+
+    def _count(self, result: str):
+        self.stats[result] += 1
+        _observe(self.name, result=result)
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}"
+
+    def _lock_key(self, key: str) -> str:
+        return f"cache_lock:{self.name}:{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"cache_tag:{self.name}:{tag}"
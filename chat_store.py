@@ -0,0 +1,371 @@
+"""
+Brain Capital - Chat Store
+
+Recent chat history, write-behind persistence and online presence in Redis,
+so socket handlers never wait on the database.
+
+- Each room keeps its last CHAT_RECENT_SIZE messages in a capped list of
+  pre-serialized entries (the ChatMessage.to_dict() shape). Joins and history
+  polls read the list; the database is only read for a cold room or when
+  paging further back. A room is cold until its "loaded" marker is set, so a
+  list holding only messages posted since a Redis restart is still warmed.
+- post() takes the message id from a Redis counter kept ahead of the table,
+  warms a cold room, pushes the entry to the room list and queues the row, so
+  the caller can broadcast immediately. A flusher thread in every web process inserts queued
+  rows in batches (up to CHAT_FLUSH_BATCH every CHAT_FLUSH_INTERVAL seconds).
+- Presence is a sorted set of user id -> last seen, updated on socket connect
+  and on the chat client's heartbeat.
+- Without Redis every call falls back to direct database reads and writes.
+
+Redis Keys Structure:
+- chat_recent:{room} -> LIST of JSON entries, newest first (capped)
+- chat_recent_warm:{room} -> lock while a cold room is loaded from the DB (TTL 10s)
+- chat_recent_loaded:{room} -> set once the room list holds the DB history
+- chat_pending -> LIST of JSON rows waiting to be inserted
+- chat_message_id -> counter for message ids
+- chat_online -> ZSET user_id -> last seen timestamp
+- chat_online_profiles -> HASH user_id -> JSON {username, avatar, avatar_type, is_admin}
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+import fast_json
+
+logger = logging.getLogger("ChatStore")
+
+CHAT_RECENT_SIZE = int(os.environ.get('CHAT_RECENT_SIZE', '100'))
+CHAT_FLUSH_INTERVAL = float(os.environ.get('CHAT_FLUSH_INTERVAL', '1.0'))
+CHAT_FLUSH_BATCH = int(os.environ.get('CHAT_FLUSH_BATCH', '200'))
+CHAT_ONLINE_WINDOW = 300
+RECENT_PREFIX = 'chat_recent:'
+WARM_PREFIX = 'chat_recent_warm:'
+LOADED_PREFIX = 'chat_recent_loaded:'
+PENDING_KEY = 'chat_pending'
+MESSAGE_ID_KEY = 'chat_message_id'
+ONLINE_KEY = 'chat_online'
+ONLINE_PROFILES_KEY = 'chat_online_profiles'
+
+# Move the id counter forward to at least ARGV[1] (never backwards)
+_RAISE_MESSAGE_ID = """
+local current = tonumber(redis.call('get', KEYS[1]) or '0')
+if current < tonumber(ARGV[1]) then
+    redis.call('set', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+
+def mask_username(username: str) -> str:
+    """First and last character with the middle masked (whale alerts)."""
+    if len(username) > 3:
+        return username[0] + '*' * (len(username) - 2) + username[-1]
+    return username
+
+
+def message_entry(message_id: int, user, room: str, message: str, message_type: str,
+                  created_at: datetime, extra_data: dict = None) -> dict:
+    """Chat message as sent to clients; same shape as ChatMessage.to_dict()."""
+    display_name = user.username if user else 'Unknown'
+    return {
+        'id': message_id,
+        'user_id': user.id if user else None,
+        'username': display_name,
+        'masked_username': mask_username(display_name),
+        'avatar': user.avatar if user else '🤖',
+        'avatar_type': user.avatar_type if user else 'emoji',
+        'room': room,
+        'message': message,
+        'message_type': message_type,
+        'extra_data': extra_data,
+        'is_deleted': False,
+        'created_at': created_at.isoformat(),
+        'timestamp': created_at.strftime('%H:%M'),
+    }
+
+
+class ChatStore:
+    """Redis-backed chat history, batched persistence and presence."""
+
+    def __init__(self, redis_client=None, context_factory: Callable = None):
+        self.redis = redis_client
+        self.context_factory = context_factory
+        self._ids_seeded = False
+        self._flusher_started = False
+        self._lock = threading.Lock()
+
+    # ==================== MESSAGES ====================
+
+    def post(self, user, room: str, message: str, message_type: str = 'user',
+             extra_data: dict = None) -> dict:
+        """Record a message and return its entry; the row is persisted in the background."""
+        if not self.redis:
+            return self._insert_now(user, room, message, message_type, extra_data)
+        try:
+            self._seed_message_ids()
+            message_id = int(self.redis.incr(MESSAGE_ID_KEY))
+        except Exception as e:
+            logger.warning(f"Chat id allocation failed, writing message directly: {e}")
+            self._ids_seeded = False
+            return self._insert_now(user, room, message, message_type, extra_data)
+
+        created_at = datetime.now(timezone.utc)
+        entry = message_entry(message_id, user, room, message, message_type, created_at, extra_data)
+        row = {
+            'id': message_id,
+            'user_id': user.id,
+            'room': room,
+            'message': message,
+            'message_type': message_type,
+            'extra_data': extra_data,
+            'created_at': entry['created_at'],
+        }
+        try:
+            if not self.redis.exists(f"{LOADED_PREFIX}{room}"):
+                self._warm(room)
+        except Exception as e:
+            logger.debug(f"Chat history warm failed for {room}: {e}")
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lpush(f"{RECENT_PREFIX}{room}", fast_json.dumps(entry))
+        pipe.ltrim(f"{RECENT_PREFIX}{room}", 0, CHAT_RECENT_SIZE - 1)
+        pipe.rpush(PENDING_KEY, fast_json.dumps(row))
+        pipe.execute()
+        self.start()
+        return entry
+
+    def _insert_now(self, user, room, message, message_type, extra_data) -> dict:
+        from models import db, ChatMessage
+
+        chat_msg = ChatMessage(user_id=user.id, room=room, message=message,
+                               message_type=message_type, extra_data=extra_data)
+        db.session.add(chat_msg)
+        db.session.commit()
+        return chat_msg.to_dict()
+
+    def _seed_message_ids(self):
+        """Keep the id counter at or above the table's max id (once per process)."""
+        if self._ids_seeded:
+            return
+        from models import db, ChatMessage
+
+        max_id = db.session.query(db.func.max(ChatMessage.id)).scalar() or 0
+        self.redis.eval(_RAISE_MESSAGE_ID, 1, MESSAGE_ID_KEY, max_id)
+        self._ids_seeded = True
+
+    def recent(self, room: str, limit: int) -> Optional[List[bytes]]:
+        """Up to limit serialized entries, oldest first; None when Redis can't serve it."""
+        if not self.redis:
+            return None
+        key = f"{RECENT_PREFIX}{room}"
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.exists(f"{LOADED_PREFIX}{room}")
+            pipe.lrange(key, 0, limit - 1)
+            loaded, raw = pipe.execute()
+            if not loaded:
+                # Cold room: read the database this once
+                if not self._warm(room):
+                    return None
+                raw = self.redis.lrange(key, 0, limit - 1)
+            return list(reversed(raw))
+        except Exception as e:
+            logger.debug(f"Chat history read failed for {room}: {e}")
+            return None
+
+    def recent_messages(self, room: str, limit: int) -> List[dict]:
+        """Recent messages as dicts, oldest first (falls back to the database)."""
+        raw = self.recent(room, limit)
+        if raw is not None:
+            return [fast_json.loads(entry) for entry in raw]
+        from models import ChatMessage
+
+        return [msg.to_dict() for msg in reversed(ChatMessage.get_recent_messages(room, limit=limit))]
+
+    def _warm(self, room: str) -> bool:
+        """
+        Load a cold room's recent messages from the database and mark it loaded
+        (one loader per room). False while another process is loading it.
+        """
+        from models import ChatMessage
+
+        if not self.redis.set(f"{WARM_PREFIX}{room}", 1, nx=True, ex=10):
+            return False
+        key = f"{RECENT_PREFIX}{room}"
+        messages = ChatMessage.get_recent_messages(room, limit=CHAT_RECENT_SIZE)
+        # Messages posted meanwhile may already be flushed to the table
+        listed = {fast_json.loads(raw).get('id') for raw in self.redis.lrange(key, 0, -1)}
+        entries = [fast_json.dumps(m.to_dict()) for m in messages if m.id not in listed]
+        pipe = self.redis.pipeline(transaction=False)
+        if entries:
+            # Newest first, appended behind anything posted meanwhile
+            pipe.rpush(key, *entries)
+            pipe.ltrim(key, 0, CHAT_RECENT_SIZE - 1)
+        pipe.set(f"{LOADED_PREFIX}{room}", 1)
+        pipe.delete(f"{WARM_PREFIX}{room}")
+        pipe.execute()
+        return True
+
+    def remove(self, room: str, message_id: int):
+        """Drop a deleted message from the room's recent list."""
+        if not self.redis:
+            return
+        key = f"{RECENT_PREFIX}{room}"
+        try:
+            for raw in self.redis.lrange(key, 0, -1):
+                if fast_json.loads(raw).get('id') == message_id:
+                    self.redis.lrem(key, 1, raw)
+                    break
+        except Exception as e:
+            logger.debug(f"Could not remove message {message_id} from {room}: {e}")
+
+    def drop_user(self, user_id: int):
+        """Forget a deleted user's messages and presence."""
+        if not self.redis:
+            return
+        try:
+            for key in self.redis.scan_iter(match=f"{RECENT_PREFIX}*"):
+                for raw in self.redis.lrange(key, 0, -1):
+                    if fast_json.loads(raw).get('user_id') == user_id:
+                        self.redis.lrem(key, 0, raw)
+            self.redis.zrem(ONLINE_KEY, user_id)
+            self.redis.hdel(ONLINE_PROFILES_KEY, user_id)
+        except Exception as e:
+            logger.debug(f"Could not drop chat state for user {user_id}: {e}")
+
+    # ==================== PERSISTENCE ====================
+
+    def flush(self, max_rows: int = None) -> int:
+        """Insert up to max_rows queued messages; returns how many were written."""
+        if not self.redis:
+            return 0
+        from models import db, ChatMessage
+
+        max_rows = max_rows or CHAT_FLUSH_BATCH
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.lrange(PENDING_KEY, 0, max_rows - 1)
+        pipe.ltrim(PENDING_KEY, max_rows, -1)
+        raw_rows, _ = pipe.execute()
+        if not raw_rows:
+            return 0
+
+        rows = []
+        for raw in raw_rows:
+            row = fast_json.loads(raw)
+            row['created_at'] = datetime.fromisoformat(row['created_at'])
+            row['is_deleted'] = False
+            rows.append(row)
+        with (self.context_factory() if self.context_factory else nullcontext()):
+            try:
+                db.session.execute(db.insert(ChatMessage), rows)
+                if db.session.get_bind().dialect.name == 'postgresql':
+                    # Ids come from Redis; keep the serial ahead for direct inserts
+                    db.session.execute(db.text(
+                        "SELECT setval(pg_get_serial_sequence('chat_messages', 'id'), "
+                        "(SELECT MAX(id) FROM chat_messages))"))
+                db.session.commit()
+            except IntegrityError:
+                # A row the table rejects (e.g. its user was deleted) must not block the queue
+                db.session.rollback()
+                return self._insert_each(rows)
+            except Exception:
+                db.session.rollback()
+                # Put the batch back at the head so order is kept on retry
+                self.redis.lpush(PENDING_KEY, *reversed(raw_rows))
+                raise
+        return len(rows)
+
+    def _insert_each(self, rows: List[dict]) -> int:
+        from models import db, ChatMessage
+
+        written = 0
+        for row in rows:
+            try:
+                db.session.execute(db.insert(ChatMessage), [row])
+                db.session.commit()
+                written += 1
+            except IntegrityError as e:
+                db.session.rollback()
+                logger.warning(f"Dropping chat message {row['id']}: {e.orig}")
+        return written
+
+    def start(self):
+        """Start this process's flusher thread (idempotent)."""
+        if self._flusher_started or not self.redis:
+            return
+        with self._lock:
+            if self._flusher_started:
+                return
+            self._flusher_started = True
+        threading.Thread(target=self._flush_loop, daemon=True, name="ChatFlusher").start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(CHAT_FLUSH_INTERVAL)
+            try:
+                while self.flush() == CHAT_FLUSH_BATCH:
+                    pass
+            except Exception as e:
+                logger.warning(f"Chat flush failed, will retry: {e}")
+
+    # ==================== PRESENCE ====================
+
+    def mark_online(self, user):
+        """Record that user is connected (socket connect or chat heartbeat)."""
+        if not self.redis:
+            return
+        profile = {
+            'username': user.username,
+            'avatar': user.avatar,
+            'avatar_type': user.avatar_type,
+            'is_admin': user.role == 'admin',
+        }
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zadd(ONLINE_KEY, {user.id: time.time()})
+            pipe.hset(ONLINE_PROFILES_KEY, user.id, fast_json.dumps(profile))
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Presence update failed for {user.id}: {e}")
+
+    def online_users(self, limit: int = 50) -> Optional[List[dict]]:
+        """Users seen within CHAT_ONLINE_WINDOW, most recent first; None without Redis."""
+        if not self.redis:
+            return None
+        cutoff = time.time() - CHAT_ONLINE_WINDOW
+        try:
+            expired = self.redis.zrangebyscore(ONLINE_KEY, '-inf', cutoff)
+            if expired:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.zrem(ONLINE_KEY, *expired)
+                pipe.hdel(ONLINE_PROFILES_KEY, *expired)
+                pipe.execute()
+            user_ids = self.redis.zrevrange(ONLINE_KEY, 0, limit - 1)
+            profiles = self.redis.hmget(ONLINE_PROFILES_KEY, user_ids) if user_ids else []
+        except Exception as e:
+            logger.debug(f"Presence read failed: {e}")
+            return None
+        return [dict(fast_json.loads(profile), user_id=int(user_id))
+                for user_id, profile in zip(user_ids, profiles) if profile]
+
+
+_store: Optional[ChatStore] = None
+
+
+def init_chat_store(redis_client=None, context_factory: Callable = None) -> ChatStore:
+    """Initialize the process-wide chat store and start its flusher."""
+    global _store
+    _store = ChatStore(redis_client, context_factory)
+    _store.start()
+    return _store
+
+
+def get_chat_store() -> Optional[ChatStore]:
+    """Process-wide chat store (None until init_chat_store)."""
+    return _store
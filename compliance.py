@@ -5,6 +5,18 @@ REGULATORY COMPLIANCE:
 1. Geo-blocking: Blocks access from restricted jurisdictions (US, North Korea, Iran)
 2. TOS Consent: Forces users to accept Terms of Service and Risk Disclaimer
 
+TOS consent is checked on every authenticated request, so accepted versions
+are cached per user: in the signed session and in a bounded per-process map.
+Only acceptances are cached (consent is never withdrawn) and entries carry the
+accepted version, so a TOS_VERSION bump misses and re-checks the database.
+Steady-state checks run no queries.
+
+GeoIP: the MaxMind database is memory-mapped, non-public addresses are
+rejected against precomputed ipaddress networks, and IP -> country results
+are kept in a bounded per-process LRU (GEOIP_CACHE_SIZE). Hits/misses and
+database lookup latency are exported as geoip_lookups_total and
+geoip_lookup_seconds.
+
 Usage:
     from compliance import init_compliance, check_geo_blocking, check_tos_consent
     
@@ -12,19 +24,45 @@ Usage:
     init_compliance(app)
 """
 
+import ipaddress
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from typing import Optional, Tuple
 
-from flask import request, abort, redirect, url_for, g, render_template_string
+from flask import request, abort, redirect, url_for, g, render_template_string, session, has_request_context
 from flask_login import current_user
 
 logger = logging.getLogger("Compliance")
 
+TOS_CONSENT_SESSION_KEY = '_tos_accepted'
+TOS_CONSENT_CACHE_SIZE = 10000
+
+# user_id -> accepted TOS version (LRU)
+_tos_consent_cache: "OrderedDict[int, str]" = OrderedDict()
+_tos_consent_lock = threading.Lock()
+
 # GeoIP reader instance (initialized once)
 _geoip_reader = None
 _geoip_available = False
 
+GEOIP_CACHE_SIZE = int(os.environ.get('GEOIP_CACHE_SIZE', '50000'))
+
+# ip -> country code or None (LRU, per process)
+_geoip_cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+_geoip_cache_lock = threading.Lock()
+_geoip_stats = {'hits': 0, 'misses': 0}
+_geoip_metrics = None
+
+# Loopback, private, CGNAT, link-local and unique-local ranges never resolve to a country
+_NON_PUBLIC_NETWORKS = tuple(ipaddress.ip_network(net) for net in (
+    '0.0.0.0/8', '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8', '169.254.0.0/16',
+    '172.16.0.0/12', '192.168.0.0/16', '::1/128', '::/128', 'fc00::/7', 'fe80::/10',
+))
+
 
 def init_geoip(db_path: str) -> bool:
     """
@@ -44,8 +82,15 @@ def init_geoip(db_path: str) -> bool:
     
     try:
         import geoip2.database
-        _geoip_reader = geoip2.database.Reader(db_path)
+        import maxminddb
+        try:
+            # C extension over mmap; the pure-Python mmap reader if the extension is missing
+            _geoip_reader = geoip2.database.Reader(db_path, mode=maxminddb.MODE_MMAP_EXT)
+        except ValueError:
+            _geoip_reader = geoip2.database.Reader(db_path, mode=maxminddb.MODE_MMAP)
         _geoip_available = True
+        with _geoip_cache_lock:
+            _geoip_cache.clear()
         logger.info(f"✅ GeoIP database loaded from: {db_path}")
         return True
     except FileNotFoundError:
@@ -66,23 +111,64 @@ def get_country_from_ip(ip_address: str) -> Optional[str]:
     Returns:
         ISO 3166-1 alpha-2 country code (e.g., "US", "GB") or None if unknown
     """
-    global _geoip_reader, _geoip_available
-    
-    if not _geoip_available or not _geoip_reader:
+    if not _geoip_available or not _geoip_reader or not ip_address:
         return None
     
+    with _geoip_cache_lock:
+        if ip_address in _geoip_cache:
+            _geoip_cache.move_to_end(ip_address)
+            _geoip_stats['hits'] += 1
+            _observe_geoip('hit')
+            return _geoip_cache[ip_address]
+    
+    started = time.perf_counter()
+    country = _lookup_country(ip_address)
+    elapsed = time.perf_counter() - started
+    with _geoip_cache_lock:
+        _geoip_cache[ip_address] = country
+        while len(_geoip_cache) > GEOIP_CACHE_SIZE:
+            _geoip_cache.popitem(last=False)
+        _geoip_stats['misses'] += 1
+    _observe_geoip('miss', elapsed)
+    return country
+
+
+def _lookup_country(ip_address: str) -> Optional[str]:
+    try:
+        ip = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None
     # Skip private/local IPs
-    if ip_address in ('127.0.0.1', 'localhost', '::1') or ip_address.startswith(('192.168.', '10.', '172.16.')):
+    if any(ip in network for network in _NON_PUBLIC_NETWORKS if network.version == ip.version):
         return None
-    
     try:
-        response = _geoip_reader.country(ip_address)
-        return response.country.iso_code
+        return _geoip_reader.country(ip_address).country.iso_code
     except Exception:
         # IP not found in database or other error
         return None
 
 
+def geoip_cache_stats() -> dict:
+    """Hits, misses, hit ratio and size of this process's GeoIP cache."""
+    with _geoip_cache_lock:
+        hits, misses, size = _geoip_stats['hits'], _geoip_stats['misses'], len(_geoip_cache)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0, 'size': size}
+
+
+def _observe_geoip(result: str, seconds: float = None):
+    """Forward to Prometheus; resolved once, a no-op when metrics are unavailable."""
+    global _geoip_metrics
+    if _geoip_metrics is None:
+        try:
+            from metrics import record_geoip_lookup
+            _geoip_metrics = record_geoip_lookup
+        except ImportError:
+            _geoip_metrics = False
+    if _geoip_metrics:
+        _geoip_metrics(result, seconds)
+
+
 def is_country_blocked(country_code: str, blocked_countries: list) -> bool:
     """
     Check if a country is in the blocked list.
@@ -135,8 +221,35 @@ def check_tos_consent(user_id: int, required_version: str) -> bool:
     Returns:
         True if user has accepted the required version
     """
+    if has_request_context() and session.get(TOS_CONSENT_SESSION_KEY) == [user_id, required_version]:
+        return True
+    with _tos_consent_lock:
+        if _tos_consent_cache.get(user_id) == required_version:
+            _tos_consent_cache.move_to_end(user_id)
+            return True
+    
     from models import UserConsent
-    return UserConsent.has_user_accepted_tos(user_id, required_version)
+    accepted = UserConsent.has_user_accepted_tos(user_id, required_version)
+    if accepted:
+        remember_tos_consent(user_id, required_version)
+    return accepted
+
+
+def remember_tos_consent(user_id: int, tos_version: str):
+    """Cache an accepted TOS version (call after UserConsent.record_consent)."""
+    with _tos_consent_lock:
+        _tos_consent_cache[user_id] = tos_version
+        _tos_consent_cache.move_to_end(user_id)
+        while len(_tos_consent_cache) > TOS_CONSENT_CACHE_SIZE:
+            _tos_consent_cache.popitem(last=False)
+    if has_request_context():
+        session[TOS_CONSENT_SESSION_KEY] = [user_id, tos_version]
+
+
+def forget_tos_consent(user_id: int):
+    """Drop a user's cached consent in this process (e.g. when the user is deleted)."""
+    with _tos_consent_lock:
+        _tos_consent_cache.pop(user_id, None)
 
 
 # ==================== BLOCKED PAGE TEMPLATE ====================
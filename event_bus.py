@@ -0,0 +1,152 @@
+"""
+Brain Capital - Dashboard Event Bus
+
+Delivers Socket.IO events produced outside the web process (ARQ worker,
+Telegram bot) to the dashboards connected to any gunicorn worker.
+
+Transport is the Flask-SocketIO Redis message queue: the web SocketIO is
+created with message_queue=REDIS_URL, so every web worker subscribes to the
+channel and delivers published events to its own rooms. Other processes use a
+DashboardEventBus, a write-only emitter with the same emit() signature as
+SocketIO, so it can be passed to TradingEngine as socketio_instance.
+
+Events are buffered and flushed every EVENT_BUS_FLUSH_INTERVAL seconds
+(default 0.25). State events (balances, master data, per-agent summaries)
+are coalesced so only the latest value per room is published; discrete
+events (trade_closed, whale_alert, chat messages) are always delivered, in
+order.
+
+Usage:
+    from event_bus import get_event_bus
+
+    bus = get_event_bus(REDIS_URL)
+    engine = TradingEngine(app, socketio_instance=bus, ...)
+    ...
+    bus.stop()
+"""
+
+import itertools
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger("EventBus")
+
+SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio')
+EVENT_BUS_FLUSH_INTERVAL = float(os.environ.get('EVENT_BUS_FLUSH_INTERVAL', '0.25'))
+EVENT_BUS_MAX_PENDING = 10000
+
+# Snapshot-style events: a newer value replaces an unsent older one for the same room
+COALESCED_EVENTS = {
+    'update_data': None,
+    'master_data': None,
+    'agent_update': 'user_id',  # one summary per agent in admin_room
+}
+
+
+def _coalesce_key(event: str, data, room, namespace):
+    if event not in COALESCED_EVENTS:
+        return None
+    field = COALESCED_EVENTS[event]
+    sub_key = data.get(field) if field and isinstance(data, dict) else None
+    return (event, room, namespace, sub_key)
+
+
+class DashboardEventBus:
+    """Buffered, coalescing Socket.IO emitter over the Redis message queue."""
+
+    def __init__(self, redis_url: str, channel: str = None, flush_interval: float = None, emitter=None):
+        self.redis_url = redis_url
+        self.channel = channel or SOCKETIO_CHANNEL
+        self.flush_interval = flush_interval or EVENT_BUS_FLUSH_INTERVAL
+        self._emitter = emitter
+        self._pending: "OrderedDict[object, tuple]" = OrderedDict()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.stats = {'queued': 0, 'coalesced': 0, 'published': 0, 'dropped': 0}
+
+    def _get_emitter(self):
+        if self._emitter is None:
+            # Write-only SocketIO: no app, publishes to the message queue only
+            from flask_socketio import SocketIO
+            self._emitter = SocketIO(message_queue=self.redis_url, channel=self.channel)
+        return self._emitter
+
+    # ==================== PUBLISH ====================
+
+    def emit(self, event: str, data=None, room=None, namespace=None, to=None, **kwargs):
+        """Queue an event for delivery (same signature as SocketIO.emit)."""
+        room = to or room
+        key = _coalesce_key(event, data, room, namespace)
+        with self._lock:
+            if key is not None and key in self._pending:
+                self.stats['coalesced'] += 1
+            elif len(self._pending) >= EVENT_BUS_MAX_PENDING:
+                self.stats['dropped'] += 1
+                return
+            if key is None:
+                key = next(self._seq)
+            self._pending[key] = (event, data, room, namespace)
+            self.stats['queued'] += 1
+        self.start()
+
+    def flush(self) -> int:
+        """Publish everything buffered; returns the number of events sent."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch = list(self._pending.values())
+            self._pending.clear()
+        emitter = self._get_emitter()
+        sent = 0
+        for event, data, room, namespace in batch:
+            try:
+                emitter.emit(event, data, room=room, namespace=namespace)
+                sent += 1
+            except Exception as e:
+                logger.debug(f"Could not publish {event} to {room}: {e}")
+        self.stats['published'] += sent
+        return sent
+
+    # ==================== LIFECYCLE ====================
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="DashboardEventBus")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.flush()
+
+    def _loop(self):
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Event bus flush error: {e}")
+
+
+_bus: Optional[DashboardEventBus] = None
+_bus_lock = threading.Lock()
+
+
+def get_event_bus(redis_url: str) -> DashboardEventBus:
+    """Process-wide DashboardEventBus singleton."""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = DashboardEventBus(redis_url)
+    return _bus
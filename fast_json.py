@@ -0,0 +1,76 @@
+"""
+Brain Capital - Fast JSON
+
+One serializer for cached API payloads, Socket.IO packets and ARQ jobs.
+Uses orjson when installed (bytes out, several times faster than json) and
+falls back to the standard library otherwise, so both produce the same JSON.
+
+- dumps/loads: bytes in and out, for caches and HTTP bodies
+- SocketIOJSON: json-module shaped wrapper for SocketIO(json=...)
+- dumps_job/loads_job: ARQ job_serializer/job_deserializer; jobs pickled by
+  an older release are still readable while the queue drains
+"""
+
+import json
+import pickle
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# First byte of a pickle (protocol 2+); never the start of a JSON document
+_PICKLE_MARKER = 0x80
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj) -> bytes:
+        """Serialize obj to compact JSON bytes."""
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def loads(data):
+        """Parse JSON from bytes or str."""
+        return orjson.loads(data)
+else:
+    def dumps(obj) -> bytes:
+        """Serialize obj to compact JSON bytes."""
+        return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def loads(data):
+        """Parse JSON from bytes or str."""
+        return json.loads(data)
+
+
+def dumps_job(obj) -> bytes:
+    """ARQ job serializer."""
+    return dumps(obj)
+
+
+def loads_job(data: bytes):
+    """ARQ job deserializer (accepts jobs pickled before the switch to JSON)."""
+    if data and data[0] == _PICKLE_MARKER:
+        return pickle.loads(data)
+    return loads(data)
+
+
+class SocketIOJSON:
+    """Module-like JSON codec for python-socketio (str in and out)."""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs) -> str:
+        return dumps(obj).decode('utf-8')
+
+    @staticmethod
+    def loads(data, *args, **kwargs):
+        return loads(data)
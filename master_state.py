@@ -0,0 +1,202 @@
+"""
+Brain Capital - Master State Service
+
+One refresher for master positions and balances. Every master view
+(/api/master/positions, /api/master/exchange_balances, admin /api/positions,
+the Socket.IO master_data push, insurance fund, balance snapshots) reads the
+latest snapshot from memory or Redis, so exchange load no longer grows with
+the number of open admin dashboards. Readers never call an exchange: when
+the refresher falls behind they get the last snapshot flagged 'stale'.
+
+Refresh:
+- One background thread refreshes positions and balances of ALL master
+  exchanges every MASTER_STATE_INTERVAL seconds (default 5), one job per
+  exchange on a pool of MASTER_STATE_WORKERS threads (default 8), and
+  pushes master_data to admin_room (delivered by every web worker through the
+  Socket.IO message queue).
+- With Redis, only the process holding master_state:refresher refreshes; the
+  others serve the snapshot it publishes. The lock expires if its holder dies,
+  so another process takes over within MASTER_STATE_LOCK_TTL seconds.
+
+Redis Keys Structure:
+- master_state:snapshot -> JSON {positions, balances, total_balance, updated_at}
+- master_state:refresher -> lock holder id (TTL = MASTER_STATE_LOCK_TTL)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger("MasterState")
+
+MASTER_STATE_INTERVAL = float(os.environ.get('MASTER_STATE_INTERVAL', '5'))
+MASTER_STATE_LOCK_TTL = int(os.environ.get('MASTER_STATE_LOCK_TTL', '15'))
+MASTER_STATE_WORKERS = int(os.environ.get('MASTER_STATE_WORKERS', '8'))
+SNAPSHOT_KEY = 'master_state:snapshot'
+REFRESHER_KEY = 'master_state:refresher'
+# Kept well past max_age so readers can still serve a stale snapshot
+SNAPSHOT_TTL = 600
+
+
+class MasterStateService:
+    """Holds the latest normalized master snapshot and keeps it fresh."""
+
+    def __init__(self, engine, interval: float = None):
+        self.engine = engine
+        self.interval = interval or MASTER_STATE_INTERVAL
+        self.max_age = self.interval * 3
+        self._snapshot: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._owner_id = uuid.uuid4().hex
+        self._pool = ThreadPoolExecutor(max_workers=MASTER_STATE_WORKERS, thread_name_prefix="MasterState")
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    # ==================== READ ====================
+
+    def _latest(self, max_age: float) -> Optional[dict]:
+        """Memory snapshot while fresh, else the newer of memory and Redis."""
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot and time.time() - snapshot['updated_at'] <= max_age:
+            return snapshot
+        shared = self._read_shared()
+        if shared and shared.get('updated_at', 0) > (snapshot['updated_at'] if snapshot else 0):
+            with self._lock:
+                self._snapshot = shared
+            return shared
+        return snapshot
+
+    def get_snapshot(self, max_age: float = None) -> Optional[dict]:
+        """Latest snapshot no older than max_age (memory first, then Redis)."""
+        max_age = self.max_age if max_age is None else max_age
+        snapshot = self._latest(max_age)
+        if snapshot and time.time() - snapshot['updated_at'] <= max_age:
+            return snapshot
+        return None
+
+    def last_snapshot(self) -> Optional[dict]:
+        """Last snapshot however old, with 'stale' set past max_age; None before the first refresh."""
+        snapshot = self._latest(self.max_age)
+        if snapshot is None:
+            return None
+        return dict(snapshot, stale=time.time() - snapshot['updated_at'] > self.max_age)
+
+    def positions(self) -> list:
+        """Copies of the last snapshot's positions (callers may annotate them)."""
+        snapshot = self.last_snapshot()
+        return [dict(p) for p in snapshot['positions']] if snapshot else []
+
+    def balances(self) -> list:
+        snapshot = self.last_snapshot()
+        return [dict(b) for b in snapshot['balances']] if snapshot else []
+
+    # ==================== REFRESH ====================
+
+    def refresh(self) -> dict:
+        """Query every master exchange once, all exchanges in parallel."""
+        with self._refresh_lock:
+            # Another caller may have refreshed while we waited
+            with self._lock:
+                snapshot = self._snapshot
+            if snapshot and time.time() - snapshot['updated_at'] < self.interval / 2:
+                return snapshot
+            position_jobs, balance_jobs = self.engine.master_fetch_jobs()
+            position_futures = [self._pool.submit(job) for job in position_jobs]
+            balance_futures = [self._pool.submit(job) for job in balance_jobs]
+            positions = self._collect(position_futures)
+            balances = self._collect(balance_futures)
+            snapshot = {
+                'positions': positions,
+                'balances': balances,
+                'total_balance': sum(b['balance'] for b in balances if b.get('balance') is not None),
+                'updated_at': time.time(),
+            }
+            with self._lock:
+                self._snapshot = snapshot
+            self._write_shared(snapshot)
+            return snapshot
+
+    @staticmethod
+    def _collect(futures) -> list:
+        """Concatenate job results; one failing exchange does not drop the others."""
+        results = []
+        for future in futures:
+            try:
+                results.extend(future.result() or [])
+            except Exception as e:
+                logger.warning(f"Master exchange fetch failed: {e}")
+        return results
+
+    def _redis(self):
+        return self.engine._get_sync_redis()
+
+    def _read_shared(self) -> Optional[dict]:
+        redis_client = self._redis()
+        if not redis_client:
+            return None
+        try:
+            raw = redis_client.get(SNAPSHOT_KEY)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.debug(f"Could not read master snapshot: {e}")
+            return None
+
+    def _write_shared(self, snapshot: dict):
+        redis_client = self._redis()
+        if not redis_client:
+            return
+        try:
+            redis_client.set(SNAPSHOT_KEY, json.dumps(snapshot, default=str), ex=SNAPSHOT_TTL)
+        except Exception as e:
+            logger.debug(f"Could not publish master snapshot: {e}")
+
+    def _is_refresher(self) -> bool:
+        """Hold (or take over) the refresher lock; True without Redis."""
+        redis_client = self._redis()
+        if not redis_client:
+            return True
+        try:
+            if redis_client.set(REFRESHER_KEY, self._owner_id, nx=True, ex=MASTER_STATE_LOCK_TTL):
+                return True
+            holder = redis_client.get(REFRESHER_KEY)
+            if isinstance(holder, (bytes, bytearray)):
+                holder = holder.decode('utf-8')
+            if holder == self._owner_id:
+                redis_client.expire(REFRESHER_KEY, MASTER_STATE_LOCK_TTL)
+                return True
+            return False
+        except Exception as e:
+            logger.debug(f"Master state lock unavailable, refreshing locally: {e}")
+            return True
+
+    # ==================== LIFECYCLE ====================
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="MasterStateRefresher")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def _loop(self):
+        while self._running:
+            started = time.time()
+            try:
+                if self.engine.master_clients and self._is_refresher():
+                    self.refresh()
+                    # Socket.IO shares a Redis message queue with the other processes,
+                    # so the refresher's push reaches every admin dashboard
+                    self.engine.push_master_updates()
+            except Exception as e:
+                logger.warning(f"Master state refresh error: {e}")
+            time.sleep(max(0.5, self.interval - (time.time() - started)))
@@ -14,6 +14,11 @@ Metrics exposed:
 - total_aum_usd: Gauge for Assets Under Management
 - realized_pnl_usd: Gauge for realized profit/loss
 - unrealized_pnl_usd: Gauge for unrealized profit/loss
+- queue_wait_seconds: Histogram for ARQ queue wait per priority lane
+- cache_requests_total: Counter for cache lookups by tier/result
+- cache_refresh_seconds: Histogram for cache recompute latency
+- geoip_lookups_total: Counter for GeoIP cache hits/misses
+- geoip_lookup_seconds: Histogram for GeoIP database lookup latency
 
 Usage:
     from metrics import (
@@ -147,6 +152,47 @@ WORKER_QUEUE_SIZE = Gauge(
     'Current size of the task queue'
 )
 
+# Queue wait per priority lane (close / open / dca / background)
+QUEUE_WAIT = Histogram(
+    'queue_wait_seconds',
+    'Time a job waited in the ARQ queue before starting',
+    labelnames=['lane'],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+)
+
+SIGNALS_COALESCED = Counter(
+    'signals_coalesced_total',
+    'Duplicate signals coalesced into an already queued signal',
+    labelnames=['lane']
+)
+
+# Two-tier cache (cache_layer.TwoTierCache)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'Cache lookups by cache and result (hit_l1, hit_l2, stale, miss)',
+    labelnames=['cache', 'result']
+)
+
+CACHE_REFRESH = Histogram(
+    'cache_refresh_seconds',
+    'Time spent recomputing a cached value',
+    labelnames=['cache'],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+)
+
+# GeoIP country lookups (compliance geo-blocking)
+GEOIP_LOOKUPS = Counter(
+    'geoip_lookups_total',
+    'GeoIP country lookups by cache result (hit, miss)',
+    labelnames=['result']
+)
+
+GEOIP_LOOKUP_LATENCY = Histogram(
+    'geoip_lookup_seconds',
+    'GeoIP database lookup time on a cache miss',
+    buckets=[0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01]
+)
+
 # Application info
 APP_INFO = Info(
     'brain_capital',
@@ -315,6 +361,33 @@ def record_worker_task(task_name: str, status: str = 'success'):
     WORKER_TASKS_PROCESSED.labels(task_name=task_name, status=status).inc()
 
 
+def record_queue_wait(lane: str, seconds: float):
+    """Record how long a job waited in its priority lane."""
+    QUEUE_WAIT.labels(lane=lane).observe(max(0.0, seconds))
+
+
+def record_signal_coalesced(lane: str):
+    """Record a duplicate signal that was coalesced."""
+    SIGNALS_COALESCED.labels(lane=lane).inc()
+
+
+def record_cache_request(cache: str, result: str):
+    """Record a cache lookup result."""
+    CACHE_REQUESTS.labels(cache=cache, result=result).inc()
+
+
+def record_cache_refresh(cache: str, seconds: float):
+    """Record how long a cache recompute took."""
+    CACHE_REFRESH.labels(cache=cache).observe(max(0.0, seconds))
+
+
+def record_geoip_lookup(result: str, seconds: float = None):
+    """Record a GeoIP lookup (and its database latency on a miss)."""
+    GEOIP_LOOKUPS.labels(result=result).inc()
+    if seconds is not None:
+        GEOIP_LOOKUP_LATENCY.observe(seconds)
+
+
 def set_worker_queue_size(size: int):
     """Update worker queue size gauge."""
     WORKER_QUEUE_SIZE.set(size)
@@ -5,7 +5,14 @@ from passlib.context import CryptContext
 from cryptography.fernet import Fernet
 from config import Config
 from datetime import datetime, timezone, timedelta
+import bisect
+import logging
+import os
 import secrets
+import threading
+import time
+
+logger = logging.getLogger("Models")
 
 db = SQLAlchemy()
 
@@ -359,12 +366,8 @@ class User(UserMixin, db.Model):
         
         Formula: Trade Volume / 1000 + Days Active
         """
-        from sqlalchemy import func
-        
         # Get total trading volume (sum of absolute PnL * leverage factor)
-        volume_result = db.session.query(func.sum(func.abs(TradeHistory.pnl))).filter(
-            TradeHistory.user_id == self.id
-        ).scalar()
+        volume_result = DailyTradeRollup.totals(self.id)['abs_pnl']
         volume_xp = int((float(volume_result or 0) * 100) / 1000)  # Scale PnL to approximate volume
         
         # Days active since registration
@@ -488,6 +491,238 @@ class TradeHistory(db.Model):
         }
 
 
+class DailyTradeRollup(db.Model):
+    """
+    Closed-trade aggregates per (user, UTC day), so stats read O(days) rows
+    instead of O(trades).
+
+    Maintained incrementally by record() in the same transaction as the
+    TradeHistory insert, and rebuilt from TradeHistory by rebuild() (backfill,
+    nightly reconciliation, dedupe). The one-off full backfill is recorded in
+    SystemSetting (trade_rollup/backfilled). Master trades use user_id = MASTER_ID.
+    """
+    __tablename__ = 'daily_trade_rollup'
+
+    MASTER_ID = 0
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True)
+    trades = db.Column(db.Integer, default=0, nullable=False)
+    wins = db.Column(db.Integer, default=0, nullable=False)
+    losses = db.Column(db.Integer, default=0, nullable=False)
+    pnl_sum = db.Column(db.Float, default=0.0, nullable=False)
+    abs_pnl_sum = db.Column(db.Float, default=0.0, nullable=False)
+    roi_sum = db.Column(db.Float, default=0.0, nullable=False)
+    max_pnl = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_rollup_day_user', 'day', 'user_id'),
+    )
+
+    @classmethod
+    def subject_id(cls, user_id) -> int:
+        return user_id if isinstance(user_id, int) and user_id else cls.MASTER_ID
+
+    @classmethod
+    def record(cls, user_id, pnl: float, roi: float, close_time: datetime = None):
+        """Add one closed trade to its day row (upsert; caller commits)."""
+        pnl = float(pnl or 0.0)
+        roi = float(roi or 0.0)
+        values = {
+            'user_id': cls.subject_id(user_id),
+            'day': (close_time or datetime.now(timezone.utc)).date(),
+            'trades': 1,
+            'wins': 1 if pnl > 0 else 0,
+            'losses': 1 if pnl < 0 else 0,
+            'pnl_sum': pnl,
+            'abs_pnl_sum': abs(pnl),
+            'roi_sum': roi,
+            'max_pnl': pnl,
+        }
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(cls).values(**values)
+            excluded = stmt.excluded
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['user_id', 'day'],
+                set_={
+                    'trades': cls.trades + excluded.trades,
+                    'wins': cls.wins + excluded.wins,
+                    'losses': cls.losses + excluded.losses,
+                    'pnl_sum': cls.pnl_sum + excluded.pnl_sum,
+                    'abs_pnl_sum': cls.abs_pnl_sum + excluded.abs_pnl_sum,
+                    'roi_sum': cls.roi_sum + excluded.roi_sum,
+                    'max_pnl': db.case(
+                        (cls.max_pnl.is_(None), excluded.max_pnl),
+                        (excluded.max_pnl > cls.max_pnl, excluded.max_pnl),
+                        else_=cls.max_pnl
+                    ),
+                }
+            ))
+            return
+
+        row = db.session.get(cls, (values['user_id'], values['day']))
+        if row is None:
+            db.session.add(cls(**values))
+            return
+        for field in ('trades', 'wins', 'losses', 'pnl_sum', 'abs_pnl_sum', 'roi_sum'):
+            setattr(row, field, (getattr(row, field) or 0) + values[field])
+        row.max_pnl = pnl if row.max_pnl is None else max(row.max_pnl, pnl)
+
+    @staticmethod
+    def _as_date(value):
+        if isinstance(value, str):
+            return datetime.strptime(value[:10], '%Y-%m-%d').date()
+        if isinstance(value, datetime):
+            return value.date()
+        return value
+
+    @classmethod
+    def rebuild(cls, since_day=None) -> int:
+        """
+        Recompute rows from TradeHistory (all days, or days >= since_day) with
+        one GROUP BY. Returns the number of rows written; caller commits.
+        """
+        from sqlalchemy import func
+
+        day_expr = func.date(TradeHistory.close_time)
+        query = db.session.query(
+            func.coalesce(TradeHistory.user_id, cls.MASTER_ID).label('user_id'),
+            day_expr.label('day'),
+            func.count(TradeHistory.id).label('trades'),
+            func.sum(db.case((TradeHistory.pnl > 0, 1), else_=0)).label('wins'),
+            func.sum(db.case((TradeHistory.pnl < 0, 1), else_=0)).label('losses'),
+            func.coalesce(func.sum(TradeHistory.pnl), 0.0).label('pnl_sum'),
+            func.coalesce(func.sum(func.abs(TradeHistory.pnl)), 0.0).label('abs_pnl_sum'),
+            func.coalesce(func.sum(TradeHistory.roi), 0.0).label('roi_sum'),
+            func.max(TradeHistory.pnl).label('max_pnl'),
+        ).filter(TradeHistory.close_time.isnot(None))
+
+        delete = cls.query
+        if since_day is not None:
+            start = datetime.combine(since_day, datetime.min.time())
+            query = query.filter(TradeHistory.close_time >= start)
+            delete = delete.filter(cls.day >= since_day)
+        delete.delete(synchronize_session=False)
+
+        written = 0
+        for row in query.group_by(func.coalesce(TradeHistory.user_id, cls.MASTER_ID), day_expr):
+            db.session.add(cls(
+                user_id=int(row.user_id),
+                day=cls._as_date(row.day),
+                trades=int(row.trades or 0),
+                wins=int(row.wins or 0),
+                losses=int(row.losses or 0),
+                pnl_sum=float(row.pnl_sum or 0.0),
+                abs_pnl_sum=float(row.abs_pnl_sum or 0.0),
+                roi_sum=float(row.roi_sum or 0.0),
+                max_pnl=float(row.max_pnl) if row.max_pnl is not None else None,
+            ))
+            written += 1
+        return written
+
+    @classmethod
+    def is_backfilled(cls) -> bool:
+        """True once a full rebuild has run (rows from record() alone prove nothing)."""
+        return SystemSetting.get_setting('trade_rollup', 'backfilled') == 'true'
+
+    @classmethod
+    def mark_backfilled(cls):
+        """Record the full backfill; commits, so call it right after rebuild()."""
+        SystemSetting.set_setting('trade_rollup', 'backfilled', 'true',
+                                  description='Daily trade rollup backfilled from TradeHistory')
+
+    @staticmethod
+    def _totals(trades, wins, losses, pnl_sum, abs_pnl_sum, roi_sum, max_pnl) -> dict:
+        trades = int(trades or 0)
+        pnl_sum = float(pnl_sum or 0.0)
+        abs_pnl_sum = float(abs_pnl_sum or 0.0)
+        return {
+            'trades': trades,
+            'wins': int(wins or 0),
+            'losses': int(losses or 0),
+            'pnl': pnl_sum,
+            'abs_pnl': abs_pnl_sum,
+            'profit': (pnl_sum + abs_pnl_sum) / 2,  # sum of winning pnl
+            'roi_sum': float(roi_sum or 0.0),
+            'avg_roi': float(roi_sum or 0.0) / trades if trades else 0.0,
+            'max_pnl': float(max_pnl) if max_pnl is not None else None,
+        }
+
+    @classmethod
+    def totals(cls, user_id=None, since: datetime = None, all_users: bool = False) -> dict:
+        """
+        Aggregate stats for one user (None = master), or every user when
+        all_users, optionally since a timestamp.
+
+        Whole days come from the rollup; the partial first day of a rolling
+        window (e.g. the last 24h) is aggregated from that day's raw trades.
+        """
+        from sqlalchemy import func
+
+        query = db.session.query(
+            func.sum(cls.trades), func.sum(cls.wins), func.sum(cls.losses), func.sum(cls.pnl_sum),
+            func.sum(cls.abs_pnl_sum), func.sum(cls.roi_sum), func.max(cls.max_pnl)
+        )
+        edge = None
+        if not all_users:
+            query = query.filter(cls.user_id == cls.subject_id(user_id))
+        if since is not None:
+            since_naive = since.astimezone(timezone.utc).replace(tzinfo=None) if since.tzinfo else since
+            first_day = since_naive.date()
+            if since_naive == datetime.combine(first_day, datetime.min.time()):
+                query = query.filter(cls.day >= first_day)
+            else:
+                query = query.filter(cls.day > first_day)
+                edge = (since_naive, datetime.combine(first_day + timedelta(days=1), datetime.min.time()))
+        result = cls._totals(*query.one())
+
+        if edge is not None:
+            raw = db.session.query(
+                func.count(TradeHistory.id),
+                func.sum(db.case((TradeHistory.pnl > 0, 1), else_=0)),
+                func.sum(db.case((TradeHistory.pnl < 0, 1), else_=0)),
+                func.sum(TradeHistory.pnl), func.sum(func.abs(TradeHistory.pnl)),
+                func.sum(TradeHistory.roi), func.max(TradeHistory.pnl)
+            ).filter(TradeHistory.close_time >= edge[0], TradeHistory.close_time < edge[1])
+            if not all_users:
+                uid = cls.subject_id(user_id)
+                raw = raw.filter(TradeHistory.user_id.is_(None) if uid == cls.MASTER_ID else TradeHistory.user_id == uid)
+            partial = cls._totals(*raw.one())
+            max_values = [v for v in (result['max_pnl'], partial['max_pnl']) if v is not None]
+            result = cls._totals(
+                result['trades'] + partial['trades'], result['wins'] + partial['wins'],
+                result['losses'] + partial['losses'], result['pnl'] + partial['pnl'],
+                result['abs_pnl'] + partial['abs_pnl'], result['roi_sum'] + partial['roi_sum'],
+                max(max_values) if max_values else None
+            )
+        return result
+
+    @classmethod
+    def top_users(cls, since_day, limit: int = 10) -> list:
+        """
+        [(user_id, username, pnl, avg_roi, trades)] for users (not master)
+        since a day, best pnl first - one grouped query joined to users.
+        """
+        from sqlalchemy import func
+
+        pnl = func.sum(cls.pnl_sum)
+        trades = func.sum(cls.trades)
+        rows = db.session.query(cls.user_id, User.username, pnl, func.sum(cls.roi_sum), trades).join(
+            User, User.id == cls.user_id
+        ).filter(
+            cls.day >= since_day
+        ).group_by(cls.user_id, User.username).order_by(pnl.desc()).limit(limit).all()
+        return [
+            (row[0], row[1], float(row[2] or 0.0), float(row[3] or 0.0) / row[4] if row[4] else 0.0, int(row[4] or 0))
+            for row in rows
+        ]
+
+
 class ReferralCommission(db.Model):
     """Track commissions earned from referred users"""
     __tablename__ = 'referral_commissions'
@@ -563,6 +798,214 @@ class BalanceHistory(db.Model):
         db.Index('idx_balance_user_time', 'user_id', 'timestamp'),
     )
 
+    @classmethod
+    def _owner_filter(cls, user_id):
+        return cls.user_id.is_(None) if user_id is None else cls.user_id == user_id
+
+    @classmethod
+    def _bucket_expr(cls, bucket_seconds: int):
+        """SQL expression: epoch(timestamp) // bucket_seconds."""
+        from sqlalchemy import func
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'sqlite':
+            # Floor division of the integer epoch (SQLAlchemy 2.x renders '/' as true division)
+            return db.cast(func.strftime('%s', cls.timestamp), db.Integer) // int(bucket_seconds)
+        return func.floor(func.extract('epoch', cls.timestamp) / int(bucket_seconds))
+
+    @classmethod
+    def bucketed(cls, user_id, since: datetime, bucket_seconds: int) -> list:
+        """
+        Last raw snapshot per time bucket since a timestamp (user_id None =
+        master), oldest first. Bucketing happens in SQL, so the result size
+        depends on the window and bucket width, not on how often balances
+        were recorded.
+        """
+        from sqlalchemy import func
+
+        last_ids = db.session.query(func.max(cls.id)).filter(
+            cls._owner_filter(user_id),
+            cls.timestamp >= since
+        ).group_by(cls._bucket_expr(bucket_seconds))
+        return cls.query.filter(cls.id.in_(last_ids)).order_by(cls.timestamp.asc()).all()
+
+    @classmethod
+    def series(cls, user_id, since: datetime, max_points: int = 500) -> list:
+        """
+        Balance chart points [(timestamp, balance)] since a timestamp, at most
+        max_points, oldest first.
+
+        Recent data comes from raw snapshots bucketed in SQL; data older than
+        the raw retention window comes from BalanceHistoryRollup: hourly rows
+        inside the hourly retention window, daily rows before it (and for
+        wide buckets). Each bucket keeps its last balance.
+        """
+        since = _naive_utc(since)
+        span = max(1.0, (_naive_utc(datetime.now(timezone.utc)) - since).total_seconds())
+        width = max(60, int(-(-span // max_points)))
+
+        raw = [(_naive_utc(h.timestamp), h.balance) for h in cls.bucketed(user_id, since, width)]
+        points = []
+        raw_start = raw[0][0] if raw else None
+        if raw_start is None or raw_start - since > timedelta(seconds=width):
+            rollups = BalanceHistoryRollup.query.filter(
+                BalanceHistoryRollup.user_id == BalanceHistoryRollup.subject_id(user_id),
+                BalanceHistoryRollup.bucket_start >= since
+            )
+            if width >= BalanceHistoryRollup.DAILY:
+                rollups = rollups.filter(BalanceHistoryRollup.resolution == BalanceHistoryRollup.DAILY)
+            else:
+                # Hourly rows are pruned past their retention; daily rows cover the older part
+                hourly_from = BalanceHistoryRollup.hourly_horizon()
+                rollups = rollups.filter(db.or_(
+                    db.and_(BalanceHistoryRollup.resolution == BalanceHistoryRollup.HOURLY,
+                            BalanceHistoryRollup.bucket_start >= hourly_from),
+                    db.and_(BalanceHistoryRollup.resolution == BalanceHistoryRollup.DAILY,
+                            BalanceHistoryRollup.bucket_start < hourly_from)
+                ))
+            if raw_start is not None:
+                rollups = rollups.filter(BalanceHistoryRollup.bucket_start < raw_start)
+            points = [(r.bucket_start, r.close) for r in rollups.order_by(BalanceHistoryRollup.bucket_start.asc())]
+
+        # Final pass: last point per bucket across both sources
+        buckets = {}
+        for ts, balance in points + raw:
+            buckets[int((ts - since).total_seconds() // width)] = (ts, balance)
+        return [buckets[key] for key in sorted(buckets)]
+
+    @classmethod
+    def period_change(cls, user_id, since: datetime):
+        """(first, last) balance in a window via indexed lookups, or None."""
+        query = cls.query.filter(cls._owner_filter(user_id), cls.timestamp >= since)
+        last = query.order_by(cls.timestamp.desc()).first()
+        if last is None:
+            return None
+        # The window may start before the raw retention horizon: take the oldest rollup open
+        rollup = BalanceHistoryRollup.query.filter(
+            BalanceHistoryRollup.user_id == BalanceHistoryRollup.subject_id(user_id),
+            BalanceHistoryRollup.bucket_start >= _naive_utc(since)
+        ).order_by(BalanceHistoryRollup.bucket_start.asc(), BalanceHistoryRollup.resolution.asc()).first()
+        if rollup is not None:
+            return rollup.open, last.balance
+        first = query.order_by(cls.timestamp.asc()).first()
+        if first.id == last.id:
+            return None
+        return first.balance, last.balance
+
+    @classmethod
+    def balance_at(cls, user_id, when: datetime):
+        """Last known balance at or before a time (raw snapshot, else compacted close), or None."""
+        raw = cls.query.filter(cls._owner_filter(user_id), cls.timestamp <= when).order_by(cls.timestamp.desc()).first()
+        if raw is not None:
+            return raw.balance
+        rollup = BalanceHistoryRollup.query.filter(
+            BalanceHistoryRollup.user_id == BalanceHistoryRollup.subject_id(user_id),
+            BalanceHistoryRollup.bucket_start <= _naive_utc(when)
+        ).order_by(BalanceHistoryRollup.bucket_start.desc(), BalanceHistoryRollup.resolution.asc()).first()
+        return rollup.close if rollup is not None else None
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """Naive UTC datetime (DB timestamps are stored without tzinfo)."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class BalanceHistoryRollup(db.Model):
+    """
+    Compacted balance snapshots: open/low/high/close per (user, resolution,
+    bucket). compact_day() folds a day of raw BalanceHistory into hourly and
+    daily rows and deletes the raw rows, so balance_history only holds the
+    recent window. Master balances use user_id = MASTER_ID.
+    """
+    __tablename__ = 'balance_history_rollup'
+
+    MASTER_ID = 0
+    HOURLY = 3600
+    DAILY = 86400
+    HOURLY_RETENTION_DAYS = int(os.environ.get('BALANCE_HOURLY_RETENTION_DAYS', '90'))
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    resolution = db.Column(db.Integer, primary_key=True, autoincrement=False)  # bucket width, seconds
+    bucket_start = db.Column(db.DateTime, primary_key=True)  # UTC, naive
+    open = db.Column(db.Float, nullable=False)
+    low = db.Column(db.Float, nullable=False)
+    high = db.Column(db.Float, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, default=0, nullable=False)
+
+    @classmethod
+    def subject_id(cls, user_id) -> int:
+        return user_id if isinstance(user_id, int) and user_id else cls.MASTER_ID
+
+    @classmethod
+    def compact_day(cls, day) -> int:
+        """
+        Fold one UTC day of raw snapshots into hourly and daily rows, then
+        delete them. Returns the number of raw rows compacted; caller commits.
+        """
+        from sqlalchemy import func
+
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        in_day = (BalanceHistory.timestamp >= day_start, BalanceHistory.timestamp < day_end)
+        owner = func.coalesce(BalanceHistory.user_id, cls.MASTER_ID)
+        hour = BalanceHistory._bucket_expr(cls.HOURLY)
+
+        groups = db.session.query(
+            owner, hour, func.min(BalanceHistory.balance), func.max(BalanceHistory.balance),
+            func.min(BalanceHistory.id), func.max(BalanceHistory.id), func.count(BalanceHistory.id)
+        ).filter(*in_day).group_by(owner, hour).all()
+        if not groups:
+            return 0
+
+        # open/close balances for the first/last snapshot ids of every group
+        edge_ids = sorted({g[4] for g in groups} | {g[5] for g in groups})
+        balances = {}
+        for i in range(0, len(edge_ids), 500):
+            balances.update(db.session.query(BalanceHistory.id, BalanceHistory.balance).filter(
+                BalanceHistory.id.in_(edge_ids[i:i + 500])
+            ).all())
+
+        days = {}
+        for user_id, bucket, low, high, first_id, last_id, samples in sorted(groups, key=lambda g: (g[0], g[1])):
+            hourly = cls(
+                user_id=int(user_id), resolution=cls.HOURLY,
+                bucket_start=datetime(1970, 1, 1) + timedelta(seconds=int(bucket) * cls.HOURLY),
+                open=balances[first_id], low=low, high=high, close=balances[last_id], samples=samples
+            )
+            db.session.merge(hourly)
+            daily = days.get(hourly.user_id)
+            if daily is None:
+                days[hourly.user_id] = cls(
+                    user_id=hourly.user_id, resolution=cls.DAILY, bucket_start=day_start,
+                    open=hourly.open, low=low, high=high, close=hourly.close, samples=samples
+                )
+            else:
+                daily.low = min(daily.low, low)
+                daily.high = max(daily.high, high)
+                daily.close = hourly.close
+                daily.samples += samples
+        for daily in days.values():
+            db.session.merge(daily)
+
+        return BalanceHistory.query.filter(*in_day).delete(synchronize_session=False)
+
+    @classmethod
+    def hourly_horizon(cls) -> datetime:
+        """First midnight (UTC, naive) from which hourly rows are still kept in full."""
+        oldest = datetime.now(timezone.utc) - timedelta(days=cls.HOURLY_RETENTION_DAYS)
+        return datetime.combine(oldest.date() + timedelta(days=1), datetime.min.time())
+
+    @classmethod
+    def prune_hourly(cls, before: datetime) -> int:
+        """Drop hourly rows older than a cutoff (daily rows are kept)."""
+        return cls.query.filter(
+            cls.resolution == cls.HOURLY,
+            cls.bucket_start < _naive_utc(before)
+        ).delete(synchronize_session=False)
+
 
 class Message(db.Model):
     __tablename__ = 'messages'
@@ -1234,7 +1677,7 @@ class ChatBan(db.Model):
     
     @staticmethod
     def get_active_ban(user_id: int):
-        """Get active ban for a user, if any"""
+        """Get active ban row for a user, if any (database; per-message checks use is_user_banned)"""
         ban = ChatBan.query.filter_by(user_id=user_id, is_active=True).order_by(ChatBan.created_at.desc()).first()
         if ban and ban.is_expired():
             ban.is_active = False
@@ -1245,13 +1688,13 @@ class ChatBan(db.Model):
     @staticmethod
     def is_user_banned(user_id: int) -> tuple:
         """
-        Check if user is banned/muted.
+        Check if user is banned/muted (from the cached ban table, no query).
         Returns (is_banned, ban_type, reason, expires_at)
         """
-        ban = ChatBan.get_active_ban(user_id)
+        ban = chat_ban_table.get(user_id)
         if not ban:
             return (False, None, None, None)
-        return (True, ban.ban_type, ban.reason, ban.expires_at)
+        return (True,) + ban
     
     @staticmethod
     def mute_user(user_id: int, duration_minutes: int, reason: str, issued_by_id: int):
@@ -1267,6 +1710,7 @@ class ChatBan(db.Model):
         )
         db.session.add(ban)
         db.session.commit()
+        chat_ban_table.changed()
         return ban
     
     @staticmethod
@@ -1282,6 +1726,7 @@ class ChatBan(db.Model):
         )
         db.session.add(ban)
         db.session.commit()
+        chat_ban_table.changed()
         return ban
     
     @staticmethod
@@ -1289,6 +1734,106 @@ class ChatBan(db.Model):
         """Remove all active bans for a user"""
         ChatBan.query.filter_by(user_id=user_id, is_active=True).update({'is_active': False})
         db.session.commit()
+        chat_ban_table.changed()
+
+
+class _ChatBanTable:
+    """
+    Process-local map of active chat bans and mutes: user_id -> entries.
+
+    Every send_message/join_chat checks it, so lookups must not query. The
+    map is rebuilt from one query of active rows (expired rows are
+    deactivated then) when invalidated or after CHAT_BAN_TABLE_TTL seconds.
+    Expiry is checked on each lookup, so mutes lapse on time without a reload.
+
+    ChatBan.mute_user/ban_user/unban_user call changed(), which invalidates
+    locally and publishes on the chat_bans_changed Redis channel; every
+    process that attach_redis()-ed invalidates its copy on that message.
+    """
+
+    CHAT_BAN_TABLE_TTL = 60
+    CHANNEL = 'chat_bans_changed'
+
+    def __init__(self):
+        self._bans = {}
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._loaded_generation = -1
+        self._lock = threading.Lock()
+        self._redis = None
+
+    def _is_fresh(self) -> bool:
+        return (self._loaded_generation == self._generation
+                and time.time() - self._loaded_at < self.CHAT_BAN_TABLE_TTL)
+
+    def _ensure_loaded(self):
+        if self._is_fresh():
+            return
+        with self._lock:
+            if self._is_fresh():
+                return
+            # An invalidate() while loading bumps the generation, so the next lookup reloads again
+            generation = self._generation
+            now = datetime.now(timezone.utc)
+            expired = ChatBan.query.filter(ChatBan.is_active == True, ChatBan.expires_at != None,
+                                           ChatBan.expires_at <= now).update({'is_active': False})
+            if expired:
+                db.session.commit()
+            bans = {}
+            rows = db.session.query(ChatBan.user_id, ChatBan.ban_type, ChatBan.reason, ChatBan.expires_at)\
+                .filter(ChatBan.is_active == True).order_by(ChatBan.created_at.desc()).all()
+            for user_id, ban_type, reason, expires_at in rows:
+                bans.setdefault(user_id, []).append((ban_type, reason, expires_at))
+            self._bans = bans
+            self._loaded_at = time.time()
+            self._loaded_generation = generation
+
+    def invalidate(self):
+        self._generation += 1
+
+    def get(self, user_id: int):
+        """(ban_type, reason, expires_at) of the newest unexpired ban, or None."""
+        self._ensure_loaded()
+        now = datetime.now(timezone.utc)
+        for ban_type, reason, expires_at in self._bans.get(user_id, ()):
+            if expires_at is None:
+                return ban_type, reason, expires_at
+            expires = expires_at if expires_at.tzinfo else expires_at.replace(tzinfo=timezone.utc)
+            if now < expires:
+                return ban_type, reason, expires_at
+        return None
+
+    def changed(self):
+        """Call after writing chat_bans: reload here and in every subscribed process."""
+        self.invalidate()
+        if self._redis is not None:
+            try:
+                self._redis.publish(self.CHANNEL, '1')
+            except Exception as e:
+                logger.debug(f"Chat ban change not published: {e}")
+
+    def attach_redis(self, redis_client):
+        """Publish changes to and listen for changes from other processes."""
+        if redis_client is None or self._redis is not None:
+            return
+        self._redis = redis_client
+        threading.Thread(target=self._listen, daemon=True, name="ChatBanListener").start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                # Changes may have been missed while unsubscribed
+                self.invalidate()
+                for _ in pubsub.listen():
+                    self.invalidate()
+            except Exception as e:
+                logger.debug(f"Chat ban listener reconnecting: {e}")
+                time.sleep(5)
+
+
+chat_ban_table = _ChatBanTable()
 
 
 # ==================== GAMIFICATION SYSTEM ====================
@@ -1334,18 +1879,12 @@ class UserLevel(db.Model):
     @staticmethod
     def get_level_for_xp(xp: int):
         """Get the appropriate level for given XP amount"""
-        return UserLevel.query.filter(
-            UserLevel.min_xp <= xp
-        ).order_by(UserLevel.min_xp.desc()).first()
+        return level_table.for_xp(xp)
     
     @staticmethod
     def get_next_level(current_level):
         """Get the next level after the current one"""
-        if not current_level:
-            return UserLevel.query.order_by(UserLevel.order_rank.asc()).first()
-        return UserLevel.query.filter(
-            UserLevel.order_rank > current_level.order_rank
-        ).order_by(UserLevel.order_rank.asc()).first()
+        return level_table.next_after(current_level)
     
     @staticmethod
     def initialize_default_levels():
@@ -1413,6 +1952,7 @@ class UserLevel(db.Model):
         
         if created_count > 0:
             db.session.commit()
+            level_table.invalidate()
         
         return created_count
 
@@ -1952,29 +2492,18 @@ class UserAchievement(db.Model):
         if not user:
             return unlocked
         
-        # Get user's trade history
-        total_trades = TradeHistory.query.filter_by(user_id=user_id).count()
-        profitable_trades = TradeHistory.query.filter(
-            TradeHistory.user_id == user_id,
-            TradeHistory.pnl > 0
-        ).count()
-        losing_trades = TradeHistory.query.filter(
-            TradeHistory.user_id == user_id,
-            TradeHistory.pnl < 0
-        ).count()
+        # Get user's trade totals from the daily rollup
+        trade_stats = DailyTradeRollup.totals(user_id)
+        total_trades = trade_stats['trades']
+        profitable_trades = trade_stats['wins']
+        losing_trades = trade_stats['losses']
         
         # Calculate total volume (sum of absolute PnL as proxy)
-        total_volume_result = db.session.query(func.sum(func.abs(TradeHistory.pnl))).filter(
-            TradeHistory.user_id == user_id
-        ).scalar()
-        total_volume = float(total_volume_result or 0) * 100  # Scale up as proxy for volume
+        total_volume = trade_stats['abs_pnl'] * 100  # Scale up as proxy for volume
 
         win_rate = (profitable_trades / total_trades) if total_trades > 0 else 0
 
-        max_profit_result = db.session.query(func.max(TradeHistory.pnl)).filter(
-            TradeHistory.user_id == user_id
-        ).scalar()
-        max_profit = float(max_profit_result or 0)
+        max_profit = float(trade_stats['max_pnl'] or 0)
         if trade_data and trade_data.get('pnl') is not None:
             try:
                 max_profit = max(max_profit, float(trade_data.get('pnl')))
@@ -2260,15 +2789,79 @@ class UserAchievement(db.Model):
 # ==================== GAMIFICATION HELPERS ====================
 # These functions are used by User class methods for late binding
 
+class _LevelTable:
+    """
+    Process-local copy of the user_levels table (a handful of static rows).
+
+    Lookups are bisect searches over the cached rows; the copy is reloaded
+    after LEVEL_TABLE_TTL seconds or when invalidate() is called after levels
+    change. Cached levels are transient UserLevel copies, never attached to a
+    session: read attributes or assign by id (user.current_level_id = level.id).
+    """
+
+    LEVEL_TABLE_TTL = 300
+
+    def __init__(self):
+        self._by_xp = []
+        self._min_xps = []
+        self._by_rank = []
+        self._ranks = []
+        self._by_id = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded_at and time.time() - self._loaded_at < self.LEVEL_TABLE_TTL:
+            return
+        with self._lock:
+            if self._loaded_at and time.time() - self._loaded_at < self.LEVEL_TABLE_TTL:
+                return
+            columns = [c.name for c in UserLevel.__table__.columns]
+            levels = [UserLevel(**{name: getattr(row, name) for name in columns}) for row in UserLevel.query.all()]
+            by_xp = sorted(levels, key=lambda level: level.min_xp or 0)
+            by_rank = sorted(levels, key=lambda level: level.order_rank or 0)
+            self._by_xp, self._min_xps = by_xp, [level.min_xp or 0 for level in by_xp]
+            self._by_rank, self._ranks = by_rank, [level.order_rank or 0 for level in by_rank]
+            self._by_id = {level.id: level for level in levels}
+            self._loaded_at = time.time()
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+    def all(self) -> list:
+        """Levels ordered by order_rank."""
+        self._ensure_loaded()
+        return list(self._by_rank)
+
+    def get(self, level_id):
+        self._ensure_loaded()
+        return self._by_id.get(level_id)
+
+    def for_xp(self, xp: int):
+        """Highest level whose min_xp <= xp, or None."""
+        self._ensure_loaded()
+        index = bisect.bisect_right(self._min_xps, xp or 0) - 1
+        return self._by_xp[index] if index >= 0 else None
+
+    def next_after(self, current_level):
+        """First level ranked above current_level (lowest level when None)."""
+        self._ensure_loaded()
+        if not current_level:
+            return self._by_rank[0] if self._by_rank else None
+        index = bisect.bisect_right(self._ranks, current_level.order_rank or 0)
+        return self._by_rank[index] if index < len(self._by_rank) else None
+
+
+level_table = _LevelTable()
+
+
 def _get_level_for_xp(xp: int):
     """Get the appropriate level for given XP amount"""
-    return UserLevel.query.filter(UserLevel.min_xp <= xp).order_by(UserLevel.min_xp.desc()).first()
+    return level_table.for_xp(xp)
 
 def _get_next_level(current_level):
     """Get the next level after the current one"""
-    if not current_level:
-        return UserLevel.query.order_by(UserLevel.order_rank.asc()).first()
-    return UserLevel.query.filter(UserLevel.order_rank > current_level.order_rank).order_by(UserLevel.order_rank.asc()).first()
+    return level_table.next_after(current_level)
 
 
 # ==================== SYSTEM STATS / INSURANCE FUND ====================
@@ -3764,8 +4357,7 @@ class Task(db.Model):
         
         # Check user level
         if user.current_level_id:
-            from models import UserLevel
-            level = UserLevel.query.get(user.current_level_id)
+            level = level_table.get(user.current_level_id)
             if level:
                 level_number = getattr(level, "level_number", None)
                 if level_number is None:
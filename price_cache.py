@@ -0,0 +1,298 @@
+"""
+Brain Capital - Shared Mark Price Cache
+
+Process-wide mark/last price cache so price reads never hit the exchange REST
+API on the hot path (slippage checks, master sizing, trailing SL monitor,
+per-account order sizing).
+
+Feeds:
+1. Binance Futures - ONE multiplexed websocket:
+   - !markPrice@arr@1s      -> mark price for every symbol, once per second
+   - <symbol>@bookTicker    -> best bid/ask (mid) for symbols being traded,
+                              added at runtime with the SUBSCRIBE method
+2. Other venues - CCXT Pro watch_ticker() per (venue, symbol), public endpoints only
+
+Readers call get() with a staleness bound (PRICE_CACHE_MAX_AGE, default 3s).
+get_or_fetch()/get_or_fetch_async() fall back to a REST fetch when the cached
+value is missing or stale and store the result, so the cache also works in
+processes where no stream is running (e.g. the web app).
+
+Usage:
+    from price_cache import get_price_cache
+
+    prices = get_price_cache()
+    await prices.start()                      # worker startup (needs a running loop)
+    price = prices.get('BTCUSDT')             # None if missing/stale
+    price = prices.get_or_fetch('BTCUSDT', lambda: rest_price('BTCUSDT'))
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger("PriceCache")
+
+BINANCE = 'binance'
+
+PRICE_CACHE_MAX_AGE = float(os.environ.get('PRICE_CACHE_MAX_AGE', '3'))
+BINANCE_FUTURES_WS = 'wss://fstream.binance.com/stream'
+BINANCE_FUTURES_TESTNET_WS = 'wss://stream.binancefuture.com/stream'
+_RECONNECT_DELAY = 5
+
+
+class MarkPriceCache:
+    """
+    Thread-safe price cache keyed by (venue, symbol).
+
+    Binance symbols use the exchange id format ('BTCUSDT'); other venues use
+    the CCXT unified symbol ('BTC/USDT:USDT').
+    """
+
+    def __init__(self, max_age: float = None, testnet: bool = False):
+        self.max_age = max_age if max_age is not None else PRICE_CACHE_MAX_AGE
+        self.testnet = testnet
+        self._prices: Dict[Tuple[str, str], Tuple[float, float, str]] = {}
+        self._lock = threading.Lock()
+        self._book_symbols: Set[str] = set()
+        self._watch_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._ccxt_clients = {}
+        self._binance_task: Optional[asyncio.Task] = None
+        self._binance_ws = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running = False
+        self.stats = {'hit': 0, 'stale': 0, 'miss': 0, 'rest': 0}
+
+    # ==================== READ / WRITE ====================
+
+    def update(self, symbol: str, price: float, venue: str = BINANCE, source: str = 'ws'):
+        """Store a price (ignored if not a positive number)."""
+        try:
+            price = float(price)
+        except (TypeError, ValueError):
+            return
+        if price <= 0:
+            return
+        with self._lock:
+            self._prices[(venue, symbol)] = (price, time.time(), source)
+
+    def get(self, symbol: str, venue: str = BINANCE, max_age: float = None) -> Optional[float]:
+        """Return the cached price if younger than max_age seconds, else None."""
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            entry = self._prices.get((venue, symbol))
+        if not entry:
+            self.stats['miss'] += 1
+            return None
+        price, ts, _ = entry
+        if time.time() - ts > max_age:
+            self.stats['stale'] += 1
+            return None
+        self.stats['hit'] += 1
+        return price
+
+    def age(self, symbol: str, venue: str = BINANCE) -> Optional[float]:
+        """Seconds since the price was last updated (None if never seen)."""
+        with self._lock:
+            entry = self._prices.get((venue, symbol))
+        return time.time() - entry[1] if entry else None
+
+    def get_or_fetch(self, symbol: str, fetch_fn: Callable[[], Optional[float]],
+                     venue: str = BINANCE, max_age: float = None) -> Optional[float]:
+        """Cached price, or a REST fallback via fetch_fn() (result is cached)."""
+        price = self.get(symbol, venue, max_age)
+        if price:
+            return price
+        self.track(symbol, venue)
+        self.stats['rest'] += 1
+        price = fetch_fn()
+        if price:
+            self.update(symbol, price, venue, source='rest')
+        return price
+
+    async def get_or_fetch_async(self, symbol: str, fetch_coro_fn: Callable[[], Awaitable[Optional[float]]],
+                                 venue: str = BINANCE, max_age: float = None) -> Optional[float]:
+        """Async variant of get_or_fetch for CCXT async clients."""
+        price = self.get(symbol, venue, max_age)
+        if price:
+            return price
+        self.track(symbol, venue)
+        self.stats['rest'] += 1
+        price = await fetch_coro_fn()
+        if price:
+            self.update(symbol, price, venue, source='rest')
+        return price
+
+    # ==================== SUBSCRIPTIONS ====================
+
+    def track(self, symbol: str, venue: str = BINANCE):
+        """
+        Ask the streams to keep `symbol` fresh.
+
+        Safe to call from any thread; a no-op when streams are not running.
+        Binance mark prices already cover every symbol, so this only adds a
+        bookTicker subscription there.
+        """
+        if not self._running or not self._loop:
+            return
+        if venue == BINANCE:
+            if symbol in self._book_symbols:
+                return
+            self._book_symbols.add(symbol)
+            self._loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(self._subscribe_book_ticker([symbol]))
+            )
+        elif (venue, symbol) not in self._watch_tasks:
+            self._loop.call_soon_threadsafe(self._start_watch, venue, symbol)
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self):
+        """Start the Binance multiplexed stream (call from a running event loop)."""
+        if self._running:
+            return
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+        self._binance_task = asyncio.create_task(self._binance_stream_loop())
+        logger.info("📡 Mark price cache started (Binance !markPrice@arr@1s)")
+
+    async def stop(self):
+        self._running = False
+        tasks = list(self._watch_tasks.values())
+        if self._binance_task:
+            tasks.append(self._binance_task)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._watch_tasks.clear()
+        for client in self._ccxt_clients.values():
+            try:
+                await client.close()
+            except Exception:
+                pass
+        self._ccxt_clients.clear()
+        logger.info("🛑 Mark price cache stopped")
+
+    # ==================== BINANCE STREAM ====================
+
+    async def _binance_stream_loop(self):
+        import aiohttp
+
+        base_url = BINANCE_FUTURES_TESTNET_WS if self.testnet else BINANCE_FUTURES_WS
+        url = f"{base_url}?streams=!markPrice@arr@1s"
+        while self._running:
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(url, heartbeat=30) as ws:
+                        self._binance_ws = ws
+                        logger.info("📡 Binance mark price stream connected")
+                        if self._book_symbols:
+                            await self._subscribe_book_ticker(list(self._book_symbols))
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self._handle_binance_message(msg.data)
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(f"Binance price stream error: {e}")
+            finally:
+                self._binance_ws = None
+            if self._running:
+                await asyncio.sleep(_RECONNECT_DELAY)
+
+    async def _subscribe_book_ticker(self, symbols):
+        ws = self._binance_ws
+        if not ws or ws.closed:
+            return  # Re-sent on (re)connect
+        params = [f"{s.lower()}@bookTicker" for s in symbols]
+        try:
+            await ws.send_str(json.dumps({'method': 'SUBSCRIBE', 'params': params, 'id': int(time.time() * 1000)}))
+        except Exception as e:
+            logger.debug(f"bookTicker subscribe failed: {e}")
+
+    def _handle_binance_message(self, raw: str):
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            return
+        data = payload.get('data') if isinstance(payload, dict) else None
+        if data is None:
+            return  # Subscription acks
+        if isinstance(data, list):
+            # !markPrice@arr - [{'e': 'markPriceUpdate', 's': 'BTCUSDT', 'p': '...'}, ...]
+            now = time.time()
+            with self._lock:
+                for item in data:
+                    try:
+                        price = float(item['p'])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    if price > 0:
+                        self._prices[(BINANCE, item['s'])] = (price, now, 'mark')
+        elif 'b' in data and 'a' in data and 's' in data:
+            # bookTicker - best bid/ask, use the mid
+            try:
+                mid = (float(data['b']) + float(data['a'])) / 2
+            except (TypeError, ValueError):
+                return
+            self.update(data['s'], mid, BINANCE, source='book')
+
+    # ==================== CCXT PRO (OTHER VENUES) ====================
+
+    def _start_watch(self, venue: str, symbol: str):
+        if (venue, symbol) in self._watch_tasks or not self._running:
+            return
+        self._watch_tasks[(venue, symbol)] = asyncio.ensure_future(self._watch_loop(venue, symbol))
+
+    async def _watch_loop(self, venue: str, symbol: str):
+        try:
+            import ccxt.pro as ccxtpro
+        except ImportError:
+            logger.debug("ccxt.pro not available - REST fallback only for non-Binance venues")
+            return
+        from service_validator import SUPPORTED_EXCHANGES
+
+        class_name = SUPPORTED_EXCHANGES.get(venue, venue)
+        if not hasattr(ccxtpro, class_name):
+            return
+        client = self._ccxt_clients.get(venue)
+        if client is None:
+            client = getattr(ccxtpro, class_name)({'options': {'defaultType': 'swap'}})
+            self._ccxt_clients[venue] = client
+        while self._running:
+            try:
+                ticker = await client.watch_ticker(symbol)
+                self.update(symbol, ticker.get('last') or ticker.get('close'), venue, source='ws')
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.debug(f"watch_ticker {venue} {symbol} error: {e}")
+                await asyncio.sleep(_RECONNECT_DELAY)
+
+
+_price_cache: Optional[MarkPriceCache] = None
+_price_cache_lock = threading.Lock()
+
+
+def get_price_cache() -> MarkPriceCache:
+    """Process-wide MarkPriceCache singleton."""
+    global _price_cache
+    if _price_cache is None:
+        with _price_cache_lock:
+            if _price_cache is None:
+                try:
+                    from config import Config
+                    testnet = bool(getattr(Config, 'IS_TESTNET', False))
+                except Exception:
+                    testnet = False
+                _price_cache = MarkPriceCache(testnet=testnet)
+    return _price_cache
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the webhook request pipeline under a TradingView alert burst.
+
+Compares the per-request parse/auth/validate cost of the previous pipeline
+(JSON decoded by validate_webhook, security_checks and webhook, generic
+pydantic + injection scan, passphrase compared twice) against the single-parse
+fast path (parse_webhook_request). Exchange/queue work is excluded - it is
+identical for both.
+
+Usage:
+  python scripts/bench_webhook.py
+  python scripts/bench_webhook.py --burst 5000
+"""
+
+import argparse
+import json
+import os
+import re
+import secrets
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request  # noqa: E402
+
+from config import Config  # noqa: E402
+from security import parse_webhook_request, validate_json_payload  # noqa: E402
+
+SYMBOLS = ('BINANCE:BTCUSDT.P', 'ETHUSDT.P', 'SOLUSDT', '1000PEPEUSDT.P', 'BNBUSDT')
+ACTIONS = ('buy', 'sell', 'close')
+
+
+def _burst(size: int):
+    passphrase = Config.WEBHOOK_PASSPHRASE or 'bench-passphrase'
+    Config.WEBHOOK_PASSPHRASE = passphrase
+    for i in range(size):
+        body = json.dumps({
+            'passphrase': passphrase,
+            'symbol': SYMBOLS[i % len(SYMBOLS)],
+            'action': ACTIONS[i % len(ACTIONS)],
+            'tp_perc': 3.5,
+            'sl_perc': 1.5,
+            'leverage': 10,
+            'strategy_id': 1 + i % 3,
+            'contracts': '0.01',
+            'price': '50000.00',
+        })
+        if i % 10 == 0:
+            body = body[:-1] + ',}'  # Some alert templates leave a trailing comma
+        yield body
+
+
+def _legacy():
+    passphrase = str(Config.WEBHOOK_PASSPHRASE)
+    # validate_webhook
+    data = request.get_json(silent=True) or {}
+    secrets.compare_digest(str(data.get('passphrase', '')), passphrase)
+    # security_checks
+    validate_json_payload(request.get_json(silent=True))
+    # webhook
+    data = request.get_json(silent=True)
+    if not data:
+        data = json.loads(re.sub(r',(\s*[}\]])', r'\1', request.get_data(as_text=True)))
+    secrets.compare_digest(str(data.get('passphrase', '')), passphrase)
+
+
+def _fast():
+    parse_webhook_request()
+
+
+def run(size: int):
+    app = Flask(__name__)
+    bodies = list(_burst(size))
+    results = {}
+    for name, stage in (('legacy', _legacy), ('single-parse', _fast)):
+        started = time.perf_counter()
+        for body in bodies:
+            with app.test_request_context('/webhook', method='POST', data=body,
+                                          content_type='application/json'):
+                stage()
+        elapsed = time.perf_counter() - started
+        results[name] = elapsed
+        print(f"{name:>13}: {size / elapsed:9.0f} req/s  ({elapsed / size * 1e6:7.1f} us/request)")
+    print(f"{'speedup':>13}: {results['legacy'] / results['single-parse']:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--burst', type=int, default=2000, help='number of alerts in the burst')
+    run(parser.parse_args().burst)
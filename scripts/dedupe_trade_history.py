@@ -19,7 +19,7 @@ from datetime import timedelta
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app, db  # noqa: E402
-from models import TradeHistory  # noqa: E402
+from models import DailyTradeRollup, TradeHistory  # noqa: E402
 
 
 def _normalize_exchange_from_node(node_name: str) -> str:
@@ -71,6 +71,9 @@ def dedupe_trades(window_seconds: int, apply_changes: bool, master_only: bool) -
     if apply_changes:
         for trade in duplicates:
             db.session.delete(trade)
+        # Recount the affected days so stats stop including the deleted rows
+        earliest_day = min(trade.close_time for trade in duplicates).date()
+        DailyTradeRollup.rebuild(earliest_day)
         db.session.commit()
         print("Duplicates removed.")
     else:
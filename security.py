@@ -5,17 +5,18 @@ Comprehensive protection against attacks
 
 import time
 import hashlib
+import json
 import secrets
 import logging
 import re
-from typing import Any, Dict, List, Union, Tuple
+from typing import Any, Dict, List, Optional, Union, Tuple
 from functools import wraps
 from collections import defaultdict
 from datetime import datetime, timedelta
 from threading import Lock
 
 from flask import request, abort, session, g, jsonify
-from pydantic import BaseModel, JsonValue, ValidationError, field_validator
+from pydantic import BaseModel, ConfigDict, Field, JsonValue, ValidationError, field_validator
 import bleach
 
 logger = logging.getLogger("Security")
@@ -486,6 +487,95 @@ def validate_json_payload(payload: Any) -> Tuple[bool, str]:
     return True, ""
 
 
+# ==================== WEBHOOK FAST PATH ====================
+
+WEBHOOK_SECRET_FIELDS = ('passphrase', 'secret_key', 'secret')
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+
+class WebhookSignal(BaseModel):
+    """TradingView alert schema (unknown fields such as contracts/price are ignored)"""
+    model_config = ConfigDict(extra='ignore')
+
+    symbol: Optional[str] = Field(None, max_length=64)
+    ticker: Optional[str] = Field(None, max_length=64)
+    action: str = Field('close', max_length=16)
+    tp_perc: Optional[float] = None
+    sl_perc: Optional[float] = None
+    risk_perc: Optional[float] = None
+    leverage: Optional[float] = None
+    strategy_id: Optional[Union[int, str]] = Field(None, union_mode='left_to_right')
+
+
+class WebhookRequest:
+    """
+    A webhook body parsed, authenticated and validated exactly once per request.
+
+    error is None, 'invalid_json' or 'invalid_payload'; signal is only set for
+    authenticated requests with a valid payload.
+    """
+    __slots__ = ('data', 'error', 'detail', 'authenticated', 'signal', 'repaired')
+
+    def __init__(self):
+        self.data: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.detail: str = ''
+        self.authenticated = False
+        self.signal: Optional[WebhookSignal] = None
+        self.repaired = False
+
+
+def _load_webhook_json(raw: bytes, parsed: WebhookRequest):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        pass
+    # TradingView templates often leave trailing commas - repair once
+    try:
+        data = json.loads(_TRAILING_COMMA.sub(r'\1', raw.decode('utf-8', errors='replace')))
+        parsed.repaired = True
+        return data
+    except ValueError as e:
+        parsed.error, parsed.detail = 'invalid_json', str(e)
+        return None
+
+
+WEBHOOK_REQUEST_ENV_KEY = 'brain_capital.webhook_request'
+
+
+def parse_webhook_request() -> WebhookRequest:
+    """Parse, authenticate and validate the current webhook body (cached on the request)."""
+    # Cached in the WSGI environ, not on g: g lives on the app context, which can
+    # outlive a request and would hand one request's result to the next
+    parsed = request.environ.get(WEBHOOK_REQUEST_ENV_KEY)
+    if parsed is not None:
+        return parsed
+    parsed = WebhookRequest()
+    request.environ[WEBHOOK_REQUEST_ENV_KEY] = parsed
+
+    raw = request.get_data(cache=True)
+    if not raw or not raw.strip():
+        return parsed  # Health check ping
+    data = _load_webhook_json(raw, parsed)
+    if parsed.error:
+        return parsed
+    if not isinstance(data, dict):
+        parsed.error, parsed.detail = 'invalid_json', 'JSON body must be an object'
+        return parsed
+    parsed.data = data
+
+    received_pass = next((data[k] for k in WEBHOOK_SECRET_FIELDS if data.get(k)), '')
+    if received_pass:
+        from config import Config
+        parsed.authenticated = secrets.compare_digest(str(received_pass), str(Config.WEBHOOK_PASSPHRASE))
+    if parsed.authenticated:
+        try:
+            parsed.signal = WebhookSignal.model_validate(data)
+        except ValidationError as e:
+            parsed.error, parsed.detail = 'invalid_payload', str(e)
+    return parsed
+
+
 # ==================== SECURITY DECORATORS ====================
 
 def rate_limit(max_requests: int = 10, window: int = 60, key_func=None):
@@ -584,25 +674,15 @@ def get_user_id_from_bearer(auth_header: str):
 def validate_webhook(f):
     """
     Webhook validation decorator
-    Checks passphrase and rate limits
+    Checks passphrase and rate limits (the body is parsed once, see parse_webhook_request)
     """
     @wraps(f)
     def wrapped(*args, **kwargs):
         ip = get_client_ip()
 
         # Rate limit webhooks (higher limits for valid passphrase)
-        max_requests = 30
         window = 60
-        try:
-            data = request.get_json(silent=True) or {}
-            received_pass = data.get('passphrase', '') or data.get('secret_key', '') or data.get('secret', '')
-            if received_pass:
-                from config import Config
-                if secrets.compare_digest(str(received_pass), str(Config.WEBHOOK_PASSPHRASE)):
-                    max_requests = 1200
-        except Exception:
-            # If parsing fails, keep strict rate limit
-            pass
+        max_requests = 1200 if parse_webhook_request().authenticated else 30
 
         if not webhook_limiter.check(ip, max_requests=max_requests, window=window):
             logger.warning(f"Webhook rate limit exceeded for {ip}")
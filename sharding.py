@@ -0,0 +1,277 @@
+"""
+Brain Capital - Worker Sharding
+
+Horizontal partitioning of slave accounts across multiple ARQ workers.
+
+Each worker started with WORKER_SHARD_ID joins the shard ring by writing a
+heartbeat to Redis. Accounts are assigned to shards by consistent hashing on
+user_id (default) or on the account's proxy, so only ~1/N of the accounts
+move when a shard joins or leaves.
+
+Signal flow (sharded mode):
+1. Webhook reads the live shard list and enqueues ONE job per shard
+   (queue: arq:queue:shard:{shard_id}), all sharing the same signal_id
+2. Each shard executes the signal only for the accounts it owns
+3. Master accounts are executed by the single shard owning MASTER_SHARD_KEY
+4. Each shard writes its completion report to signal_status:{signal_id}
+
+Redis Keys Structure:
+- arq:shards -> Hash {shard_id: last_heartbeat_unix}
+- signal_status:{signal_id} -> Hash {shard_id: JSON completion report, _expected: JSON shard list}
+
+Configuration (environment):
+- WORKER_SHARD_ID: Shard identifier for this worker (unset = unsharded legacy mode)
+- SHARD_KEY: 'user' (default) or 'proxy'
+- SHARD_HEARTBEAT_INTERVAL: Seconds between heartbeats (default 10)
+- SHARD_HEARTBEAT_TTL: Seconds after which a silent shard is considered gone (default 30)
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("Sharding")
+
+SHARDS_KEY = 'arq:shards'
+SHARD_QUEUE_PREFIX = 'arq:queue:shard:'
+SIGNAL_STATUS_PREFIX = 'signal_status:'
+SIGNAL_STATUS_TTL = 3600
+EXPECTED_SHARDS_FIELD = '_expected'
+MASTER_SHARD_KEY = 'master'
+
+SHARD_ID = os.environ.get('WORKER_SHARD_ID') or None
+SHARD_KEY_MODE = os.environ.get('SHARD_KEY', 'user').lower()
+SHARD_HEARTBEAT_INTERVAL = int(os.environ.get('SHARD_HEARTBEAT_INTERVAL', '10'))
+SHARD_HEARTBEAT_TTL = int(os.environ.get('SHARD_HEARTBEAT_TTL', '30'))
+
+
+def shard_queue_name(shard_id: str) -> str:
+    """ARQ queue name consumed by a given shard."""
+    return f"{SHARD_QUEUE_PREFIX}{shard_id}"
+
+
+def signal_status_key(signal_id: str) -> str:
+    return f"{SIGNAL_STATUS_PREFIX}{signal_id}"
+
+
+def account_shard_key(user_id, proxy: str = None, mode: str = None) -> str:
+    """
+    Build the consistent-hash key for an account.
+
+    In 'proxy' mode all accounts behind the same proxy land on the same shard,
+    which keeps each proxy's rate budget on a single host. Accounts without a
+    proxy fall back to user-based placement.
+    """
+    mode = (mode or SHARD_KEY_MODE).lower()
+    if mode == 'proxy' and proxy:
+        return f"proxy:{proxy}"
+    return f"user:{user_id}"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class ShardRing:
+    """
+    Consistent hash ring with virtual nodes.
+
+    Every shard is placed on the ring `vnodes` times so keys spread evenly
+    even with a handful of shards.
+    """
+
+    def __init__(self, shards: Iterable[str] = (), vnodes: int = 64):
+        self.vnodes = vnodes
+        self.shards = sorted(set(str(s) for s in shards))
+        self._points: List[int] = []
+        self._owners: List[str] = []
+
+        ring = []
+        for shard in self.shards:
+            for i in range(vnodes):
+                ring.append((_hash(f"{shard}#{i}"), shard))
+        ring.sort()
+        self._points = [point for point, _ in ring]
+        self._owners = [owner for _, owner in ring]
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def get_shard(self, key: str) -> Optional[str]:
+        """Return the shard owning `key`, or None if the ring is empty."""
+        if not self._points:
+            return None
+        idx = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[idx]
+
+
+def _live_from_mapping(mapping: Dict, now: float, ttl: int) -> List[str]:
+    live = []
+    for shard_id, ts in (mapping or {}).items():
+        if isinstance(shard_id, (bytes, bytearray)):
+            shard_id = shard_id.decode('utf-8')
+        if isinstance(ts, (bytes, bytearray)):
+            ts = ts.decode('utf-8')
+        try:
+            if now - float(ts) <= ttl:
+                live.append(shard_id)
+        except (TypeError, ValueError):
+            continue
+    return sorted(live)
+
+
+def get_live_shards(redis_client, ttl: int = None) -> List[str]:
+    """Read live shard ids with a sync Redis client (web process)."""
+    if not redis_client:
+        return []
+    try:
+        mapping = redis_client.hgetall(SHARDS_KEY)
+    except Exception as e:
+        logger.debug(f"Could not read shard registry: {e}")
+        return []
+    return _live_from_mapping(mapping, time.time(), ttl or SHARD_HEARTBEAT_TTL)
+
+
+def register_signal_broadcast(redis_client, signal_id: str, shards: List[str]) -> None:
+    """Record which shards a signal was broadcast to (sync Redis client, web process)."""
+    if not redis_client or not signal_id:
+        return
+    try:
+        key = signal_status_key(signal_id)
+        redis_client.hset(key, EXPECTED_SHARDS_FIELD, json.dumps(list(shards)))
+        redis_client.expire(key, SIGNAL_STATUS_TTL)
+    except Exception as e:
+        logger.debug(f"Could not register signal broadcast {signal_id}: {e}")
+
+
+def get_signal_status(redis_client, signal_id: str) -> dict:
+    """
+    Return the broadcast state of a signal (sync Redis client).
+
+    Returns:
+        {'expected': [shard_id, ...], 'reports': {shard_id: report}, 'complete': bool}
+    """
+    status = {'expected': [], 'reports': {}, 'complete': False}
+    if not redis_client or not signal_id:
+        return status
+    try:
+        raw = redis_client.hgetall(signal_status_key(signal_id))
+    except Exception as e:
+        logger.debug(f"Could not read signal status {signal_id}: {e}")
+        return status
+    for field, payload in (raw or {}).items():
+        if isinstance(field, (bytes, bytearray)):
+            field = field.decode('utf-8')
+        try:
+            value = json.loads(payload)
+        except (TypeError, ValueError):
+            continue
+        if field == EXPECTED_SHARDS_FIELD:
+            status['expected'] = value
+        else:
+            status['reports'][field] = value
+    status['complete'] = bool(status['expected']) and all(
+        shard_id in status['reports'] for shard_id in status['expected']
+    )
+    return status
+
+
+async def report_signal_completion(redis_client, signal_id: str, shard_id: str, report: dict):
+    """Record this shard's completion report for the originating signal (async Redis client)."""
+    if not redis_client or not signal_id:
+        return
+    try:
+        key = signal_status_key(signal_id)
+        await redis_client.hset(key, shard_id, json.dumps(report, default=str))
+        await redis_client.expire(key, SIGNAL_STATUS_TTL)
+    except Exception as e:
+        logger.warning(f"Could not report signal {signal_id} completion for shard {shard_id}: {e}")
+
+
+class ShardMembership:
+    """
+    Worker-side shard membership.
+
+    Heartbeats this shard into the registry and watches the live shard set.
+    When shards join or leave, the ring is rebuilt and `on_rebalance` is
+    awaited so the worker can reload the accounts it now owns.
+    """
+
+    def __init__(self, redis_client, shard_id: str,
+                 on_rebalance: Callable = None,
+                 interval: int = None, ttl: int = None):
+        self.redis = redis_client
+        self.shard_id = str(shard_id)
+        self.on_rebalance = on_rebalance
+        self.interval = interval or SHARD_HEARTBEAT_INTERVAL
+        self.ttl = ttl or SHARD_HEARTBEAT_TTL
+        self.ring = ShardRing([self.shard_id])
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+    def owns(self, key: str) -> bool:
+        """True if this shard owns the given hash key."""
+        return self.ring.get_shard(key) == self.shard_id
+
+    def owns_account(self, user_id, proxy: str = None) -> bool:
+        return self.owns(account_shard_key(user_id, proxy))
+
+    async def _heartbeat(self):
+        await self.redis.hset(SHARDS_KEY, self.shard_id, str(time.time()))
+
+    async def _read_live_shards(self) -> List[str]:
+        mapping = await self.redis.hgetall(SHARDS_KEY)
+        live = _live_from_mapping(mapping, time.time(), self.ttl)
+        if self.shard_id not in live:
+            live.append(self.shard_id)
+        return sorted(live)
+
+    async def join(self) -> ShardRing:
+        """Register this shard and build the initial ring (called once at startup)."""
+        await self._heartbeat()
+        self.ring = ShardRing(await self._read_live_shards())
+        logger.info(f"🧩 Shard {self.shard_id} joined ring: {self.ring.shards}")
+        return self.ring
+
+    async def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop heartbeating and leave the ring so peers rebalance immediately."""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.redis.hdel(SHARDS_KEY, self.shard_id)
+            logger.info(f"🧩 Shard {self.shard_id} left ring")
+        except Exception as e:
+            logger.debug(f"Could not deregister shard {self.shard_id}: {e}")
+
+    async def _loop(self):
+        while self._running:
+            try:
+                await asyncio.sleep(self.interval)
+                await self._heartbeat()
+                live = await self._read_live_shards()
+                if live != self.ring.shards:
+                    previous = self.ring.shards
+                    self.ring = ShardRing(live)
+                    logger.info(f"🧩 Shard ring changed: {previous} -> {live}, rebalancing")
+                    if self.on_rebalance:
+                        await self.on_rebalance(self.ring)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(f"Shard heartbeat error: {e}")
@@ -0,0 +1,233 @@
+"""
+Brain Capital - Signal Dispatch
+
+Priority lanes, coalescing and enqueue for signals entering the ARQ queue.
+
+Priority lanes:
+ARQ pops jobs in ascending score order (score = enqueue time in ms). Signals
+are enqueued with a negative defer so their score sits a fixed offset in the
+past, which places every close ahead of every open, opens ahead of DCA, and
+DCA ahead of cron/background jobs (offset 0). The offsets are far larger than
+any realistic queue backlog, so FIFO order is kept within a lane.
+
+    close       -> score = now - 4h
+    open        -> score = now - 3h
+    dca         -> score = now - 2h
+    background  -> score = now  (cron jobs, maintenance tasks)
+
+Because the offset is recoverable from (enqueue_time - score), the worker can
+attribute queue wait time to a lane for ANY job, including cron jobs.
+
+Coalescing:
+Identical signals (same symbol, action and strategy) arriving within
+SIGNAL_COALESCE_WINDOW seconds share one idempotency key. Only the first one
+is enqueued; duplicates return the original job id. The claim holds a
+per-request owner token until the job id replaces it, so a request whose
+enqueue fails can release its own claim (release_claim) and a retry of the
+same alert is accepted instead of coalesced into nothing.
+
+Enqueue:
+enqueue_arq_job() writes ARQ-compatible jobs with the web process's
+long-lived sync Redis client - one pipelined MULTI round trip for any number
+of queues, no event loop or ARQ pool per webhook.
+
+Redis Keys Structure:
+- signal_dedupe:{idempotency_key} -> pending:{owner} until enqueued, then the
+  job_id of the first signal (TTL = window)
+- arq:job:{job_id} -> JSON job (fast_json, as configured in WorkerSettings.job_serializer)
+- {queue_name} -> ZSET job_id -> score (ms)
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple
+
+import fast_json
+
+logger = logging.getLogger("SignalDispatch")
+
+LANE_CLOSE = 'close'
+LANE_OPEN = 'open'
+LANE_DCA = 'dca'
+LANE_BACKGROUND = 'background'
+
+LANE_SCORE_OFFSETS = {
+    LANE_CLOSE: timedelta(hours=4),
+    LANE_OPEN: timedelta(hours=3),
+    LANE_DCA: timedelta(hours=2),
+    LANE_BACKGROUND: timedelta(0),
+}
+
+ARQ_QUEUE_NAME = 'arq:queue'
+ARQ_JOB_KEY_PREFIX = 'arq:job:'
+ARQ_EXPIRES_EXTRA_MS = 86_400_000  # arq keeps unstarted jobs one day past their score
+
+SIGNAL_COALESCE_WINDOW = int(os.environ.get('SIGNAL_COALESCE_WINDOW', '10'))
+DEDUPE_KEY_PREFIX = 'signal_dedupe:'
+_PENDING_JOB = 'pending'
+
+_RELEASE_CLAIM = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# In-process fallback when Redis is unavailable (single web worker / development)
+_local_claims = {}
+_local_claims_lock = threading.Lock()
+
+
+def signal_lane(signal: dict) -> str:
+    """Map a trading signal to its priority lane."""
+    action = str(signal.get('action', '')).lower()
+    if action == 'close':
+        return LANE_CLOSE
+    if action == 'dca':
+        return LANE_DCA
+    if action in ('long', 'short'):
+        return LANE_OPEN
+    return LANE_BACKGROUND
+
+
+def lane_defer_by(lane: str) -> Optional[timedelta]:
+    """Negative defer passed to arq's enqueue_job (None for background)."""
+    offset = LANE_SCORE_OFFSETS.get(lane, timedelta(0))
+    if not offset:
+        return None
+    return -offset
+
+
+def lane_from_score(enqueue_time_ms: float, score_ms: float) -> str:
+    """Recover a job's lane from how far its score sits before its enqueue time."""
+    offset_ms = max(0.0, float(enqueue_time_ms) - float(score_ms))
+    return min(
+        LANE_SCORE_OFFSETS,
+        key=lambda lane: abs(LANE_SCORE_OFFSETS[lane].total_seconds() * 1000 - offset_ms)
+    )
+
+
+def signal_idempotency_key(signal: dict) -> str:
+    """Idempotency key for coalescing: symbol + action + strategy."""
+    raw = '|'.join([
+        str(signal.get('symbol', '')).upper(),
+        str(signal.get('action', '')).lower(),
+        str(signal.get('strategy_id') or ''),
+    ])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _decode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8')
+    return value
+
+
+def _pending(owner: str) -> str:
+    return f"{_PENDING_JOB}:{owner}"
+
+
+def _job_id(existing) -> Optional[str]:
+    """Job id stored in a claim (None while the claimer is still enqueueing)."""
+    if existing is None or existing.startswith(_PENDING_JOB):
+        return None
+    return existing
+
+
+def claim_signal(redis_client, signal: dict, window: int = None,
+                 owner: str = None) -> Tuple[bool, Optional[str]]:
+    """
+    Claim the idempotency key for a signal.
+
+    Pass the same owner to release_claim() if the enqueue fails.
+
+    Returns:
+        (True, None) if this is the first signal in the window and should be enqueued,
+        (False, job_id) if an identical signal was already accepted.
+    """
+    window = window or SIGNAL_COALESCE_WINDOW
+    if window <= 0:
+        return True, None
+    key = signal_idempotency_key(signal)
+    pending = _pending(owner or uuid.uuid4().hex)
+
+    if redis_client:
+        try:
+            dedupe_key = f"{DEDUPE_KEY_PREFIX}{key}"
+            if redis_client.set(dedupe_key, pending, nx=True, ex=window):
+                return True, None
+            return False, _job_id(_decode(redis_client.get(dedupe_key)))
+        except Exception as e:
+            # Fail open: never drop a signal because dedupe storage is unavailable
+            logger.warning(f"Signal dedupe unavailable, enqueueing anyway: {e}")
+            return True, None
+
+    now = time.time()
+    with _local_claims_lock:
+        for stale in [k for k, (_, exp) in _local_claims.items() if exp <= now]:
+            _local_claims.pop(stale, None)
+        if key in _local_claims:
+            return False, _job_id(_local_claims[key][0])
+        _local_claims[key] = (pending, now + window)
+    return True, None
+
+
+def release_claim(redis_client, signal: dict, owner: str) -> None:
+    """Drop a claim whose enqueue failed, only if it is still this owner's pending claim."""
+    key = signal_idempotency_key(signal)
+    if redis_client:
+        try:
+            redis_client.eval(_RELEASE_CLAIM, 1, f"{DEDUPE_KEY_PREFIX}{key}", _pending(owner))
+        except Exception as e:
+            logger.warning(f"Could not release signal claim, duplicates coalesce until it expires: {e}")
+        return
+    with _local_claims_lock:
+        if key in _local_claims and _local_claims[key][0] == _pending(owner):
+            _local_claims.pop(key, None)
+
+
+def record_claimed_job(redis_client, signal: dict, job_id: str) -> None:
+    """Attach the enqueued job id to the signal's claim so duplicates can report it."""
+    if not job_id:
+        return
+    key = signal_idempotency_key(signal)
+    if redis_client:
+        try:
+            redis_client.set(f"{DEDUPE_KEY_PREFIX}{key}", job_id, xx=True, keepttl=True)
+        except Exception as e:
+            logger.debug(f"Could not record job id for signal claim: {e}")
+        return
+    with _local_claims_lock:
+        if key in _local_claims:
+            _local_claims[key] = (job_id, _local_claims[key][1])
+
+
+def enqueue_arq_job(redis_client, function: str, *args, queue_names: Iterable[str] = None,
+                    defer_by: Optional[timedelta] = None) -> List[str]:
+    """
+    Enqueue `function(*args)` on each queue in one pipelined transaction.
+
+    Produces the same job key, payload and score as arq's enqueue_job, so
+    workers cannot tell the difference. Returns one job id per queue.
+    """
+    from arq.jobs import serialize_job
+
+    enqueue_time_ms = int(time.time() * 1000)
+    score = enqueue_time_ms + (int(defer_by.total_seconds() * 1000) if defer_by else 0)
+    expires_ms = score - enqueue_time_ms + ARQ_EXPIRES_EXTRA_MS
+    job = serialize_job(function, args, {}, None, enqueue_time_ms, serializer=fast_json.dumps_job)
+
+    job_ids = []
+    pipe = redis_client.pipeline(transaction=True)
+    for queue_name in (queue_names or (ARQ_QUEUE_NAME,)):
+        job_id = uuid.uuid4().hex
+        pipe.psetex(f"{ARQ_JOB_KEY_PREFIX}{job_id}", expires_ms, job)
+        pipe.zadd(queue_name, {job_id: score})
+        job_ids.append(job_id)
+    pipe.execute()
+    return job_ids
@@ -385,7 +385,7 @@ class SmartFeaturesManager:
             
             is_ccxt = slave_data.get('is_ccxt', False)
             is_async = slave_data.get('is_async', False)
-            exchange_type = slave_data.get('exchange_name', 'binance')
+            exchange_type = slave_data.get('exchange_type') or slave_data.get('exchange_name', 'binance')
             node_name = slave_data.get('fullname', f'User_{user_id}')
             
             closed_position = False
@@ -687,8 +687,10 @@ class SmartFeaturesManager:
                 if self.engine and self.engine.master_client:
                     for symbol in symbols:
                         try:
-                            ticker = self.engine.master_client.futures_symbol_ticker(symbol=symbol)
-                            current_price = float(ticker['price'])
+                            current_price = self.engine.price_cache.get_or_fetch(
+                                symbol,
+                                lambda: float(self.engine.master_client.futures_symbol_ticker(symbol=symbol)['price'])
+                            )
                             
                             # Update all trailing SLs for this symbol
                             for user_id, pos_symbol in positions:
@@ -296,9 +296,28 @@ class MimicChat {
         if (this.socket) {
             this.socket.emit('leave_chat', { room: this.room });
         }
+        this.stopHeartbeat();
+    }
+    
+    // Keeps this user in the online list while the chat is open
+    startHeartbeat() {
+        this.stopHeartbeat();
+        this.heartbeatTimer = setInterval(() => {
+            if (this.socket && this.socket.connected) {
+                this.socket.emit('chat_heartbeat', { room: this.room });
+            }
+        }, 60000);
+    }
+    
+    stopHeartbeat() {
+        if (this.heartbeatTimer) {
+            clearInterval(this.heartbeatTimer);
+            this.heartbeatTimer = null;
+        }
     }
     
     onChatJoined(data) {
+        this.startHeartbeat();
         this.userId = data.user?.id;
         this.username = data.user?.username;
         this.isAdmin = data.user?.is_admin;
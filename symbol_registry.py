@@ -0,0 +1,225 @@
+"""
+Brain Capital - Symbol Registry
+
+Precomputed, bidirectional symbol mapping between TradingView tickers, the
+canonical Binance USD(S)-M futures id used throughout the engine, and each
+CCXT exchange's unified symbol.
+
+    TradingView        canonical         CCXT (per exchange)
+    BINANCE:BTCUSDT.P  BTCUSDT     <->   BTC/USDT:USDT
+    1000PEPEUSDT.P     1000PEPEUSDT <->  PEPE/USDT:USDT (okx), 1000PEPE/USDT:USDT (bybit)
+    BTCUSDC.P          BTCUSDC     <->   BTC/USDC:USDC
+
+Maps are rebuilt only when markets are loaded; every lookup on the signal
+path is a dict access. Raw-string parsing is memoized, so each distinct
+ticker is parsed once per process.
+
+1000-prefixed contracts: when an exchange lists the token without the 1000x
+multiplier (or vice versa), the market is registered under both forms; an
+exact match always wins over the alias. Reverse lookups return the id the
+Binance master trades, so positions on any venue compare equal to signals.
+
+Usage:
+    from symbol_registry import get_symbol_registry, normalize_symbol
+
+    normalize_symbol('BINANCE:ETHUSDT.P')          # 'ETHUSDT'
+    registry = get_symbol_registry()
+    registry.to_ccxt('ETHUSDT', 'okx')             # 'ETH/USDT:USDT' (None if not listed)
+    registry.from_ccxt('okx', 'ETH/USDT:USDT')     # 'ETHUSDT'
+"""
+
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("SymbolRegistry")
+
+BINANCE = 'binance'
+
+# Quote/settle currencies recognised when splitting a canonical id (longest first)
+QUOTE_ASSETS = ('FDUSD', 'USDT', 'USDC', 'BUSD', 'USD')
+_MULTIPLIER_PREFIX = '1000'
+_TV_SUFFIXES = ('.P', '.S', 'PERP', '-SWAP')
+_MAX_PARSE_CACHE = 4096
+
+
+def split_canonical(canonical: str) -> Tuple[str, str]:
+    """Split 'BTCUSDT' into ('BTC', 'USDT'); unknown quotes default to USDT."""
+    for quote in QUOTE_ASSETS:
+        if canonical.endswith(quote) and len(canonical) > len(quote):
+            return canonical[:-len(quote)], quote
+    return canonical, 'USDT'
+
+
+def _multiplier_alias(base: str) -> Optional[str]:
+    """'1000PEPE' <-> 'PEPE' (None for bases that are just digits)."""
+    if base.startswith(_MULTIPLIER_PREFIX) and base[len(_MULTIPLIER_PREFIX):].isalpha():
+        return base[len(_MULTIPLIER_PREFIX):]
+    if base.isalnum() and not base.startswith(_MULTIPLIER_PREFIX):
+        return f"{_MULTIPLIER_PREFIX}{base}"
+    return None
+
+
+def _parse(raw: str) -> str:
+    symbol = (raw or '').strip().upper()
+    if not symbol:
+        return ''
+    if '/' in symbol:
+        # CCXT unified: BASE/QUOTE[:SETTLE]
+        base, rest = symbol.split('/', 1)
+        return f"{base}{rest.split(':', 1)[0]}".replace('-', '').replace('_', '')
+    if ':' in symbol:
+        # TradingView exchange prefix: BINANCE:BTCUSDT.P
+        symbol = symbol.split(':')[-1]
+    for suffix in _TV_SUFFIXES:
+        if symbol.endswith(suffix):
+            symbol = symbol[:-len(suffix)]
+            break
+    return symbol.replace('-', '').replace('_', '').replace('.', '')
+
+
+class SymbolRegistry:
+    """Market-backed symbol maps, rebuilt on market load and read lock-free."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._parse_cache: Dict[str, str] = {}
+        self._binance: Optional[frozenset] = None
+        # exchange -> [(ccxt_symbol, base, quote)] as loaded
+        self._markets: Dict[str, List[Tuple[str, str, str]]] = {}
+        self._to_ccxt: Dict[str, Dict[str, str]] = {}
+        self._from_ccxt: Dict[str, Dict[str, str]] = {}
+
+    # ==================== PARSING ====================
+
+    def canonical(self, raw: str) -> str:
+        """Any TradingView / CCXT / exchange-id spelling -> canonical id (memoized)."""
+        cached = self._parse_cache.get(raw)
+        if cached is not None:
+            return cached
+        symbol = _parse(raw)
+        if len(self._parse_cache) >= _MAX_PARSE_CACHE:
+            self._parse_cache.clear()
+        self._parse_cache[raw] = symbol
+        return symbol
+
+    # ==================== MARKET LOADING ====================
+
+    def load_binance(self, exchange_info: dict):
+        """Register Binance futures symbols from futures_exchange_info()."""
+        listed = frozenset(
+            s['symbol'] for s in (exchange_info or {}).get('symbols', [])
+            if s.get('contractType', 'PERPETUAL') == 'PERPETUAL' and s.get('status', 'TRADING') == 'TRADING'
+        )
+        if not listed:
+            return
+        with self._lock:
+            self._binance = listed
+            # Reverse maps prefer Binance ids, so rebuild every venue
+            for exchange in list(self._markets):
+                self._rebuild(exchange)
+        logger.info(f"🔤 Symbol registry: {len(listed)} Binance futures symbols")
+
+    def load_ccxt_markets(self, exchange: str, markets: dict):
+        """Register the linear perpetual markets of a loaded CCXT exchange."""
+        entries = []
+        for market in (markets or {}).values():
+            if not market.get('swap') or market.get('inverse') or market.get('active') is False:
+                continue
+            base, quote = market.get('base'), market.get('settle') or market.get('quote')
+            if base and quote:
+                entries.append((market['symbol'], base.upper(), quote.upper()))
+        if not entries:
+            return
+        exchange = exchange.lower()
+        with self._lock:
+            self._markets[exchange] = entries
+            self._rebuild(exchange)
+        logger.info(f"🔤 Symbol registry: {len(entries)} {exchange.upper()} perpetual markets")
+
+    def ensure_ccxt_markets(self, exchange: str, client) -> None:
+        """Register a CCXT client's markets once they are loaded (no-op afterwards)."""
+        if exchange and exchange.lower() not in self._markets and getattr(client, 'markets', None):
+            self.load_ccxt_markets(exchange, client.markets)
+
+    def _rebuild(self, exchange: str):
+        to_ccxt, from_ccxt = {}, {}
+        entries = self._markets[exchange]
+        # Exact ids first so an alias never shadows a real listing
+        for ccxt_symbol, base, quote in entries:
+            to_ccxt[f"{base}{quote}"] = ccxt_symbol
+        for ccxt_symbol, base, quote in entries:
+            exact = f"{base}{quote}"
+            alias_base = _multiplier_alias(base)
+            alias = f"{alias_base}{quote}" if alias_base else None
+            if alias:
+                to_ccxt.setdefault(alias, ccxt_symbol)
+            if self._binance and exact not in self._binance and alias in self._binance:
+                from_ccxt[ccxt_symbol] = alias
+            else:
+                from_ccxt[ccxt_symbol] = exact
+        self._to_ccxt[exchange] = to_ccxt
+        self._from_ccxt[exchange] = from_ccxt
+
+    # ==================== LOOKUPS ====================
+
+    def has_markets(self, exchange: str) -> bool:
+        exchange = (exchange or BINANCE).lower()
+        if exchange == BINANCE and self._binance is not None:
+            return True
+        return exchange in self._to_ccxt
+
+    def is_listed(self, canonical: str, exchange: str = BINANCE) -> Optional[bool]:
+        """True/False if the exchange's markets are known, None otherwise."""
+        exchange = (exchange or BINANCE).lower()
+        if exchange == BINANCE and self._binance is not None:
+            return canonical in self._binance
+        mapping = self._to_ccxt.get(exchange)
+        if mapping is None:
+            return None
+        return canonical in mapping
+
+    def to_ccxt(self, canonical: str, exchange: str) -> Optional[str]:
+        """
+        Canonical id -> CCXT unified symbol on `exchange`.
+
+        Returns None when the exchange's markets are loaded and do not list
+        the symbol; falls back to BASE/QUOTE:QUOTE when markets are unknown.
+        """
+        mapping = self._to_ccxt.get((exchange or '').lower())
+        if mapping is not None:
+            return mapping.get(canonical)
+        base, quote = split_canonical(canonical)
+        return f"{base}/{quote}:{quote}"
+
+    def from_ccxt(self, exchange: str, ccxt_symbol: str) -> str:
+        """CCXT unified symbol -> canonical id (Binance spelling when known)."""
+        mapping = self._from_ccxt.get((exchange or '').lower())
+        if mapping:
+            canonical = mapping.get(ccxt_symbol)
+            if canonical:
+                return canonical
+        return self.canonical(ccxt_symbol)
+
+    def unsupported(self, canonical: str, exchanges: Iterable[str]) -> List[str]:
+        """Exchanges (with loaded markets) that do not list `canonical`."""
+        return [e for e in exchanges if self.is_listed(canonical, e) is False]
+
+
+_registry: Optional[SymbolRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_symbol_registry() -> SymbolRegistry:
+    """Process-wide SymbolRegistry singleton."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SymbolRegistry()
+    return _registry
+
+
+def normalize_symbol(raw: str) -> str:
+    """Shortcut: any symbol spelling -> canonical id."""
+    return get_symbol_registry().canonical(raw)
@@ -55,21 +55,33 @@ async def execute_signal_task(ctx: dict, signal: dict) -> dict:
     logger.info(f"🔄 Worker executing: {action.upper()} {symbol}")
     logger.info(f"📊 Signal params: risk={signal.get('risk')}%, lev={signal.get('lev')}x, TP={signal.get('tp_perc')}%, SL={signal.get('sl_perc')}%")
     
+    shard = ctx.get('shard')
+    shard_id = shard.shard_id if shard else None
+    signal_id = signal.get('signal_id')
+    
     try:
         # Process the signal using the async method directly
-        await engine.process_signal_async(signal)
+        summary = await engine.process_signal_async(signal) or {}
         
         # Record successful task metric
         record_worker_task(task_name='execute_signal', status='success')
         
         logger.info(f"✅ Worker completed: {action.upper()} {symbol}")
         
-        return {
+        result = {
             'status': 'success',
             'symbol': symbol,
             'action': action,
             'message': f'Signal processed: {action.upper()} {symbol}'
         }
+        if shard_id:
+            result.update({
+                'shard': shard_id,
+                'accounts': summary.get('accounts', 0),
+                'errors': summary.get('errors', 0),
+            })
+            await _report_shard_completion(ctx, signal_id, shard_id, result)
+        return result
         
     except Exception as e:
         error_msg = f"Signal execution failed for {symbol}: {str(e)}"
@@ -82,12 +94,27 @@ async def execute_signal_task(ctx: dict, signal: dict) -> dict:
         if telegram:
             telegram.notify_error("WORKER", symbol, error_msg)
         
-        return {
+        result = {
             'status': 'error',
             'symbol': symbol,
             'action': action,
             'message': error_msg
         }
+        if shard_id:
+            result['shard'] = shard_id
+            await _report_shard_completion(ctx, signal_id, shard_id, result)
+        return result
+
+
+async def _report_shard_completion(ctx: dict, signal_id: str, shard_id: str, result: dict):
+    """Write this shard's outcome to signal_status:{signal_id} for the originating signal."""
+    from sharding import report_signal_completion
+    
+    report = dict(result)
+    report['finished_at'] = datetime.now(timezone.utc).isoformat()
+    await report_signal_completion(
+        ctx.get('redis_client') or ctx.get('shard_redis'), signal_id, shard_id, report
+    )
 
 
 async def health_check_task(ctx: dict) -> dict:
@@ -96,13 +123,17 @@ async def health_check_task(ctx: dict) -> dict:
     Can be used for monitoring and testing.
     """
     engine = ctx.get('engine')
+    shard = ctx.get('shard')
     
     status = {
         'worker': 'healthy',
+        'shard': shard.shard_id if shard else None,
+        'shard_ring': shard.ring.shards if shard else None,
         'engine_initialized': engine is not None,
         'engine_paused': engine.is_paused if engine else None,
         'master_clients': len(engine.master_clients) if engine else 0,
         'slave_clients': len(engine.slave_clients) if engine else 0,
+        'price_cache': dict(engine.price_cache.stats) if engine else None,
     }
     
     logger.info(f"💓 Health check: {status}")
@@ -278,6 +309,9 @@ async def execute_dca_check_task(ctx: dict, symbol: str = None) -> dict:
     2. Periodically via cron job
     3. Manually via admin interface
     
+    Checks the accounts loaded in this worker; sharded workers each run their
+    own cron (see WorkerSettings.cron_jobs) so every shard's accounts are covered.
+    
     Args:
         ctx: ARQ context with 'engine'
         symbol: Optional - check only this symbol (None = all symbols)
@@ -336,7 +370,7 @@ async def execute_dca_check_task(ctx: dict, symbol: str = None) -> dict:
                         side = ''
                         
                         if slave_data.get('is_ccxt'):
-                            pos_symbol = pos.get('symbol', '').replace('/USDT:USDT', 'USDT').replace('/', '')
+                            pos_symbol = engine.symbols.from_ccxt(slave_data.get('exchange_type'), pos.get('symbol', ''))
                             amt = float(pos.get('contracts', 0))
                             entry = float(pos.get('entryPrice', 0))
                             current = float(pos.get('markPrice', 0))
@@ -577,6 +611,137 @@ async def check_risk_guardrails_status_task(ctx: dict) -> dict:
         return status
 
 
+# ==================== STATS ROLLUP TASKS ====================
+
+async def rebuild_trade_rollup_task(ctx: dict, days: int = None) -> dict:
+    """
+    Rebuild the daily trade rollup from TradeHistory.
+    
+    Runs once on first worker start to backfill (days=None: all history) and
+    nightly via cron for the last two days, reconciling any trade whose
+    incremental rollup update was lost.
+    
+    Args:
+        ctx: ARQ context containing 'app'
+        days: Number of recent UTC days to rebuild (None = everything)
+    
+    Returns:
+        dict with rebuild results
+    """
+    app = ctx.get('app')
+    
+    if not app:
+        logger.error("❌ Flask app not available for trade rollup rebuild")
+        return {'status': 'error', 'message': 'App not initialized'}
+    
+    from models import db, DailyTradeRollup
+    
+    with app.app_context():
+        try:
+            since_day = None
+            if days:
+                since_day = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date()
+            rows = DailyTradeRollup.rebuild(since_day)
+            if since_day is None:
+                # Commits the marker together with the rebuilt rows
+                DailyTradeRollup.mark_backfilled()
+            db.session.commit()
+            
+            record_worker_task(task_name='rebuild_trade_rollup', status='success')
+            logger.info(f"📊 Trade rollup rebuilt: {rows} day rows (since {since_day or 'beginning'})")
+            return {
+                'status': 'success',
+                'rows': rows,
+                'since': since_day.isoformat() if since_day else None,
+                'timestamp': datetime.now(timezone.utc).isoformat()
+            }
+        
+        except Exception as e:
+            db.session.rollback()
+            record_worker_task(task_name='rebuild_trade_rollup', status='error')
+            logger.error(f"❌ Trade rollup rebuild failed: {e}")
+            return {
+                'status': 'error',
+                'message': str(e),
+                'timestamp': datetime.now(timezone.utc).isoformat()
+            }
+
+
+async def reconcile_trade_rollup_task(ctx: dict) -> dict:
+    """Nightly cron: rebuild yesterday and today in the daily trade rollup."""
+    return await rebuild_trade_rollup_task(ctx, days=2)
+
+
+async def compact_balance_history_task(ctx: dict) -> dict:
+    """
+    Compact old balance snapshots.
+    
+    Raw BalanceHistory rows older than BALANCE_RAW_RETENTION_DAYS are folded,
+    one UTC day at a time, into hourly and daily BalanceHistoryRollup rows and
+    deleted. Hourly rows older than BALANCE_HOURLY_RETENTION_DAYS are dropped;
+    daily rows are kept.
+    
+    Args:
+        ctx: ARQ context containing 'app'
+    
+    Returns:
+        dict with compaction results
+    """
+    app = ctx.get('app')
+    
+    if not app:
+        logger.error("❌ Flask app not available for balance history compaction")
+        return {'status': 'error', 'message': 'App not initialized'}
+    
+    from models import db, BalanceHistory, BalanceHistoryRollup
+    from sqlalchemy import func
+    
+    raw_days = int(os.environ.get('BALANCE_RAW_RETENTION_DAYS', '7'))
+    hourly_days = BalanceHistoryRollup.HOURLY_RETENTION_DAYS
+    
+    with app.app_context():
+        now = datetime.now(timezone.utc)
+        cutoff_day = (now - timedelta(days=raw_days)).date()
+        days_compacted = 0
+        rows_compacted = 0
+        
+        try:
+            oldest = db.session.query(func.min(BalanceHistory.timestamp)).scalar()
+            day = oldest.date() if oldest else cutoff_day
+            # One transaction per day keeps each step small and restartable
+            while day < cutoff_day:
+                rows = BalanceHistoryRollup.compact_day(day)
+                db.session.commit()
+                if rows:
+                    days_compacted += 1
+                    rows_compacted += rows
+                day += timedelta(days=1)
+            
+            hourly_pruned = BalanceHistoryRollup.prune_hourly(now - timedelta(days=hourly_days))
+            db.session.commit()
+            
+            record_worker_task(task_name='compact_balance_history', status='success')
+            logger.info(f"🗜️ Balance history compacted: {rows_compacted} snapshots over {days_compacted} days, "
+                        f"{hourly_pruned} hourly rows pruned")
+            return {
+                'status': 'success',
+                'days_compacted': days_compacted,
+                'rows_compacted': rows_compacted,
+                'hourly_pruned': hourly_pruned,
+                'timestamp': now.isoformat()
+            }
+        
+        except Exception as e:
+            db.session.rollback()
+            record_worker_task(task_name='compact_balance_history', status='error')
+            logger.error(f"❌ Balance history compaction failed: {e}")
+            return {
+                'status': 'error',
+                'message': str(e),
+                'timestamp': now.isoformat()
+            }
+
+
 # ==================== INSURANCE FUND / SAFETY POOL TASKS ====================
 
 async def update_insurance_fund_task(ctx: dict) -> dict:
@@ -602,7 +767,7 @@ async def update_insurance_fund_task(ctx: dict) -> dict:
         logger.error("❌ Flask app not available for Insurance Fund update")
         return {'status': 'error', 'message': 'App not initialized'}
     
-    from models import db, TradeHistory, SystemStats
+    from models import db, DailyTradeRollup, SystemStats
     
     with app.app_context():
         now = datetime.now(timezone.utc)
@@ -613,14 +778,9 @@ async def update_insurance_fund_task(ctx: dict) -> dict:
             # In a real scenario, you'd have a separate fees table
             # Here we simulate: fees = 2% of total trading volume, then 5% goes to insurance
             
-            # Get all profitable trades from the past 24 hours
-            profitable_trades = TradeHistory.query.filter(
-                TradeHistory.close_time >= yesterday,
-                TradeHistory.close_time <= now,
-                TradeHistory.pnl > 0
-            ).all()
-            
-            total_profit = sum(trade.pnl for trade in profitable_trades)
+            # Profit from winning trades in the past 24 hours (daily rollup)
+            last_24h = DailyTradeRollup.totals(all_users=True, since=yesterday)
+            total_profit = last_24h['profit']
             
             # Simulate platform fee as ~2% of profits
             # Then 5% of that goes to Insurance Fund
@@ -650,7 +810,7 @@ async def update_insurance_fund_task(ctx: dict) -> dict:
             
             result = {
                 'status': 'success',
-                'trades_processed': len(profitable_trades),
+                'trades_processed': last_24h['wins'],
                 'total_profit': round(total_profit, 2),
                 'simulated_fees': round(simulated_platform_fees, 2),
                 'contribution': round(insurance_contribution, 2),
@@ -730,7 +890,7 @@ async def calculate_user_xp_task(ctx: dict) -> dict:
         logger.error("❌ Flask app not available for XP calculation")
         return {'status': 'error', 'message': 'App not initialized'}
     
-    from models import db, User, TradeHistory, UserLevel, UserAchievement
+    from models import db, User, DailyTradeRollup, UserLevel, UserAchievement
     from sqlalchemy import func
     
     with app.app_context():
@@ -749,12 +909,17 @@ async def calculate_user_xp_task(ctx: dict) -> dict:
             users = User.query.filter(User.role == 'user').all()
             logger.info(f"🎮 Processing XP for {len(users)} users...")
             
+            # Lifetime |PnL| per user in one grouped read of the daily rollup
+            volume_by_user = dict(
+                db.session.query(DailyTradeRollup.user_id, func.sum(DailyTradeRollup.abs_pnl_sum))
+                .filter(DailyTradeRollup.user_id != DailyTradeRollup.MASTER_ID)
+                .group_by(DailyTradeRollup.user_id).all()
+            )
+            
             for user in users:
                 try:
                     # Calculate XP from trading volume
-                    volume_result = db.session.query(func.sum(func.abs(TradeHistory.pnl))).filter(
-                        TradeHistory.user_id == user.id
-                    ).scalar()
+                    volume_result = volume_by_user.get(user.id, 0.0)
                     volume_xp = int((float(volume_result or 0) * 100) / 1000)  # Scale PnL to approximate volume
                     
                     # Calculate days active
@@ -774,9 +939,7 @@ async def calculate_user_xp_task(ctx: dict) -> dict:
                     user.xp = new_xp
                     
                     # Get appropriate level for new XP
-                    new_level = UserLevel.query.filter(
-                        UserLevel.min_xp <= new_xp
-                    ).order_by(UserLevel.min_xp.desc()).first()
+                    new_level = UserLevel.get_level_for_xp(new_xp)
                     
                     if new_level:
                         old_level_id = user.current_level_id
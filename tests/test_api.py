@@ -96,6 +96,39 @@ class TestAdminEndpoints:
         response = admin_client.get('/admin')
         # Admin should access or be redirected somewhere valid
         assert response.status_code in [200, 302]
+    
+    def test_admin_positions_unavailable_without_master_snapshot(self, app, client, monkeypatch):
+        """Test a missing master snapshot is reported as unavailable, not as no open positions."""
+        import sys
+        from config import Config
+        from models import db, User, UserConsent
+        
+        engine = sys.modules['app'].engine
+        monkeypatch.setattr(engine.master_state, 'get_snapshot', lambda max_age=None: None)
+        with app.app_context():
+            admin = User(username='positions_admin', password_hash='x', role='admin', is_active=True)
+            db.session.add(admin)
+            db.session.commit()
+            admin_id = admin.id
+            UserConsent.record_consent(admin_id, getattr(Config, 'TOS_VERSION', '1.0'))
+        with client.session_transaction() as session:
+            session['_user_id'] = str(admin_id)
+            session['_fresh'] = True
+        
+        # Own app context: the session-wide one caches an earlier test's anonymous user in g
+        with app.app_context():
+            response = client.get('/api/positions')
+            assert response.status_code == 503
+            assert response.get_json()['unavailable'] is True
+            
+            response = client.get('/api/positions', headers={'HX-Request': 'true'})
+            assert b'temporarily unavailable' in response.data
+            assert b'No open positions' not in response.data
+        
+        with app.app_context():
+            UserConsent.query.filter_by(user_id=admin_id).delete()
+            db.session.delete(db.session.get(User, admin_id))
+            db.session.commit()
 
 
 class TestAPIErrorHandling:
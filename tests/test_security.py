@@ -200,6 +200,33 @@ class TestWebhookSecurity:
         
         assert validate_webhook is not None
         assert callable(validate_webhook)
+    
+    def test_webhook_body_parsed_once(self, app, monkeypatch):
+        """Test the webhook body is parsed, authenticated and validated once per request."""
+        from config import Config
+        from security import parse_webhook_request
+        
+        monkeypatch.setattr(Config, 'WEBHOOK_PASSPHRASE', 'test-passphrase')
+        body = '{"passphrase": "test-passphrase", "ticker": "BTCUSDT", "action": "buy", "leverage": "10",}'
+        with app.test_request_context('/webhook', method='POST', data=body, content_type='text/plain'):
+            parsed = parse_webhook_request()
+            assert parsed is parse_webhook_request()
+            assert parsed.authenticated and parsed.repaired and parsed.error is None
+            assert parsed.signal.ticker == 'BTCUSDT' and parsed.signal.leverage == 10
+        
+        with app.test_request_context('/webhook', method='POST', data='{"passphrase": "wrong"}'):
+            parsed = parse_webhook_request()
+            assert not parsed.authenticated and parsed.signal is None
+        
+        with app.test_request_context('/webhook', method='POST', data='{not json'):
+            assert parse_webhook_request().error == 'invalid_json'
+        
+        # Requests sharing one app context must not see each other's result
+        with app.app_context():
+            with app.test_request_context('/webhook', method='POST', data=body):
+                assert parse_webhook_request().authenticated
+            with app.test_request_context('/webhook', method='POST', data='{"passphrase": "wrong"}'):
+                assert not parse_webhook_request().authenticated
 
 
 class TestClientIPDetection:
@@ -211,3 +238,64 @@ class TestClientIPDetection:
         
         assert get_client_ip is not None
         assert callable(get_client_ip)
+
+
+class TestTosConsentCache:
+    """Tests for cached TOS consent checks."""
+    
+    def test_accepted_version_cached_until_version_bump(self, app):
+        """Test accepted consent is served without queries and a new version re-checks."""
+        from compliance import check_tos_consent, forget_tos_consent
+        from models import db, User, UserConsent
+        
+        with app.test_request_context('/api/chat/status'):
+            user = User(username='tos_consent_user', password_hash='x', role='user')
+            db.session.add(user)
+            db.session.commit()
+            assert check_tos_consent(user.id, '1.0') is False
+            UserConsent.record_consent(user.id, '1.0')
+            assert check_tos_consent(user.id, '1.0') is True
+            
+            with patch.object(UserConsent, 'has_user_accepted_tos', side_effect=AssertionError('queried')):
+                assert check_tos_consent(user.id, '1.0') is True
+                forget_tos_consent(user.id)
+                assert check_tos_consent(user.id, '1.0') is True  # from the session
+            
+            assert check_tos_consent(user.id, '2.0') is False
+            
+            forget_tos_consent(user.id)
+            UserConsent.query.filter_by(user_id=user.id).delete()
+            db.session.delete(user)
+            db.session.commit()
+
+
+class TestGeoIPLookup:
+    """Tests for cached GeoIP country lookups."""
+    
+    def test_private_ranges_skipped_and_results_cached(self, monkeypatch):
+        """Test all of 172.16.0.0/12 is private and repeat IPs skip the database."""
+        import compliance
+        
+        lookups = []
+        
+        class Reader:
+            def country(self, ip):
+                lookups.append(ip)
+                return MagicMock(country=MagicMock(iso_code='US'))
+        
+        monkeypatch.setattr(compliance, '_geoip_reader', Reader())
+        monkeypatch.setattr(compliance, '_geoip_available', True)
+        monkeypatch.setattr(compliance, 'GEOIP_CACHE_SIZE', 2)
+        compliance._geoip_cache.clear()
+        
+        for ip in ('172.20.1.1', '172.31.255.255', '10.1.2.3', 'fd00::1', 'not-an-ip'):
+            assert compliance.get_country_from_ip(ip) is None
+        assert lookups == []
+        
+        before = compliance.geoip_cache_stats()['hits']
+        assert compliance.get_country_from_ip('8.8.8.8') == 'US'
+        assert compliance.get_country_from_ip('8.8.8.8') == 'US'
+        assert lookups == ['8.8.8.8']
+        assert compliance.geoip_cache_stats()['hits'] == before + 1
+        assert compliance.geoip_cache_stats()['size'] == 2
+        compliance._geoip_cache.clear()
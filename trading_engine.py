@@ -12,6 +12,7 @@ Prometheus Metrics:
 import time
 import re
 import math
+import functools
 import logging
 import asyncio
 import threading
@@ -21,11 +22,16 @@ from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
 from binance.client import Client
 from binance.exceptions import BinanceAPIException
-from models import User, db, TradeHistory, BalanceHistory, UserExchange, ExchangeConfig, Strategy, StrategySubscription
+from models import User, db, TradeHistory, DailyTradeRollup, BalanceHistory, UserExchange, ExchangeConfig, Strategy, StrategySubscription
 from config import Config
 import ccxt.async_support as ccxt_async  # Async CCXT
 import ccxt as ccxt_sync  # Sync CCXT for class lookups
 from service_validator import SUPPORTED_EXCHANGES, PASSPHRASE_EXCHANGES
+from price_cache import get_price_cache
+from symbol_registry import get_symbol_registry, split_canonical
+from master_state import MasterStateService
+from balance_monitor import BalanceMonitor
+from account_readiness import reservation, global_open_count
 from http.client import RemoteDisconnected
 import urllib3.exceptions
 import urllib3.util.connection
@@ -457,6 +463,21 @@ class ProxyPool:
                            f"to {self._mask_proxy(new_proxy)}")
             return new_proxy
     
+    def get_home_proxy(self, user_id: int) -> str:
+        """
+        Deterministic proxy for a user (user_id modulo proxy list).
+        
+        Unlike get_proxy_for_user this does not depend on assignment order or
+        cooldowns, so every worker process computes the same value. Used as
+        the shard key when SHARD_KEY=proxy.
+        """
+        if not self.proxies:
+            return None
+        try:
+            return self.proxies[int(user_id) % len(self.proxies)]
+        except (TypeError, ValueError):
+            return None
+    
     def _mask_proxy(self, proxy_url: str) -> str:
         """Mask proxy credentials for logging."""
         if not proxy_url:
@@ -555,10 +576,18 @@ class TradingEngine:
         # Thread pool executor for background tasks (MUST be initialized before starting threads)
         self.executor = ThreadPoolExecutor(max_workers=10, thread_name_prefix="TradingWorker")
         
+        # Single source of master positions/balances for every master view
+        self.master_state = MasterStateService(self)
+        # Spread, rate-budgeted slave balance/position refresh (Binance + CCXT).
+        # Always constructed (cached state, dashboard hints); the refresh loop is started
+        # by the ARQ worker on its own event loop, and runs there only while holding its lease.
+        self.balance_monitor = BalanceMonitor(self)
+        
         # Start background threads (will be migrated to async tasks when event loop is available)
         # Note: These threads use self.executor, so it must be initialized first
         if enable_balance_monitor:
             threading.Thread(target=self.monitor_balances, daemon=True).start()
+            self.master_state.start()
         if enable_position_monitor:
             threading.Thread(target=self.monitor_position_closes, daemon=True).start()
         
@@ -579,6 +608,16 @@ class TradingEngine:
         self._recent_close_events = {}
         self._recent_close_lock = threading.Lock()
         self._recent_close_window = 10  # seconds
+        
+        # Worker sharding (set by worker.py when WORKER_SHARD_ID is configured)
+        # None = unsharded: this engine owns every account and the masters
+        self.shard_membership = None
+        # Process-wide mark price cache (websocket-fed in workers, REST fallback elsewhere)
+        self.price_cache = get_price_cache()
+        # TradingView / Binance / CCXT symbol maps, rebuilt when markets load
+        self.symbols = get_symbol_registry()
+        # Pre-armed account readiness (AccountReadinessService, set by the ARQ worker)
+        self.readiness = None
 
     def _fetch_balance_sync(self, exchange_name: str, api_key: str, api_secret: str, passphrase: str = None) -> dict:
         """Fetch balance using synchronous CCXT to avoid asyncio loop conflicts."""
@@ -643,40 +682,62 @@ class TradingEngine:
 
     def _get_master_balances_sync(self) -> list:
         """Sync fallback for master balances using CCXT (avoids asyncio issues)."""
-        balances = []
+        return [entry for job in self._master_config_balance_jobs() for entry in job()]
+
+    def _master_config_balance_jobs(self) -> list:
+        """One job per enabled master ExchangeConfig; each returns [balance entry]."""
+        jobs = []
         with self.app.app_context():
             try:
                 from models import ExchangeConfig
                 configs = ExchangeConfig.query.filter_by(is_enabled=True, is_verified=True).all()
             except Exception as e:
                 logger.warning(f"Failed to load exchange configs for balances: {e}")
-                return balances
+                return jobs
 
             for config in configs:
                 exchange_name = config.exchange_name.lower()
-                api_key = config.admin_api_key
-                api_secret = config.get_admin_api_secret()
-                passphrase = config.get_admin_passphrase()
-
-                display_name = config.display_name or exchange_name.upper()
-                if not api_key or not api_secret:
-                    balances.append({
-                        'id': f'cfg_{exchange_name}',
-                        'exchange': display_name,
-                        'balance': None,
-                        'error': 'Admin API keys not configured'
-                    })
-                    continue
-
-                result = self._fetch_balance_sync(exchange_name, api_key, api_secret, passphrase)
-                balances.append({
-                    'id': f'cfg_{exchange_name}',
-                    'exchange': display_name,
-                    'balance': result.get('balance'),
-                    'error': result.get('error')
-                })
-
-        return balances
+                jobs.append(functools.partial(
+                    self._config_balance_entry, exchange_name,
+                    config.display_name or exchange_name.upper(), config.admin_api_key,
+                    config.get_admin_api_secret(), config.get_admin_passphrase()
+                ))
+        return jobs
+
+    def _config_balance_entry(self, exchange_name: str, display_name: str, api_key, api_secret,
+                              passphrase) -> list:
+        if not api_key or not api_secret:
+            return [{
+                'id': f'cfg_{exchange_name}',
+                'exchange': display_name,
+                'balance': None,
+                'error': 'Admin API keys not configured'
+            }]
+        result = self._fetch_balance_sync(exchange_name, api_key, api_secret, passphrase)
+        return [{
+            'id': f'cfg_{exchange_name}',
+            'exchange': display_name,
+            'balance': result.get('balance'),
+            'error': result.get('error')
+        }]
+
+    def master_fetch_jobs(self) -> tuple:
+        """
+        (position_jobs, balance_jobs) for the master state refresher: zero-arg
+        callables returning lists, one per master exchange, so every exchange
+        is queried in parallel. Async CCXT masters share the engine loop and
+        form one positions job (gathered concurrently inside it).
+        """
+        async_masters = [m for m in self.master_clients if m.get('is_async')]
+        sync_masters = [m for m in self.master_clients if not m.get('is_async')]
+        position_jobs = [functools.partial(self._fetch_master_positions_live, [m]) for m in sync_masters]
+        if async_masters:
+            position_jobs.append(functools.partial(self._fetch_master_positions_live, async_masters))
+            # Same source as _fetch_master_balances_live when any master is async
+            balance_jobs = self._master_config_balance_jobs()
+        else:
+            balance_jobs = [functools.partial(self._fetch_master_balances_live, [m]) for m in sync_masters]
+        return position_jobs, balance_jobs
 
     def set_redis_client(self, redis_client, redis_url: str = None):
         """Set Redis client for Smart Features (trailing SL, DCA tracking, risk guardrails)"""
@@ -693,6 +754,24 @@ class TradingEngine:
         logger.info("🎯 Smart Features initialized with Redis")
         logger.info("🛡️ Risk Guardrails initialized with Redis")
 
+    def set_shard_membership(self, membership):
+        """Restrict this engine to the accounts owned by a worker shard (see sharding.py)"""
+        self.shard_membership = membership
+        logger.info(f"🧩 Engine bound to shard {membership.shard_id}")
+
+    def owns_account(self, user_id) -> bool:
+        """True if this engine's shard executes trades for the given user."""
+        if not self.shard_membership:
+            return True
+        return self.shard_membership.owns_account(user_id, self.proxy_pool.get_home_proxy(user_id))
+
+    def owns_masters(self) -> bool:
+        """True if this engine's shard executes trades for the master accounts."""
+        if not self.shard_membership:
+            return True
+        from sharding import MASTER_SHARD_KEY
+        return self.shard_membership.owns(MASTER_SHARD_KEY)
+
     def set_global_settings(self, settings_dict):
         """Set reference to global settings dict for reading max_positions etc."""
         self._global_settings = settings_dict
@@ -1175,6 +1254,7 @@ class TradingEngine:
                             
                             # Keep legacy master_client for backward compatibility
                             self.master_client = client
+                            self._load_binance_symbols(client)
                             
                             self.master_clients.append({
                                 'id': 'master',
@@ -1297,6 +1377,7 @@ class TradingEngine:
         """Load all active slave accounts from UserExchange table (multi-exchange support)"""
         with self.app.app_context():
             new_slaves = []
+            skipped_other_shards = 0
             
             # Debug: Show all UserExchange records and their status
             all_user_exchanges = UserExchange.query.all()
@@ -1311,7 +1392,7 @@ class TradingEngine:
                 UserExchange.status == 'APPROVED',
                 UserExchange.trading_enabled == True,
                 UserExchange.is_active == True
-            ).all()
+            ).order_by(UserExchange.id.asc()).all()
             
             logger.info(f"📊 UserExchange records matching criteria (APPROVED + trading_enabled + is_active): {len(user_exchanges)}")
             
@@ -1320,6 +1401,11 @@ class TradingEngine:
                 if not user or user.role == 'admin' or not user.is_active:
                     continue
                 
+                # Sharded workers only connect the accounts they own
+                if not self.owns_account(user.id):
+                    skipped_other_shards += 1
+                    continue
+                
                 exchange_name = ue.exchange_name.lower()
                 api_key = ue.api_key
                 api_secret = ue.get_api_secret()
@@ -1482,6 +1568,8 @@ class TradingEngine:
             for u in legacy_users:
                 if u.role == 'admin':
                     continue
+                if not self.owns_account(u.id):
+                    continue
                 # Skip if user already has exchanges loaded
                 if any(s['id'] == u.id for s in new_slaves):
                     continue
@@ -1550,6 +1638,10 @@ class TradingEngine:
             with self.lock:
                 self.slave_clients = new_slaves
                 logger.info(f"🔄 Loaded {len(self.slave_clients)} slave accounts")
+                if self.shard_membership:
+                    logger.info(f"🧩 Shard {self.shard_membership.shard_id}: "
+                               f"{skipped_other_shards} exchange accounts owned by other shards "
+                               f"(ring: {self.shard_membership.ring.shards})")
                 
                 # Log proxy pool stats if proxies are configured
                 if self.proxy_pool.proxies:
@@ -1612,11 +1704,11 @@ class TradingEngine:
             return True
             
         try:
-            self.api_limiter.wait_and_proceed("slippage")
-            ticker = client.futures_symbol_ticker(symbol=symbol)
-            current_price = self._extract_binance_price(ticker)
+            current_price = self.price_cache.get_or_fetch(
+                symbol, lambda: self._fetch_binance_price(client, symbol, "slippage")
+            )
             if not current_price:
-                logger.warning(f"Slippage check failed: price missing for {symbol} (ticker={ticker})")
+                logger.warning(f"Slippage check failed: price missing for {symbol}")
                 return True
             diff = (current_price - master_entry_price) / master_entry_price
             
@@ -1665,17 +1757,21 @@ class TradingEngine:
                     continue
         return None
 
+    def _fetch_binance_price(self, client, symbol: str, limiter_key: str):
+        """REST fallback for the price cache (rate limited)."""
+        self.api_limiter.wait_and_proceed(limiter_key)
+        return self._extract_binance_price(client.futures_symbol_ticker(symbol=symbol))
+
     def _normalize_symbol(self, raw_symbol: str) -> str:
         """Normalize exchange symbols for UI display."""
-        symbol = (raw_symbol or '').strip()
-        if not symbol:
-            return ''
-        symbol = symbol.replace('/USDT:USDT', 'USDT')
-        symbol = symbol.replace('/USDT', 'USDT')
-        symbol = symbol.replace('USDT:USDT', 'USDT')
-        symbol = symbol.replace(':USDT', 'USDT')
-        symbol = symbol.replace('/', '').replace('-', '').replace('_', '').replace(':', '')
-        return symbol
+        return self.symbols.canonical(raw_symbol)
+
+    def _load_binance_symbols(self, client):
+        """Register Binance futures markets in the symbol registry."""
+        try:
+            self.symbols.load_binance(client.futures_exchange_info())
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load Binance futures symbols: {e}")
 
     def _compute_pnl_pct(self, unrealized_pnl: float, margin: float,
                          entry_price: float, mark_price: float, side: str) -> float:
@@ -2077,8 +2173,8 @@ class TradingEngine:
                             continue
             raise
 
-    async def get_all_master_positions_async(self) -> list:
-        """Get positions from ALL master exchanges with exchange info - ASYNC VERSION"""
+    async def get_all_master_positions_async(self, masters: list = None) -> list:
+        """Get positions from ALL (or the given) master exchanges with exchange info - ASYNC VERSION"""
         all_positions = []
         
         async def fetch_from_master(master_data):
@@ -2112,7 +2208,7 @@ class TradingEngine:
                 logger.warning(f"Error fetching positions from {exchange_name}: {e}")
             return positions_list
         
-        tasks = [fetch_from_master(m) for m in self.master_clients]
+        tasks = [fetch_from_master(m) for m in (self.master_clients if masters is None else masters)]
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
         for result in results:
@@ -2122,9 +2218,14 @@ class TradingEngine:
         return all_positions
 
     def get_all_master_positions(self) -> list:
-        """Get positions from ALL master exchanges with exchange info - SYNC WRAPPER"""
+        """Get positions from ALL master exchanges (served from the master state snapshot)"""
+        return self.master_state.positions()
+
+    def _fetch_master_positions_live(self, masters: list = None) -> list:
+        """Query positions from ALL (or the given) master exchanges with exchange info - SYNC WRAPPER"""
+        masters = self.master_clients if masters is None else masters
         # Check if any master is async
-        has_async = any(m.get('is_async') for m in self.master_clients)
+        has_async = any(m.get('is_async') for m in masters)
         
         if has_async:
             try:
@@ -2143,18 +2244,18 @@ class TradingEngine:
                     return [self._normalize_cached_master_position(s, d) for s, d in self.master_positions.items()]
 
             try:
-                return loop.run_until_complete(self.get_all_master_positions_async())
+                return loop.run_until_complete(self.get_all_master_positions_async(masters))
             except RuntimeError as e:
                 if self._is_event_loop_closed_error(e):
                     self._event_loop = asyncio.new_event_loop()
-                    return self._event_loop.run_until_complete(self.get_all_master_positions_async())
+                    return self._event_loop.run_until_complete(self.get_all_master_positions_async(masters))
                 logger.warning(f"Async positions fetch failed in sync context: {e}")
                 with self.positions_lock:
                     return [self._normalize_cached_master_position(s, d) for s, d in self.master_positions.items()]
         
         # Legacy sync implementation
         all_positions = []
-        for master_data in self.master_clients:
+        for master_data in masters:
             exchange_name = master_data.get('exchange_name', 'Unknown')
             try:
                 if not master_data.get('is_ccxt'):
@@ -2252,8 +2353,13 @@ class TradingEngine:
             asyncio.set_event_loop(None)
 
     def get_all_master_balances(self) -> list:
-        """Get balances from ALL master exchanges - SYNC WRAPPER"""
-        has_async = any(m.get('is_async') for m in self.master_clients)
+        """Get balances from ALL master exchanges (served from the master state snapshot)"""
+        return self.master_state.balances()
+
+    def _fetch_master_balances_live(self, masters: list = None) -> list:
+        """Query balances from ALL (or the given) master exchanges - SYNC WRAPPER"""
+        masters = self.master_clients if masters is None else masters
+        has_async = any(m.get('is_async') for m in masters)
         
         if has_async:
             # Prefer sync fallback for stability in mixed async environments
@@ -2265,7 +2371,7 @@ class TradingEngine:
         
         # Legacy sync implementation for non-async clients
         balances = []
-        for master_data in self.master_clients:
+        for master_data in masters:
             exchange_name = master_data.get('exchange_name', 'Unknown')
             exchange_id = master_data.get('id', exchange_name)
             try:
@@ -2300,17 +2406,16 @@ class TradingEngine:
             return
         
         try:
-            # Get all positions from all master exchanges
-            positions = self.get_all_master_positions()
-            
-            # Get all balances from all master exchanges
-            balances = self.get_all_master_balances()
-            total_balance = sum(b['balance'] for b in balances if b['balance'] is not None)
+            # Last snapshot of all master exchanges (no exchange calls here)
+            snapshot = self.master_state.last_snapshot()
+            if snapshot is None:
+                return
             
             self.socketio.emit('master_data', {
-                'balance': f"{total_balance:,.2f}",
-                'positions': positions,
-                'exchange_balances': balances
+                'balance': f"{snapshot['total_balance']:,.2f}",
+                'positions': snapshot['positions'],
+                'exchange_balances': snapshot['balances'],
+                'stale': snapshot['stale']
             }, room="admin_room")
             
         except (RemoteDisconnected, ConnectionAbortedError, ConnectionResetError, 
@@ -2345,6 +2450,11 @@ class TradingEngine:
                 if normalized:
                     positions_data.append(normalized)
             
+            if not is_master:
+                # Fresh data is about to be pushed - the balance monitor can skip this account's cycle
+                self.balance_monitor.mark_fresh(user_id, client)
+                self.balance_monitor.remember(user_id, usdt_bal, positions_data, client)
+            
             if self.socketio:
                 if is_master:
                     # Build exchange_balances for single master
@@ -2426,7 +2536,9 @@ class TradingEngine:
         """Save total master balance across ALL exchanges for charts."""
         for attempt in range(retries + 1):
             try:
-                balances = self.get_all_master_balances()
+                # Current snapshot only: a stale one would chart an old balance as new
+                snapshot = self.master_state.get_snapshot()
+                balances = snapshot['balances'] if snapshot else []
                 if not balances:
                     return
 
@@ -2454,36 +2566,24 @@ class TradingEngine:
                 break
 
     def monitor_balances(self):
-        """Background thread for monitoring balances"""
+        """Background thread for monitoring master balances (slaves are handled by balance_monitor)"""
         tick = 0
         while True:
             try:
                 time.sleep(1)
                 tick += 1
                 
-                # Update master every 5 seconds
+                # Update master every 5 seconds (multi-exchange masters are pushed by master_state)
                 if tick % 5 == 0:
-                    # Use multi-exchange update if we have multiple master exchanges
-                    if self.master_clients and len(self.master_clients) > 0:
-                        self.executor.submit(self.push_master_updates)
-                    elif self.master_client:
+                    if not self.master_clients and self.master_client:
                         self.executor.submit(self.push_update, 'master', self.master_client, True)
                 
-                # Full update and snapshot every 60 seconds
+                # Master snapshot every 60 seconds
                 if tick % 60 == 0:
                     if self.master_clients:
                         self.executor.submit(self.snapshot_master_total_balance)
                     elif self.master_client:
                         self.executor.submit(self.snapshot_balance, 'master', self.master_client)
-
-                    with self.lock:
-                        slaves_copy = list(self.slave_clients)
-                        
-                    for slave in slaves_copy:
-                        if not slave['is_paused']:
-                            self.executor.submit(self.push_update, slave['id'], slave['client'])
-                            self.executor.submit(self.snapshot_balance, slave['id'], slave['client'])
-                            time.sleep(0.05)
                             
             except Exception as e:
                 logger.error(f"Monitor error: {e}")
@@ -2639,6 +2739,7 @@ class TradingEngine:
                     node_name=node_name
                 )
                 db.session.add(trade)
+                DailyTradeRollup.record(db_uid, pnl, roi)
                 db.session.commit()
                 
                 logger.info(f"📝 Recorded trade: {symbol} {side} PnL: {pnl:.2f}$")
@@ -2995,6 +3096,7 @@ class TradingEngine:
                     node_name=node_name
                 )
                 db.session.add(new_trade)
+                DailyTradeRollup.record(user_id, pnl, roi)
                 db.session.commit()
                 
                 # Create referral commission if user was referred and trade was profitable
@@ -3065,13 +3167,10 @@ class TradingEngine:
             room: Chat room to broadcast to
         """
         try:
-            from models import ChatMessage
+            from chat_store import get_chat_store, init_chat_store, mask_username
             
             # Mask username for privacy
-            if len(username) > 3:
-                masked_name = username[0] + '*' * (len(username) - 2) + username[-1]
-            else:
-                masked_name = username
+            masked_name = mask_username(username)
             
             # Format the whale alert message
             alert_message = f"🐋 {masked_name} just made +${abs(pnl):.2f} on {symbol}!"
@@ -3082,26 +3181,21 @@ class TradingEngine:
                 admin_user = User.query.first()
             
             if admin_user:
-                chat_msg = ChatMessage(
-                    user_id=admin_user.id,
-                    room=room,
-                    message=alert_message,
-                    message_type='whale_alert',
-                    extra_data={
-                        'type': 'whale_alert',
-                        'trader_id': user_id,
-                        'masked_username': masked_name,
-                        'symbol': symbol,
-                        'pnl': round(pnl, 2)
-                    }
-                )
-                db.session.add(chat_msg)
-                db.session.commit()
+                # Goes through the chat store so it lands in the room's recent list
+                chat_store = get_chat_store() or init_chat_store(self._get_sync_redis(),
+                                                                 getattr(self.app, 'app_context', None))
+                entry = chat_store.post(admin_user, room, alert_message, 'whale_alert', extra_data={
+                    'type': 'whale_alert',
+                    'trader_id': user_id,
+                    'masked_username': masked_name,
+                    'symbol': symbol,
+                    'pnl': round(pnl, 2)
+                })
                 
                 # Broadcast to chat room via SocketIO
                 if self.socketio:
                     try:
-                        self.socketio.emit('new_message', chat_msg.to_dict(), room=f'chat_{room}')
+                        self.socketio.emit('new_message', entry, room=f'chat_{room}')
                         self.socketio.emit('whale_alert', {
                             'masked_username': masked_name,
                             'symbol': symbol,
@@ -3175,6 +3269,9 @@ class TradingEngine:
                     # Ensure exchange supports the symbol before attempting close
                     if not getattr(exchange, "markets", None):
                         await exchange.load_markets()
+                    if not self.symbols.has_markets(exchange_type):
+                        self.symbols.ensure_ccxt_markets(exchange_type, exchange)
+                        ccxt_symbol = self.convert_symbol_to_ccxt(symbol, exchange_type)
                     if ccxt_symbol not in exchange.markets:
                         error_msg = f"({exchange_type.upper()}) Symbol not supported on exchange: {ccxt_symbol}"
                         logger.warning(f"⚠️ [{node_name}] {error_msg}")
@@ -3205,10 +3302,16 @@ class TradingEngine:
                 user_lock = self.user_async_locks[user_id]
             
             async with user_lock:
+                # Pre-armed state (free margin, open symbols, applied leverage) if fresh
+                ready_state = client_data.get('readiness')
+                
                 # Ensure exchange supports the symbol before proceeding
                 try:
                     if not getattr(exchange, "markets", None):
                         await exchange.load_markets()
+                    if not self.symbols.has_markets(exchange_type):
+                        self.symbols.ensure_ccxt_markets(exchange_type, exchange)
+                        ccxt_symbol = self.convert_symbol_to_ccxt(symbol, exchange_type)
                     if ccxt_symbol not in exchange.markets:
                         error_msg = f"({exchange_type.upper()}) Symbol not supported on exchange: {ccxt_symbol}"
                         logger.error(f"❌ [{node_name}] {error_msg}")
@@ -3242,17 +3345,24 @@ class TradingEngine:
                 skip_position_check = client_data.get('skip_position_check', False)
                 
                 try:
-                    # Get open positions on THIS exchange (async)
-                    await self.api_limiter.wait_and_proceed_async(f"pos_{user_id}")
-                    positions = await self._fetch_ccxt_positions(exchange, exchange_type)
-                    open_cnt = 0
-                    has_position_on_symbol = False
-                    
-                    for pos in positions:
-                        if pos.get('contracts') and float(pos['contracts']) != 0:
-                            open_cnt += 1
-                            if pos.get('symbol') == ccxt_symbol:
-                                has_position_on_symbol = True
+                    # Trust the pre-armed record for "not open"; "open" may predate a TP/SL close, check live
+                    if ready_state and symbol not in ready_state.open_symbols:
+                        open_cnt = len(ready_state.open_symbols)
+                        has_position_on_symbol = False
+                    else:
+                        # Get open positions on THIS exchange (async)
+                        await self.api_limiter.wait_and_proceed_async(f"pos_{user_id}")
+                        positions = await self._fetch_ccxt_positions(exchange, exchange_type)
+                        open_cnt = 0
+                        has_position_on_symbol = False
+                        
+                        for pos in positions:
+                            if pos.get('contracts') and float(pos['contracts']) != 0:
+                                open_cnt += 1
+                                if pos.get('symbol') == ccxt_symbol:
+                                    has_position_on_symbol = True
+                        if ready_state and not has_position_on_symbol:
+                            ready_state.open_symbols.discard(symbol)
                     
                     # Don't open if already have position on this symbol on THIS exchange
                     if has_position_on_symbol:
@@ -3267,8 +3377,8 @@ class TradingEngine:
                         return
                     
                     if not skip_position_check:
-                        global_open_count = client_data.get('global_open_count')
-                        base_open_count = global_open_count if global_open_count is not None else open_cnt
+                        user_open_count = global_open_count(client_data)
+                        base_open_count = user_open_count if user_open_count is not None else open_cnt
                         if base_open_count >= max_pos:
                             error_msg = f"({exchange_type.upper()}) Max positions reached ({base_open_count} open >= {max_pos})"
                             self.log_event(user_id, symbol, error_msg, is_error=True)
@@ -3300,43 +3410,48 @@ class TradingEngine:
                         if lev_int < 1:
                             lev_int = 1
                         
-                        # For OKX, set margin mode first (cross or isolated)
-                        if exchange_type == 'okx':
-                            try:
-                                await exchange.set_margin_mode('cross', ccxt_symbol)
-                                logger.info(f"[{node_name}] Set margin mode to cross for {ccxt_symbol}")
-                            except Exception as margin_err:
-                                # Margin mode might already be set or not needed
-                                logger.debug(f"[{node_name}] Margin mode note: {margin_err}")
-                        
-                        lev_used = await self._set_ccxt_leverage(exchange, exchange_type, ccxt_symbol, lev_int, action)
-                        if lev_used:
-                            logger.info(f"[{node_name}] Set leverage to {lev_used}x for {ccxt_symbol}")
+                        if ready_state and ready_state.leverage.get(symbol) == lev_int:
+                            logger.debug(f"[{node_name}] Leverage {lev_int}x already applied for {ccxt_symbol}")
+                        else:
+                            # For OKX, set margin mode first (cross or isolated)
+                            if exchange_type == 'okx':
+                                try:
+                                    await exchange.set_margin_mode('cross', ccxt_symbol)
+                                    logger.info(f"[{node_name}] Set margin mode to cross for {ccxt_symbol}")
+                                except Exception as margin_err:
+                                    # Margin mode might already be set or not needed
+                                    logger.debug(f"[{node_name}] Margin mode note: {margin_err}")
+                            
+                            lev_used = await self._set_ccxt_leverage(exchange, exchange_type, ccxt_symbol, lev_int, action)
+                            if lev_used:
+                                logger.info(f"[{node_name}] Set leverage to {lev_used}x for {ccxt_symbol}")
                     except Exception as lev_err:
                         logger.warning(f"[{node_name}] Could not set leverage: {lev_err}")
                     
                     # Get balance - handle different exchange response structures
-                    await self.api_limiter.wait_and_proceed_async(f"bal_{user_id}")
-                    balance = await exchange.fetch_balance()
                     available_balance = 0.0
-                    
-                    # Try multiple ways to get USDT balance (different exchanges structure this differently)
-                    for asset in ['USDT', 'USD']:
-                        # Method 1: Standard CCXT structure
-                        if asset in balance.get('free', {}):
-                            available_balance = float(balance['free'][asset] or 0)
-                            if available_balance > 0:
-                                break
-                        # Method 2: Direct asset access
-                        if asset in balance and isinstance(balance[asset], dict):
-                            available_balance = float(balance[asset].get('free', 0) or 0)
-                            if available_balance > 0:
-                                break
-                        # Method 3: Total balance fallback
-                        if asset in balance.get('total', {}):
-                            available_balance = float(balance['total'][asset] or 0)
-                            if available_balance > 0:
-                                break
+                    if ready_state:
+                        available_balance = ready_state.free_margin
+                    else:
+                        await self.api_limiter.wait_and_proceed_async(f"bal_{user_id}")
+                        balance = await exchange.fetch_balance()
+                        # Try multiple ways to get USDT balance (different exchanges structure this differently)
+                        for asset in ['USDT', 'USD']:
+                            # Method 1: Standard CCXT structure
+                            if asset in balance.get('free', {}):
+                                available_balance = float(balance['free'][asset] or 0)
+                                if available_balance > 0:
+                                    break
+                            # Method 2: Direct asset access
+                            if asset in balance and isinstance(balance[asset], dict):
+                                available_balance = float(balance[asset].get('free', 0) or 0)
+                                if available_balance > 0:
+                                    break
+                            # Method 3: Total balance fallback
+                            if asset in balance.get('total', {}):
+                                available_balance = float(balance['total'][asset] or 0)
+                                if available_balance > 0:
+                                    break
                     
                     logger.info(f"[{node_name}] ({exchange_type.upper()}) Available balance: ${available_balance:.2f}")
                     
@@ -3400,9 +3515,19 @@ class TradingEngine:
                         leverage = 1
                     
                     # Get price (async)
-                    await self.api_limiter.wait_and_proceed_async(f"tick_{user_id}")
-                    ticker = await exchange.fetch_ticker(ccxt_symbol)
-                    price = float(ticker['last'])
+                    async def _fetch_ccxt_price():
+                        await self.api_limiter.wait_and_proceed_async(f"tick_{user_id}")
+                        ticker = await exchange.fetch_ticker(ccxt_symbol)
+                        return float(ticker['last'])
+
+                    # Binance is keyed by its exchange id, other venues by the CCXT symbol
+                    if exchange_type.lower() == 'binance':
+                        price_key, price_venue = symbol, 'binance'
+                    else:
+                        price_key, price_venue = ccxt_symbol, exchange_type.lower()
+                    price = await self.price_cache.get_or_fetch_async(
+                        price_key, _fetch_ccxt_price, venue=price_venue
+                    )
                     
                     # notional = margin × leverage (position size includes leverage)
                     notional = margin * leverage
@@ -3488,37 +3613,39 @@ class TradingEngine:
                     logger.info(f"   💰 Position Size: ${notional:.2f} (margin ${margin:.2f} × {leverage}x leverage)")
                     logger.info(f"   📦 Quantity: {qty} @ ${price:.4f}")
                     
-                    # Execute order with retry on rate limit errors
-                    order = None
-                    max_retries = self.proxy_pool.max_retries
-                    for retry_attempt in range(max_retries + 1):
-                        try:
-                            await self.order_limiter.wait_and_proceed_async(f"order_{user_id}")
-                            order = await exchange.create_order(ccxt_symbol, 'market', side, qty)
-                            break  # Success, exit retry loop
-                        except Exception as order_err:
-                            if self.is_rate_limit_error(order_err):
-                                # Record rate limit hit metric
-                                record_rate_limit(exchange=exchange_type, endpoint='create_order')
-                                logger.warning(f"⚠️ [{node_name}] Rate limit on order, attempt {retry_attempt + 1}/{max_retries + 1}")
+                    # Execute order with retry on rate limit errors; the order counts against the
+                    # pre-armed record while it is being sent (back-to-back signals)
+                    with reservation(ready_state, symbol, margin):
+                        order = None
+                        max_retries = self.proxy_pool.max_retries
+                        for retry_attempt in range(max_retries + 1):
+                            try:
+                                await self.order_limiter.wait_and_proceed_async(f"order_{user_id}")
+                                order = await exchange.create_order(ccxt_symbol, 'market', side, qty)
+                                break  # Success, exit retry loop
+                            except Exception as order_err:
+                                if self.is_rate_limit_error(order_err):
+                                    # Record rate limit hit metric
+                                    record_rate_limit(exchange=exchange_type, endpoint='create_order')
+                                    logger.warning(f"⚠️ [{node_name}] Rate limit on order, attempt {retry_attempt + 1}/{max_retries + 1}")
                                 
-                                if retry_attempt < max_retries:
-                                    # Handle proxy rotation for rate limit
-                                    can_retry = await self.handle_rate_limit_error_async(user_id, client_data, order_err)
+                                    if retry_attempt < max_retries:
+                                        # Handle proxy rotation for rate limit
+                                        can_retry = await self.handle_rate_limit_error_async(user_id, client_data, order_err)
                                     
-                                    # Wait before retry (exponential backoff)
-                                    wait_time = 2 ** retry_attempt
-                                    logger.info(f"🔄 [{node_name}] Waiting {wait_time}s before retry...")
-                                    await asyncio.sleep(wait_time)
+                                        # Wait before retry (exponential backoff)
+                                        wait_time = 2 ** retry_attempt
+                                        logger.info(f"🔄 [{node_name}] Waiting {wait_time}s before retry...")
+                                        await asyncio.sleep(wait_time)
+                                    else:
+                                        # Max retries exhausted
+                                        raise order_err
                                 else:
-                                    # Max retries exhausted
+                                    # Not a rate limit error, raise immediately
                                     raise order_err
-                            else:
-                                # Not a rate limit error, raise immediately
-                                raise order_err
                     
-                    if not order:
-                        raise Exception("Order placement failed after retries")
+                        if not order:
+                            raise Exception("Order placement failed after retries")
                     
                     # Record successful trade metrics
                     trade_duration = time_module.perf_counter() - trade_start_time
@@ -3806,19 +3933,12 @@ class TradingEngine:
     
     def convert_symbol_to_ccxt(self, binance_symbol: str, exchange_type: str) -> str:
         """Convert Binance symbol format to CCXT format for perpetual futures"""
-        # Remove USDT suffix and create proper format
-        base = binance_symbol.replace('USDT', '').replace('PERP', '')
-        
-        # Different exchanges use different symbol formats
-        if exchange_type in ['okx']:
-            return f"{base}/USDT:USDT"  # OKX format
-        elif exchange_type in ['bybit']:
-            return f"{base}/USDT:USDT"  # Bybit uses same format
-        elif exchange_type in ['bitget', 'kucoin']:
-            return f"{base}/USDT:USDT"
-        else:
-            # Default CCXT perpetual format
-            return f"{base}/USDT:USDT"
+        ccxt_symbol = self.symbols.to_ccxt(binance_symbol, exchange_type)
+        if ccxt_symbol:
+            return ccxt_symbol
+        # Not listed on this exchange - keep the default perpetual form so the market check reports it
+        base, quote = split_canonical(binance_symbol)
+        return f"{base}/{quote}:{quote}"
 
     async def execute_trade_async(self, client_data: dict, signal: dict, master_entry_price: float, 
                                    master_balance: float, master_trade_amount: float):
@@ -3901,6 +4021,19 @@ class TradingEngine:
         
         logger.info(f"🔄 execute_trade_async called for {client_data.get('fullname', user_id)} ({exchange_name})")
         
+        try:
+            return await self._route_trade_async(client_data, signal, master_entry_price,
+                                                 master_balance, master_trade_amount)
+        finally:
+            # Margin and positions changed - re-arm this account before its next signal
+            if self.readiness and not str(user_id).startswith('master'):
+                self.readiness.invalidate(client_data)
+    
+    async def _route_trade_async(self, client_data: dict, signal: dict, master_entry_price: float,
+                                 master_balance: float, master_trade_amount: float):
+        """Route a trade to the async CCXT handler or the sync Binance handler"""
+        exchange_name = client_data.get('exchange_name', 'Unknown')
+        
         # Route to appropriate handler based on client type
         if client_data.get('is_ccxt') and client_data.get('is_async'):
             # Async CCXT exchanges (OKX, Bybit, etc.)
@@ -4078,18 +4211,26 @@ class TradingEngine:
                 
                 # For master accounts with global check already done, only check if we have position on THIS exchange
                 # For slave accounts, do full per-account position check
+                ready_state = client_data.get('readiness')
                 try:
-                    # Get current open positions on THIS exchange
-                    positions = client.futures_position_information()
-                    open_cnt = 0
-                    has_position_on_symbol = False
-                    
-                    for p in positions:
-                        amt = float(p['positionAmt'])
-                        if amt != 0:
-                            open_cnt += 1
-                            if p['symbol'] == symbol:
-                                has_position_on_symbol = True
+                    # Pre-armed "not open" is trusted; "open" may predate a TP/SL close, so check live
+                    if ready_state and symbol not in ready_state.open_symbols:
+                        open_cnt = len(ready_state.open_symbols)
+                        has_position_on_symbol = False
+                    else:
+                        # Get current open positions on THIS exchange
+                        positions = client.futures_position_information()
+                        open_cnt = 0
+                        has_position_on_symbol = False
+                        
+                        for p in positions:
+                            amt = float(p['positionAmt'])
+                            if amt != 0:
+                                open_cnt += 1
+                                if p['symbol'] == symbol:
+                                    has_position_on_symbol = True
+                        if ready_state and not has_position_on_symbol:
+                            ready_state.open_symbols.discard(symbol)
                     
                     # Don't open if already have position on this symbol on THIS exchange
                     if has_position_on_symbol:
@@ -4104,8 +4245,8 @@ class TradingEngine:
                         return
                     
                     if not skip_position_check:
-                        global_open_count = client_data.get('global_open_count')
-                        base_open_count = global_open_count if global_open_count is not None else open_cnt
+                        user_open_count = global_open_count(client_data)
+                        base_open_count = user_open_count if user_open_count is not None else open_cnt
                         logger.debug(f"[{user_id}] Position check for {symbol}: open={base_open_count}, max={max_pos}")
                         if base_open_count >= max_pos:
                             error_msg = f"Max positions reached ({base_open_count} open >= {max_pos})"
@@ -4146,21 +4287,24 @@ class TradingEngine:
                                 self.telegram.notify_user_error(chat_id, symbol, error_msg)
                         return
 
-                # Set leverage
-                try:
-                    self.api_limiter.wait_and_proceed(f"lev_{user_id}")
-                    client.futures_change_leverage(symbol=symbol, leverage=int(leverage))
-                except Exception:
-                    pass
+                # Set leverage (skipped when the pre-armed state shows it is already applied)
+                if not (ready_state and ready_state.leverage.get(symbol) == int(leverage)):
+                    try:
+                        self.api_limiter.wait_and_proceed(f"lev_{user_id}")
+                        client.futures_change_leverage(symbol=symbol, leverage=int(leverage))
+                    except Exception:
+                        pass
 
                 # Get balance
-                balances = client.futures_account_balance()
                 available_balance = 0.0
-                
-                for b in balances:
-                    if b['asset'] == 'USDT':
-                        available_balance = float(b.get('availableBalance', b.get('withdrawAvailable', b['balance'])))
-                        break
+                if ready_state:
+                    available_balance = ready_state.free_margin
+                else:
+                    balances = client.futures_account_balance()
+                    for b in balances:
+                        if b['asset'] == 'USDT':
+                            available_balance = float(b.get('availableBalance', b.get('withdrawAvailable', b['balance'])))
+                            break
                 
                 if available_balance <= 0:
                     error_msg = f"No funds available ({available_balance:.2f}$)"
@@ -4227,11 +4371,11 @@ class TradingEngine:
                 # Get precision and price
                 prec = self.get_precision(client, symbol)
                 
-                self.api_limiter.wait_and_proceed(f"price_{user_id}")
-                ticker = client.futures_symbol_ticker(symbol=symbol)
-                price = self._extract_binance_price(ticker)
+                price = self.price_cache.get_or_fetch(
+                    symbol, lambda: self._fetch_binance_price(client, symbol, f"price_{user_id}")
+                )
                 if not price:
-                    error_msg = f"Price unavailable for {symbol} (ticker={ticker})"
+                    error_msg = f"Price unavailable for {symbol}"
                     logger.error(f"❌ [{node_name}] {error_msg}")
                     self.log_event(user_id, symbol, error_msg, is_error=True)
                     if self.telegram:
@@ -4316,12 +4460,14 @@ class TradingEngine:
                     logger.info(f"   📦 Quantity: {qty_str} @ ${price:.4f}")
                     
                     self.order_limiter.wait_and_proceed(user_id)
-                    client.futures_create_order(
-                        symbol=symbol,
-                        side=side,
-                        type='MARKET',
-                        quantity=qty_str
-                    )
+                    # Count the order against the pre-armed record before it is sent (back-to-back signals)
+                    with reservation(ready_state, symbol, margin):
+                        client.futures_create_order(
+                            symbol=symbol,
+                            side=side,
+                            type='MARKET',
+                            quantity=qty_str
+                        )
                     
                     # Order placed successfully
                     logger.info(f"✅ {action.upper()} {symbol} for {node_name} - ${notional:.2f} position")
@@ -4603,7 +4749,7 @@ class TradingEngine:
                     for pos in positions:
                         if pos.get('contracts') and float(pos['contracts']) != 0:
                             # Convert CCXT symbol back to standard format
-                            symbol = pos.get('symbol', '').replace('/USDT:USDT', 'USDT').replace('/', '')
+                            symbol = self.symbols.from_ccxt(master_data.get('exchange_type'), pos.get('symbol', ''))
                             if symbol:
                                 all_symbols.add(symbol)
                 else:
@@ -4705,13 +4851,18 @@ class TradingEngine:
             
         # Clean symbol
         raw_symbol = signal['symbol']
-        clean_symbol = re.sub(r'\.P|\.p|\.S|\.s$', '', raw_symbol).upper()
+        clean_symbol = self.symbols.canonical(raw_symbol)
         signal['symbol'] = clean_symbol
         action = signal['action']
 
         # Record signal received metric
         record_signal(symbol=clean_symbol, action=action)
         
+        # Reject symbols the Binance master does not list before any account work
+        if self.symbols.is_listed(clean_symbol) is False:
+            logger.warning(f"⚠️ {clean_symbol} is not a valid Binance Futures symbol - signal ignored")
+            return
+        
         logger.info(f"📥 Processing signal (async): {action.upper()} {clean_symbol}")
         
         # === DCA (Dollar Cost Averaging) ACTION HANDLING ===
@@ -4737,13 +4888,23 @@ class TradingEngine:
         open_symbols = set()
         remaining_master_slots = None
         
+        # In sharded mode only the shard owning the master key queries (and trades) the masters;
+        # the other shards read the master view from the shared master_state snapshot
+        owns_masters = self.owns_masters()
+        master_snapshot = None if owns_masters else self.master_state.get_snapshot()
+        
         # === GLOBAL POSITION CHECK FOR MASTER EXCHANGES ===
         if self.master_clients and action != 'close':
             async with self._async_master_lock:
                 # Check pending trades first (prevents race conditions)
                 async with self._async_pending_lock:
                     # Check current positions (open only; no pending reservations)
-                    global_pos_count, open_symbols = await self.get_global_master_position_count_async()
+                    if owns_masters:
+                        global_pos_count, open_symbols = await self.get_global_master_position_count_async()
+                    else:
+                        open_symbols = {p['symbol'] for p in (master_snapshot or {}).get('positions', [])
+                                        if p.get('symbol')}
+                        global_pos_count = len(open_symbols)
                     total_count = len(open_symbols)
 
                     logger.info(f"🔧 Master: max_positions={max_pos_master}, current_global={global_pos_count}, open_symbols={open_symbols}, total={total_count}")
@@ -4769,23 +4930,32 @@ class TradingEngine:
         
         if self.master_client:
             try:
-                self.api_limiter.wait_and_proceed("master_info")
-                ticker = self.master_client.futures_symbol_ticker(symbol=clean_symbol)
-                price_val = self._extract_binance_price(ticker)
-                if not price_val:
-                    error_str = str(ticker).lower()
-                    if 'invalid symbol' in error_str or '-1121' in error_str:
-                        symbol_is_invalid = True
-                        logger.warning(f"⚠️ {clean_symbol} is not a valid Binance Futures symbol")
-                        return  # Don't process invalid symbols
-                    raise ValueError(f"Missing price in ticker: {ticker}")
-                master_entry_price = price_val
+                # A cached mark price also proves the symbol is listed
+                price_val = self.price_cache.get(clean_symbol)
+                if not price_val and owns_masters:
+                    self.api_limiter.wait_and_proceed("master_info")
+                    ticker = self.master_client.futures_symbol_ticker(symbol=clean_symbol)
+                    price_val = self._extract_binance_price(ticker)
+                    if not price_val:
+                        error_str = str(ticker).lower()
+                        if 'invalid symbol' in error_str or '-1121' in error_str:
+                            symbol_is_invalid = True
+                            logger.warning(f"⚠️ {clean_symbol} is not a valid Binance Futures symbol")
+                            return  # Don't process invalid symbols
+                        raise ValueError(f"Missing price in ticker: {ticker}")
+                    self.price_cache.update(clean_symbol, price_val, source='rest')
+                    self.price_cache.track(clean_symbol)
+                master_entry_price = price_val or 0.0
                 
-                balances = self.master_client.futures_account_balance()
-                for b in balances:
-                    if b['asset'] == 'USDT':
-                        master_balance = float(b.get('availableBalance', b['balance']))
-                        break
+                if owns_masters:
+                    balances = self.master_client.futures_account_balance()
+                    for b in balances:
+                        if b['asset'] == 'USDT':
+                            master_balance = float(b.get('availableBalance', b['balance']))
+                            break
+                elif master_snapshot:
+                    # Slaves only use the ratio master_trade_cost / master_balance (= risk %)
+                    master_balance = float(master_snapshot.get('total_balance') or 0.0)
                         
                 master_trade_cost = master_balance * (global_risk / 100.0)
                 
@@ -4804,7 +4974,9 @@ class TradingEngine:
         logger.info(f"🔧 Master max_positions setting: {max_pos_master}")
         
         # === MASTER EXCHANGES (LIMITED BY REMAINING SLOTS) ===
-        if self.master_clients:
+        if not owns_masters:
+            logger.info(f"🧩 Masters owned by another shard - {clean_symbol} executes for this shard's slaves only")
+        elif self.master_clients:
             # Execute on all master exchanges; max_positions limits symbols, not exchanges.
             master_clients_to_use = list(self.master_clients)
             logger.info(f"📊 Preparing {clean_symbol} for {len(master_clients_to_use)} MASTER exchanges")
@@ -4882,11 +5054,36 @@ class TradingEngine:
             else:
                 logger.info(f"📊 No strategy specified - preparing all {len(slaves)} slave accounts")
         
-        # Pre-compute global open positions per user (across all exchanges)
+        # Drop accounts whose exchange does not list the symbol
+        if slaves:
+            # One pass, one listing lookup per exchange (accounts vastly outnumber exchanges)
+            listed_on = {}
+            listed, unlisted = [], []
+            for s in slaves:
+                exchange_type = s.get('exchange_type')
+                if exchange_type not in listed_on:
+                    listed_on[exchange_type] = self.symbols.is_listed(clean_symbol, exchange_type) is not False
+                (listed if listed_on[exchange_type] else unlisted).append(s)
+            if unlisted:
+                slaves = listed
+                exchanges = sorted({s.get('exchange_type') for s in unlisted})
+                logger.info(f"🔤 {clean_symbol} not listed on {exchanges} - skipped {len(unlisted)} accounts")
+        
+        # Drop accounts known not to be tradeable (auth failure, no margin) before fan-out
+        if slaves and action != 'close' and self.readiness:
+            slaves, excluded = self.readiness.partition(slaves)
+            if excluded:
+                reasons = {}
+                for _, reason in excluded:
+                    reasons[reason] = reasons.get(reason, 0) + 1
+                logger.info(f"🎯 Excluded {len(excluded)} not-ready accounts before fan-out: {reasons}")
+        
+        # Pre-compute global open positions per user (across all exchanges) - pre-armed users already have it
         if slaves and action != 'close':
             user_groups = {}
             for slave in slaves:
-                user_groups.setdefault(slave['id'], []).append(slave)
+                if slave.get('global_open_count') is None:
+                    user_groups.setdefault(slave['id'], []).append(slave)
             tasks = {
                 user_id: asyncio.create_task(self._get_user_global_open_count_async(user_clients))
                 for user_id, user_clients in user_groups.items()
@@ -4904,6 +5101,10 @@ class TradingEngine:
             all_users.extend(slaves)
         
         # CRITICAL: Log if no users to process
+        if not all_users and self.shard_membership:
+            # Normal for a shard that owns no subscribed accounts for this signal
+            logger.info(f"🧩 Shard {self.shard_membership.shard_id}: no accounts to process for {action.upper()} {clean_symbol}")
+            return {'accounts': 0, 'errors': 0}
         if not all_users:
             error_msg = f"❌ NO USERS TO PROCESS: Signal {action.upper()} {clean_symbol} ignored - no master or slave accounts configured/active"
             logger.error(error_msg)
@@ -4918,7 +5119,7 @@ class TradingEngine:
         logger.info(f"✅ Processing signal for {len(all_users)} users ({len(self.master_clients) if self.master_clients else 0} master, {len(slaves)} slaves)")
         
         # Execute all trades concurrently using asyncio.gather
-        await self.process_signal_batch(
+        results = await self.process_signal_batch(
             all_users, signal, master_entry_price, master_balance, master_trade_cost
         )
         
@@ -4930,6 +5131,11 @@ class TradingEngine:
         slave_count = len(self.slave_clients)
         update_active_users(exchange='all', user_type='master', count=master_count)
         update_active_users(exchange='all', user_type='slave', count=slave_count)
+        
+        return {
+            'accounts': len(all_users),
+            'errors': sum(1 for r in results or [] if isinstance(r, Exception)),
+        }
 
     def process_signal(self, signal: dict):
         """Process incoming trading signal - SYNC WRAPPER"""
@@ -4999,7 +5205,7 @@ class TradingEngine:
                     positions = await self._fetch_ccxt_positions(exchange, master_data.get('exchange_name', 'Unknown'))
                     for pos in positions:
                         if pos.get('contracts') and float(pos['contracts']) != 0:
-                            symbol = pos.get('symbol', '').replace('/USDT:USDT', 'USDT').replace('/', '')
+                            symbol = self.symbols.from_ccxt(master_data.get('exchange_type'), pos.get('symbol', ''))
                             if symbol:
                                 symbols.add(symbol)
                 elif not master_data.get('is_ccxt'):
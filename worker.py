@@ -25,6 +25,7 @@ import asyncio
 import logging
 import os
 import sys
+import time
 from datetime import timedelta, datetime, timezone
 
 from arq import create_pool, cron
@@ -33,7 +34,7 @@ from arq.connections import RedisSettings
 # Import metrics for Prometheus
 from metrics import (
     start_metrics_server, record_worker_task, set_worker_queue_size,
-    WORKER_TASKS_PROCESSED, set_app_info
+    WORKER_TASKS_PROCESSED, set_app_info, record_queue_wait
 )
 
 # ============================================================================
@@ -104,6 +105,12 @@ logger = setup_json_logging()
 # Get Redis URL from environment or default
 REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 
+# Shard identity (WORKER_SHARD_ID); unset = single unsharded worker on arq:queue
+from sharding import SHARD_ID, shard_queue_name
+from account_readiness import AccountReadinessService
+from event_bus import get_event_bus
+import fast_json
+
 
 def parse_redis_url(url: str) -> RedisSettings:
     """Parse Redis URL into RedisSettings with Windows-compatible settings"""
@@ -170,6 +177,19 @@ async def startup(ctx: dict):
     # Ensure tables exist within a scoped app context
     with app.app_context():
         db.create_all()
+        from models import DailyTradeRollup
+        # Explicit marker: trades recorded incrementally before the backfill ran
+        # would otherwise make a partial table look backfilled
+        needs_rollup_backfill = not DailyTradeRollup.is_backfilled()
+    
+    # Backfill the daily trade rollup once (fixed job id: other workers starting now share it)
+    if needs_rollup_backfill:
+        try:
+            await ctx['redis'].enqueue_job('rebuild_trade_rollup_task', _job_id='trade_rollup_backfill',
+                                           _queue_name=WorkerSettings.queue_name)
+            logger.info("📊 Daily trade rollup not backfilled yet - backfill job queued")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not queue trade rollup backfill: {e}")
     
     # Initialize Telegram notifier
     telegram = None
@@ -215,15 +235,36 @@ async def startup(ctx: dict):
     ctx['telegram_bot'] = None
     logger.info("ℹ️ Telegram Bot runs as separate service (see mimic-bot.service)")
     
-    # Initialize Trading Engine (no socketio needed in worker)
-    engine = TradingEngine(app, socketio_instance=None, telegram_notifier=telegram)
+    # Initialize Trading Engine - dashboard events are published through the
+    # Socket.IO Redis message queue and delivered by the web workers
+    engine = TradingEngine(app, socketio_instance=get_event_bus(REDIS_URL), telegram_notifier=telegram)
     
     # Initialize master exchange client(s)
     engine.init_master()
     
+    # Join the shard ring before loading slaves so only owned accounts are connected
+    if SHARD_ID:
+        try:
+            await _init_shard_membership(ctx, engine)
+        except Exception as e:
+            logger.error(f"❌ Could not join shard ring as {SHARD_ID}: {e} - running unsharded")
+    
     # Load slave clients from database
     engine.load_slaves()
     
+    # Start the shared mark price stream (one multiplexed websocket for all symbols)
+    try:
+        await engine.price_cache.start()
+    except Exception as e:
+        logger.warning(f"⚠️ Mark price stream not started, using REST prices: {e}")
+    
+    # Pre-arm slave accounts (margin, open symbols, leverage) between signals
+    engine.readiness = AccountReadinessService(engine)
+    await engine.readiness.start()
+    
+    # Slave balance/position refresh, on this loop because it shares the async CCXT clients
+    await engine.balance_monitor.start()
+    
     # Load global settings - prefer Redis (source of truth), then app module, then defaults
     settings_loaded = False
     try:
@@ -311,6 +352,74 @@ async def startup(ctx: dict):
         )
 
 
+async def _init_shard_membership(ctx: dict, engine):
+    """Register this worker as a shard and reload owned accounts whenever the ring changes."""
+    import redis.asyncio as aioredis
+    from sharding import ShardMembership
+    
+    settings = parse_redis_url(REDIS_URL)
+    shard_redis = aioredis.Redis(
+        host=settings.host,
+        port=settings.port,
+        db=settings.database,
+        password=settings.password,
+        socket_timeout=10,
+    )
+    
+    retiring = set()
+    
+    async def close_retired(clients):
+        # Jobs started before the rebalance may still be trading on these; ARQ ends them within job_timeout
+        await asyncio.sleep(WorkerSettings.job_timeout.total_seconds())
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.debug(f"Error closing rebalanced client: {e}")
+    
+    async def on_rebalance(ring):
+        previous = list(engine.slave_clients)
+        await asyncio.to_thread(engine.load_slaves)
+        # Async clients no longer in the slave list (account moved to another shard, or replaced
+        # by the reload) are closed once in-flight jobs have drained, not under them
+        current = {id(slave_data['client']) for slave_data in engine.slave_clients}
+        retired = [slave_data['client'] for slave_data in previous
+                   if slave_data.get('is_async') and slave_data.get('is_ccxt')
+                   and id(slave_data['client']) not in current]
+        if retired:
+            task = asyncio.create_task(close_retired(retired))
+            retiring.add(task)
+            task.add_done_callback(retiring.discard)
+        if engine.readiness:
+            # Re-arm in the background so the shard heartbeat is not delayed
+            asyncio.create_task(engine.readiness.refresh_all())
+        logger.info(f"🧩 Rebalanced shard {SHARD_ID}: {len(engine.slave_clients)} slave accounts (ring: {ring.shards})")
+    
+    membership = ShardMembership(shard_redis, SHARD_ID, on_rebalance=on_rebalance)
+    await membership.join()
+    engine.set_shard_membership(membership)
+    await membership.start()
+    ctx['shard'] = membership
+    ctx['shard_redis'] = shard_redis
+
+
+async def job_start(ctx: dict):
+    """Record queue wait per priority lane (lane is recovered from the job's score offset)."""
+    try:
+        from signal_dispatch import lane_from_score, LANE_BACKGROUND
+        enqueue_time = ctx.get('enqueue_time')
+        score = ctx.get('score')
+        if enqueue_time is None or score is None:
+            return
+        enqueue_ms = enqueue_time.timestamp() * 1000
+        lane = lane_from_score(enqueue_ms, score)
+        # Lane jobs are runnable on enqueue; deferred/cron jobs only from their score
+        ready_ms = score if lane == LANE_BACKGROUND else enqueue_ms
+        record_queue_wait(lane, time.time() - ready_ms / 1000)
+    except Exception as e:
+        logger.debug(f"Queue wait metric failed: {e}")
+
+
 async def shutdown(ctx: dict):
     """
     Cleanup resources when the worker shuts down.
@@ -323,6 +432,30 @@ async def shutdown(ctx: dict):
     db = ctx.get('db')
     redis_client = ctx.get('redis_client')
     
+    # Leave the shard ring so remaining shards pick up our accounts immediately
+    shard = ctx.get('shard')
+    if shard:
+        try:
+            await shard.stop()
+            await ctx['shard_redis'].aclose()
+        except Exception as e:
+            logger.warning(f"⚠️ Error leaving shard ring: {e}")
+    
+    # Stop the mark price stream and account pre-arming
+    if engine:
+        try:
+            if engine.readiness:
+                await engine.readiness.stop()
+            await engine.balance_monitor.stop()
+            await engine.price_cache.stop()
+        except Exception as e:
+            logger.warning(f"⚠️ Error stopping mark price stream: {e}")
+        try:
+            # Publish any buffered dashboard events
+            await asyncio.to_thread(engine.socketio.stop)
+        except Exception as e:
+            logger.warning(f"⚠️ Error flushing dashboard events: {e}")
+    
     # Stop trailing SL monitor
     if engine:
         try:
@@ -403,6 +536,10 @@ from tasks import (
     calculate_user_xp_task,
     check_achievements_task,
     get_gamification_status_task,
+    # Stats rollup tasks
+    rebuild_trade_rollup_task,
+    reconcile_trade_rollup_task,
+    compact_balance_history_task,
     # Legacy/placeholder tasks to avoid missing-function cron errors
     update_tournament_status_task,
     calculate_tournament_roi_task,
@@ -434,6 +571,10 @@ class WorkerSettings:
         calculate_user_xp_task,
         check_achievements_task,
         get_gamification_status_task,
+        # Stats rollup tasks
+        rebuild_trade_rollup_task,
+        reconcile_trade_rollup_task,
+        compact_balance_history_task,
         # Legacy/placeholder tasks
         update_tournament_status_task,
         calculate_tournament_roi_task,
@@ -445,26 +586,39 @@ class WorkerSettings:
     cron_jobs = [
         # Check subscription expiry daily at 9:00 AM UTC
         cron(check_subscription_expiry_task, hour=9, minute=0),
-        # Check DCA opportunities every 5 minutes
-        cron(execute_dca_check_task, minute={0, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55}),
+        # Check DCA opportunities every 5 minutes. Cron job ids are global, so a sharded
+        # worker runs it under its own name - each shard checks the accounts it owns
+        cron(execute_dca_check_task, name=f'cron:execute_dca_check_task:{SHARD_ID}' if SHARD_ID else None,
+             minute={0, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55}),
         # Reset daily balances at 00:00 UTC (midnight) - Risk Guardrails
         cron(reset_daily_balances_task, hour=0, minute=0),
         # Calculate user XP daily at 01:00 UTC (Gamification)
         cron(calculate_user_xp_task, hour=1, minute=0),
+        # Reconcile the daily trade rollup at 00:15 UTC (before XP at 01:00)
+        cron(reconcile_trade_rollup_task, hour=0, minute=15),
+        # Fold old balance snapshots into hourly/daily rollups at 00:30 UTC
+        cron(compact_balance_history_task, hour=0, minute=30),
     ]
     
     # Lifecycle hooks
     on_startup = startup
     on_shutdown = shutdown
+    on_job_start = job_start
     
     # Redis connection settings
     redis_settings = parse_redis_url(REDIS_URL)
     
+    # Jobs are JSON (orjson when installed) - must match signal_dispatch.enqueue_arq_job
+    job_serializer = staticmethod(fast_json.dumps_job)
+    job_deserializer = staticmethod(fast_json.loads_job)
+    
     # Queue name (matches what webhook pushes to)
-    queue_name = 'arq:queue'
+    # Sharded workers consume their own queue; the webhook enqueues one job per live shard
+    queue_name = shard_queue_name(SHARD_ID) if SHARD_ID else 'arq:queue'
     
     # Worker settings
-    max_jobs = 10  # Max concurrent jobs
+    # Jobs are popped by priority lane (close > open > dca > background, see signal_dispatch.py)
+    max_jobs = int(os.environ.get('ARQ_MAX_JOBS', '10'))  # Max concurrent jobs
     job_timeout = timedelta(minutes=5)  # Max time per job
     max_tries = 3  # Retry failed jobs up to 3 times
     retry_jobs = True  # Enable job retries
@@ -504,13 +658,14 @@ if __name__ == '__main__':
     +===================================================================+
     |                                                                   |
     |   [*] Redis:      {redis_url}
-    |   [*] Queue:      arq:queue                                       |
+    |   [*] Queue:      {queue_name}
     |   [*] Max Jobs:   10 concurrent                                   |
     |                                                                   |
     |   [OK] Status:    Starting worker...                              |
     |                                                                   |
     +===================================================================+
-    """.format(redis_url=REDIS_URL[:50] + '...' if len(REDIS_URL) > 50 else REDIS_URL))
+    """.format(redis_url=REDIS_URL[:50] + '...' if len(REDIS_URL) > 50 else REDIS_URL,
+               queue_name=WorkerSettings.queue_name))
     
     # Python 3.10+ compatible way to run the worker
     async def test_redis_async():
@@ -555,6 +710,7 @@ if __name__ == '__main__':
             'functions': WorkerSettings.functions,
             'on_startup': WorkerSettings.on_startup,
             'on_shutdown': WorkerSettings.on_shutdown,
+            'on_job_start': WorkerSettings.on_job_start,
             'redis_settings': WorkerSettings.redis_settings,
             'queue_name': WorkerSettings.queue_name,
             'max_jobs': WorkerSettings.max_jobs,